@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from utils import imaging
+
+
+parser = argparse.ArgumentParser(
+    description="Measure event loop lag while a burst of images is hashed, on the event loop and in the image hash pool, and compare full and reduced-resolution decoding. Run from the repository root; results are printed as JSON."
+)
+parser.add_argument(
+    "--images",
+    dest="images",
+    type=int,
+    default=50,
+    required=False,
+    help="Images hashed in one burst.",
+)
+parser.add_argument(
+    "--size",
+    dest="size",
+    type=int,
+    default=2048,
+    required=False,
+    help="Width of the generated images in pixels. Height is three quarters of it.",
+)
+parser.add_argument(
+    "--processes",
+    dest="processes",
+    action="extend",
+    nargs="+",
+    type=int,
+    required=False,
+    help="Pool sizes to benchmark; 0 hashes on the event loop (default: 0 and hashProcesses).",
+)
+parser.add_argument(
+    "--tick",
+    dest="tick_milliseconds",
+    type=float,
+    default=5,
+    required=False,
+    help="How often the lag probe wakes up, in milliseconds.",
+)
+parser.add_argument(
+    "--photos",
+    dest="photos",
+    type=int,
+    default=60,
+    required=False,
+    help="Phone-camera sized JPEGs used to compare full and reduced-resolution decoding.",
+)
+parser.add_argument(
+    "--output",
+    dest="output",
+    type=str,
+    default=None,
+    required=False,
+    help="Write results to this file instead of stdout.",
+)
+
+
+def generate_images(count: int, size: int) -> list[bytes]:
+    rng = random.Random(0)
+    images = []
+
+    for index in range(count):
+        image = Image.effect_noise((size, size * 3 // 4), rng.uniform(32, 96)).convert(
+            "RGB"
+        )
+        output = io.BytesIO()
+
+        if index % 2:
+            image.save(output, "PNG", compress_level=1)
+        else:
+            image.save(output, "JPEG", quality=90)
+
+        images.append(output.getvalue())
+
+    return images
+
+
+def generate_photos(count: int) -> list[bytes]:
+    rng = random.Random(0)
+    photos = []
+
+    for _ in range(count):
+        width, height = rng.choice([(4032, 3024), (3024, 4032), (1920, 1080)])
+        image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+        draw = ImageDraw.Draw(image)
+
+        for _ in range(30):
+            x, y = rng.randrange(width), rng.randrange(height)
+            radius = rng.randrange(100, 900)
+            draw.ellipse(
+                (x, y, x + radius, y + radius),
+                fill=tuple(rng.randrange(256) for _ in range(3)),
+            )
+
+        image = image.filter(ImageFilter.GaussianBlur(rng.choice([0, 1, 4])))
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=88)
+        photos.append(output.getvalue())
+
+    return photos
+
+
+def decode_accuracy(photos: list[bytes]) -> dict:
+    distances = []
+    full_seconds = 0.0
+    draft_seconds = 0.0
+
+    for photo in photos:
+        start = time.process_time()
+        full_hash = imaging.image_hash_from_bytes(photo, 0)
+        full_seconds += time.process_time() - start
+
+        start = time.process_time()
+        draft_hash = imaging.image_hash_from_bytes(photo)
+        draft_seconds += time.process_time() - start
+
+        distances.append(
+            imaging.image_hash_distance(
+                imaging.image_hash_bits(full_hash), imaging.image_hash_bits(draft_hash)
+            )
+        )
+
+    return {
+        "photos": len(photos),
+        "draft_size": imaging.IMAGE_DRAFT_SIZE,
+        "full_cpu_ms": full_seconds / len(photos) * 1000,
+        "draft_cpu_ms": draft_seconds / len(photos) * 1000,
+        "identical": sum(distance == 0 for distance in distances),
+        "max_distance": max(distances),
+        "within_tolerance": sum(
+            distance <= imaging.IMAGE_HASH_TOLERANCE for distance in distances
+        ),
+        "tolerance": imaging.IMAGE_HASH_TOLERANCE,
+    }
+
+
+async def probe_lag(tick: float, lags: list[float], stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(tick)
+        lags.append(max(0.0, time.perf_counter() - start - tick))
+
+
+async def burst(images: list[bytes], processes: int, tick: float) -> dict:
+    pool = imaging.ImageHashPool(processes)
+    pool.start()
+
+    try:
+        # Spawn the workers before timing so the burst does not pay for it
+        await asyncio.gather(*(pool.image_hash(image) for image in images[:processes]))
+
+        lags = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(probe_lag(tick, lags, stop))
+        await asyncio.sleep(tick * 2)
+
+        start = time.perf_counter()
+        hashes = await asyncio.gather(*(pool.image_hash(image) for image in images))
+        seconds = time.perf_counter() - start
+
+        stop.set()
+        await probe
+    finally:
+        pool.close()
+
+    lags.sort()
+
+    return {
+        "processes": processes,
+        "seconds": seconds,
+        "hashed": sum(image_hash is not None for image_hash in hashes),
+        "lag_max_ms": lags[-1] * 1000 if lags else None,
+        "lag_p99_ms": lags[int(len(lags) * 0.99)] * 1000 if lags else None,
+        "lag_mean_ms": statistics.mean(lags) * 1000 if lags else None,
+        "probe_ticks": len(lags),
+        "hashes": hashes,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main(images, size, processes, tick_milliseconds, photos, output):
+    generated = generate_images(images, size)
+    runs = [
+        asyncio.run(burst(generated, pool_size, tick_milliseconds / 1000))
+        for pool_size in processes or [0, imaging.HASH_PROCESSES or os.cpu_count()]
+    ]
+
+    for run in runs[1:]:
+        run["hashes_match"] = run.pop("hashes") == runs[0]["hashes"]
+
+    runs[0].pop("hashes")
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "images": images,
+        "image_bytes": sum(len(image) for image in generated),
+        "size": [size, size * 3 // 4],
+        "runs": runs,
+        "decode": decode_accuracy(generate_photos(photos)) if photos else None,
+    }
+
+    if output:
+        with open(output, "w") as w:
+            json.dump(report, w, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    main(**vars(args))
@@ -0,0 +1,355 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from utils import migration, storage
+
+
+parser = argparse.ArgumentParser(
+    description="Storage benchmark suite. Run from the repository root; results are printed as JSON."
+)
+parser.add_argument(
+    "--guilds",
+    dest="guild_counts",
+    action="extend",
+    nargs="+",
+    type=int,
+    required=False,
+    help="Guild counts to benchmark (default: 1000).",
+)
+parser.add_argument(
+    "--backends",
+    dest="backends",
+    action="extend",
+    nargs="+",
+    type=str,
+    required=False,
+    help="Storage backends to benchmark (default: the configured backend).",
+)
+parser.add_argument(
+    "--formats",
+    dest="formats",
+    action="extend",
+    nargs="+",
+    type=str,
+    required=False,
+    help="Storage formats to benchmark (default: the configured format).",
+)
+parser.add_argument(
+    "--concurrency",
+    dest="concurrency",
+    type=int,
+    default=50,
+    required=False,
+    help="Number of coroutines editing at once.",
+)
+parser.add_argument(
+    "--edits",
+    dest="edits",
+    type=int,
+    default=1000,
+    required=False,
+    help="Total edits per throughput measurement.",
+)
+parser.add_argument(
+    "--reads",
+    dest="reads",
+    type=int,
+    default=5000,
+    required=False,
+    help="Reads per latency measurement.",
+)
+parser.add_argument(
+    "--cache-entries",
+    dest="cache_entries",
+    type=int,
+    default=100,
+    required=False,
+    help="url_to_link_hash_cache entries per guild.",
+)
+parser.add_argument(
+    "--output",
+    dest="output",
+    type=str,
+    default=None,
+    required=False,
+    help="Write results to this file instead of stdout.",
+)
+
+
+def link_hash_entry(rng: random.Random, index: int) -> tuple[str, dict]:
+    url = f"https://cdn.discordapp.com/attachments/{rng.getrandbits(60)}/{rng.getrandbits(60)}/image_{index}.png"
+
+    return url, {
+        "link": url,
+        "md5": hashlib.md5(url.encode()).hexdigest(),
+        "image_hash": f"{rng.getrandbits(64):016x}",
+        "media_type": "image",
+    }
+
+
+def guild_documents(rng: random.Random, cache_entries: int) -> dict:
+    channel_ids = [rng.getrandbits(60) for _ in range(5)]
+
+    return {
+        ("cogs.reflect", "settings"): {
+            "enabled": True,
+            "ignored_channel_ids": channel_ids[:2],
+            "ignored_role_ids": [rng.getrandbits(60)],
+            "ignored_member_ids": [],
+            "reflect_channel_id": channel_ids[2],
+        },
+        ("cogs.alerts", "settings"): {
+            "enabled": True,
+            "ignored_channel_ids": [],
+            "trusted_role_ids": [rng.getrandbits(60)],
+            "trusted_member_ids": [],
+            "alerts_channel_id": channel_ids[3],
+            "mod_role_id": rng.getrandbits(60),
+            "alert_emoji_str": "⚠️",
+            "alert_threshold": 3,
+        },
+        ("global", "hash_blacklist"): {
+            "blacklist": [f"{rng.getrandbits(128):032x}" for _ in range(20)]
+        },
+        ("global", "url_to_link_hash_cache"): {
+            "cache": dict(link_hash_entry(rng, i) for i in range(cache_entries))
+        },
+        ("cogs.timers", "timers"): {
+            f"timer_{i}": {
+                "interval": 3600,
+                "message": "Remember to read the rules!",
+                "last_run": time.time(),
+                "enabled": True,
+                "channel_id": channel_ids[4],
+                "last_message_id": rng.getrandbits(60),
+            }
+            for i in range(2)
+        },
+        ("cogs.moderation", "link_filters"): {
+            str(channel_ids[0]): {
+                "enabled": True,
+                "linklist": ["https://discord.com", "https://github.com"],
+                "mode": "whitelist",
+            }
+        },
+    }
+
+
+def populate(data_path: str, guild_count: int, cache_entries: int):
+    rng = random.Random(guild_count)
+
+    for guild_id in range(1, guild_count + 1):
+        for (scope, key), data in guild_documents(rng, cache_entries).items():
+            base_path = f"{data_path}/{scope}/{guild_id}"
+
+            os.makedirs(base_path, exist_ok=True)
+
+            with open(f"{base_path}/{key}.json", "w") as w:
+                json.dump(data, w, indent=4)
+
+    with open(f"{data_path}/version.json", "w") as w:
+        json.dump({"version": 1}, w, indent=4)
+
+
+def use_format(format_name: str):
+    storage.STORAGE_FORMAT = format_name
+    storage.encode_storage = storage.STORAGE_ENCODERS[format_name]
+
+
+def percentiles(samples: list[float]) -> dict:
+    samples = sorted(samples)
+
+    return {
+        "mean_us": sum(samples) / len(samples) * 1e6,
+        "p50_us": samples[len(samples) // 2] * 1e6,
+        "p95_us": samples[int(len(samples) * 0.95)] * 1e6,
+        "p99_us": samples[int(len(samples) * 0.99)] * 1e6,
+        "max_us": samples[-1] * 1e6,
+    }
+
+
+def read_latency(keys: list[tuple], reads: int, cold: bool) -> dict:
+    samples = []
+
+    for i in range(reads):
+        scope, guild_id, key = keys[i % len(keys)]
+
+        if cold:
+            storage.storage_cache.invalidate(guild_id)
+
+        start = time.perf_counter()
+        storage.safe_read(scope, guild_id, key)
+        samples.append(time.perf_counter() - start)
+
+    return percentiles(samples)
+
+
+async def async_read_latency(keys: list[tuple], reads: int) -> dict:
+    samples = []
+
+    for i in range(reads):
+        scope, guild_id, key = keys[i % len(keys)]
+
+        start = time.perf_counter()
+        await storage.read(scope, guild_id, key)
+        samples.append(time.perf_counter() - start)
+
+    return percentiles(samples)
+
+
+async def edit_throughput(keys: list[tuple], edits: int, concurrency: int) -> dict:
+    queue = asyncio.Queue()
+
+    for i in range(edits):
+        queue.put_nowait(keys[i % len(keys)])
+
+    async def worker():
+        while not queue.empty():
+            scope, guild_id, key = queue.get_nowait()
+
+            async with storage.safe_edit(scope, guild_id, key) as data:
+                data["counter"] = data.get("counter", 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "edits": edits,
+        "seconds": elapsed,
+        "edits_per_second": edits / elapsed,
+        "lock_wait_seconds": storage.storage_locks.wait_seconds,
+    }
+
+
+def run(
+    backend_name: str,
+    format_name: str,
+    guild_count: int,
+    concurrency: int,
+    edits: int,
+    reads: int,
+    cache_entries: int,
+) -> dict:
+    data_path = tempfile.mkdtemp(prefix="mammoth_bench_")
+
+    try:
+        storage.DATA_PATH = data_path
+        use_format(format_name)
+
+        start = time.perf_counter()
+        populate(data_path, guild_count, cache_entries)
+        populate_seconds = time.perf_counter() - start
+
+        storage.use_storage_backend(backend_name)
+
+        start = time.perf_counter()
+        migration.migrate_storage()
+        migration_seconds = time.perf_counter() - start
+
+        settings_keys = [
+            (scope, guild_id, key)
+            for guild_id in range(1, guild_count + 1)
+            for scope, key in (
+                ("cogs.reflect", "settings"),
+                ("cogs.moderation", "link_filters"),
+                ("global", "hash_blacklist"),
+            )
+        ]
+        cache_keys = [
+            ("global", guild_id, "url_to_link_hash_cache")
+            for guild_id in range(1, guild_count + 1)
+        ]
+        timer_keys = [
+            ("cogs.timers", guild_id, "timers")
+            for guild_id in range(1, guild_count + 1)
+        ]
+
+        storage.storage_cache.clear()
+
+        results = {
+            "backend": backend_name,
+            "format": format_name,
+            "durability": storage.storage_committer.durability,
+            "guilds": guild_count,
+            "populate_seconds": populate_seconds,
+            "migration_seconds": migration_seconds,
+            "read_cold": read_latency(settings_keys, reads, True),
+            "read_hot": read_latency(settings_keys, reads, False),
+            "read_cold_url_cache": read_latency(cache_keys, min(reads, 500), True),
+        }
+
+        async def run_async():
+            results["read_async_hot"] = await async_read_latency(settings_keys, reads)
+
+            storage.storage_locks.wait_seconds = 0.0
+            results["edit_same_key"] = await edit_throughput(
+                timer_keys[:1], edits, concurrency
+            )
+
+            storage.storage_locks.wait_seconds = 0.0
+            results["edit_different_keys"] = await edit_throughput(
+                timer_keys, edits, concurrency
+            )
+
+        asyncio.run(run_async())
+
+        return results
+    finally:
+        storage.storage_cache.clear()
+        shutil.rmtree(data_path, ignore_errors=True)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main(
+    guild_counts, backends, formats, concurrency, edits, reads, cache_entries, output
+):
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": [
+            run(
+                backend_name,
+                format_name,
+                guild_count,
+                concurrency,
+                edits,
+                reads,
+                cache_entries,
+            )
+            for guild_count in guild_counts or [1000]
+            for backend_name in backends or [storage.storage_backend.name]
+            for format_name in formats or [storage.STORAGE_FORMAT]
+        ],
+    }
+
+    if output:
+        with open(output, "w") as w:
+            json.dump(report, w, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    main(**vars(args))
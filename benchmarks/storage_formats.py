@@ -0,0 +1,101 @@
+import argparse
+import json
+import time
+
+from utils import storage
+
+
+parser = argparse.ArgumentParser(
+    description="Report size and parse time of stored data in every available storage format. Run from the repository root."
+)
+parser.add_argument(
+    "--data-path",
+    dest="data_path",
+    type=str,
+    default=storage.DATA_PATH,
+    required=False,
+    help="Data directory to measure (default: dataPath from settings.json). Must already be migrated to the current storage version. Only read, never modified.",
+)
+parser.add_argument(
+    "--repeat",
+    dest="repeat",
+    type=int,
+    default=5,
+    required=False,
+    help="How many times to decode each file when timing.",
+)
+
+
+def get_formats():
+    formats = {
+        "json": (
+            lambda data: json.dumps(data, indent=4).encode(),
+            json.loads,
+        ),
+        "compact": (
+            lambda data: json.dumps(data, separators=(",", ":")).encode(),
+            json.loads,
+        ),
+    }
+
+    if storage.orjson is not None:
+        formats["compact+orjson"] = (storage.encode_compact, storage.orjson.loads)
+    if storage.msgpack is not None:
+        formats["msgpack"] = (
+            storage.encode_msgpack,
+            lambda raw: storage.msgpack.unpackb(raw, strict_map_key=False),
+        )
+
+    return formats
+
+
+def measure(data_path: str, repeat: int) -> dict:
+    storage.DATA_PATH = data_path
+    formats = get_formats()
+    results = {}
+
+    for guild_id in storage.storage_backend.guild_ids():
+        if not (loaded := storage.storage_backend.load(guild_id)):
+            continue
+
+        for keys in loaded[0].values():
+            for key, data in keys.items():
+                for format_name, (encode, decode) in formats.items():
+                    row = results.setdefault((key, format_name), [0, 0, 0.0])
+
+                    raw = encode(data)
+                    start = time.perf_counter()
+
+                    for _ in range(repeat):
+                        decode(raw)
+
+                    row[0] += 1
+                    row[1] += len(raw)
+                    row[2] += (time.perf_counter() - start) / repeat
+
+    return results
+
+
+def main(data_path: str, repeat: int):
+    results = measure(data_path, repeat)
+    baselines = {
+        key: (size, parse)
+        for (key, format_name), (_, size, parse) in results.items()
+        if format_name == "json"
+    }
+
+    print(
+        f"{'key':>24} | {'format':>14} | {'files':>7} | {'bytes':>12} | {'size':>7} | {'parse_ms':>10} | {'parse':>7}"
+    )
+
+    for (key, format_name), (files, size, parse) in sorted(results.items()):
+        base_size, base_parse = baselines[key]
+
+        print(
+            f"{key:>24} | {format_name:>14} | {files:>7} | {size:>12} | {size / base_size:>6.0%} | {parse * 1000:>10.2f} | {parse / base_parse:>6.0%}"
+        )
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    main(**vars(args))
@@ -1,10 +1,18 @@
 from discord.ext import commands
 from main import Mammoth
-from utils.storage import safe_read, safe_edit, update_dict_defaults
+from utils.storage import StorageDerivedView, update, update_dict_defaults
 from discord.ui import Button, View, Select
 from lib.ui import HashBlacklistButton
 from utils.hash import LinkHash, get_media_sorted_link_hashes_from_message
 from utils.link import get_media_sorted_links_from_message
+from utils.schema import (
+    Schema,
+    boolean,
+    optional_integer,
+    optional_string,
+    snowflake,
+    snowflake_set,
+)
 import traceback
 import discord
 import json
@@ -31,6 +39,22 @@ with open("./settings.json", "r") as r:
     SETTINGS = json.load(r)
 
 
+class AlertsSettings(Schema):
+    FIELDS = {
+        "enabled": boolean,
+        "ignored_channel_ids": snowflake_set,
+        "trusted_role_ids": snowflake_set,
+        "trusted_member_ids": snowflake_set,
+        "alerts_channel_id": snowflake,
+        "mod_role_id": snowflake,
+        "alert_emoji_str": optional_string,
+        "alert_threshold": optional_integer,
+    }
+    DEFAULTS = DEFAULT_ALERTS_COG_SETTINGS
+
+    __slots__ = tuple(FIELDS)
+
+
 class CompactImageAlertPart:
     def __init__(
         self,
@@ -492,11 +516,16 @@ class SubmitReportView(View):
 class AlertsCog(commands.GroupCog, name="alerts"):
     def __init__(self, bot: Mammoth):
         self.bot = bot
+        self.settings = StorageDerivedView(COG, "settings", AlertsSettings.parse)
 
         super().__init__()
 
         log.info("Loaded")
 
+    def cog_unload(self):
+        self.settings.close()
+        log.info("Unloaded")
+
     @commands.Cog.listener(name="on_raw_reaction_add")
     async def handle_alert_reactions(self, payload: discord.RawReactionActionEvent):
         if payload.guild_id is None:
@@ -514,61 +543,31 @@ class AlertsCog(commands.GroupCog, name="alerts"):
         if not (reporter := guild.get_member(payload.user_id)):
             return
 
-        settings_data = safe_read(COG, guild, "settings")
+        settings = await self.settings.get(guild)
 
-        if not settings_data:
+        if not settings.enabled:
             return
-        if not settings_data.get("enabled", DEFAULT_ALERTS_COG_SETTINGS["enabled"]):
+        if str(payload.emoji) != (alert_emoji_str := settings.alert_emoji_str):
             return
-        if str(payload.emoji) != (
-            alert_emoji_str := settings_data.get(
-                "alert_emoji_str", DEFAULT_ALERTS_COG_SETTINGS["alert_emoji_str"]
-            )
-        ):
+        if payload.channel_id in settings.ignored_channel_ids:
             return
-        if payload.channel_id in settings_data.get(
-            "ignored_channel_ids", DEFAULT_ALERTS_COG_SETTINGS["ignored_channel_ids"]
-        ):
-            return
-        if not (
-            alerts_channel_id := settings_data.get(
-                "alerts_channel_id", DEFAULT_ALERTS_COG_SETTINGS["alerts_channel_id"]
-            )
-        ):
+        if not (alerts_channel_id := settings.alerts_channel_id):
             return
         if alerts_channel_id == payload.channel_id:
             return
         if not (alerts_channel := self.bot.get_channel(alerts_channel_id)):
             return
-
-        for role in message.author.roles:
-            if role.id in settings_data.get(
-                "trusted_role_ids", DEFAULT_ALERTS_COG_SETTINGS["trusted_role_ids"]
-            ):
-                return
-
-        if message.author.id in settings_data.get(
-            "trusted_member_ids", DEFAULT_ALERTS_COG_SETTINGS["trusted_member_ids"]
+        if not settings.trusted_role_ids.isdisjoint(
+            role.id for role in message.author.roles
         ):
             return
-        if message.channel.id in settings_data.get(
-            "ignored_channel_ids", DEFAULT_ALERTS_COG_SETTINGS["ignored_channel_ids"]
-        ):
+        if message.author.id in settings.trusted_member_ids:
             return
-        if not isinstance(
-            (
-                alert_threshold := settings_data.get(
-                    "alert_threshold", DEFAULT_ALERTS_COG_SETTINGS["alert_threshold"]
-                )
-            ),
-            int,
-        ):
+        if message.channel.id in settings.ignored_channel_ids:
             return
-        if not (
-            mod_role_id := settings_data.get(
-                "mod_role_id", DEFAULT_ALERTS_COG_SETTINGS["mod_role_id"]
-            )
-        ):
+        if (alert_threshold := settings.alert_threshold) is None:
+            return
+        if not (mod_role_id := settings.mod_role_id):
             return
         if not (mod_role := guild.get_role(mod_role_id)):
             return
@@ -614,38 +613,23 @@ class AlertsCog(commands.GroupCog, name="alerts"):
         if not isinstance(message.author, discord.Member):
             return
 
-        settings_data = safe_read(COG, guild, "settings")
+        settings = await self.settings.get(guild)
 
-        if not settings_data:
+        if not settings.enabled:
             return
-        if not settings_data.get("enabled", DEFAULT_ALERTS_COG_SETTINGS["enabled"]):
-            return
-        if not (
-            alerts_channel_id := settings_data.get(
-                "alerts_channel_id", DEFAULT_ALERTS_COG_SETTINGS["alerts_channel_id"]
-            )
-        ):
+        if not (alerts_channel_id := settings.alerts_channel_id):
             return
         if message.channel.id == alerts_channel_id:
             return
-        if not (
-            alert_emoji_str := settings_data.get(
-                "alert_emoji_str", DEFAULT_ALERTS_COG_SETTINGS["alert_emoji_str"]
-            )
-        ):
+        if not (alert_emoji_str := settings.alert_emoji_str):
             return
-        for role in message.author.roles:
-            if role.id in settings_data.get(
-                "trusted_role_ids", DEFAULT_ALERTS_COG_SETTINGS["trusted_role_ids"]
-            ):
-                return
-        if message.author.id in settings_data.get(
-            "trusted_member_ids", DEFAULT_ALERTS_COG_SETTINGS["trusted_member_ids"]
+        if not settings.trusted_role_ids.isdisjoint(
+            role.id for role in message.author.roles
         ):
             return
-        if message.channel.id in settings_data.get(
-            "ignored_channel_ids", DEFAULT_ALERTS_COG_SETTINGS["ignored_channel_ids"]
-        ):
+        if message.author.id in settings.trusted_member_ids:
+            return
+        if message.channel.id in settings.ignored_channel_ids:
             return
 
         media_sorted_links = get_media_sorted_links_from_message(message)
@@ -679,14 +663,11 @@ class AlertsCog(commands.GroupCog, name="alerts"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
+        def enable(settings_data: dict) -> str:
             if not settings_data:
                 update_dict_defaults(DEFAULT_ALERTS_COG_SETTINGS, settings_data)
             if settings_data.get("enabled", DEFAULT_ALERTS_COG_SETTINGS["enabled"]):
-                await interaction.followup.send(
-                    "Alerts are already enabled!", ephemeral=True
-                )
-                return
+                return "Alerts are already enabled!"
 
             settings_data["enabled"] = True
             settings_data["alerts_channel_id"] = alerts_channel.id
@@ -694,7 +675,11 @@ class AlertsCog(commands.GroupCog, name="alerts"):
             settings_data["alert_emoji_str"] = str(alert_emoji)
             settings_data["alert_threshold"] = alert_threshold
 
-        await interaction.followup.send("Alerts enabled!", ephemeral=True)
+            return "Alerts enabled!"
+
+        await interaction.followup.send(
+            await update(COG, guild, "settings", enable), ephemeral=True
+        )
 
     @discord.app_commands.checks.has_permissions(manage_messages=True)
     @discord.app_commands.checks.bot_has_permissions(manage_messages=True)
@@ -704,13 +689,17 @@ class AlertsCog(commands.GroupCog, name="alerts"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def disable(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Alerts are not enabled!"
 
             settings_data["enabled"] = False
 
-        await interaction.followup.send("Alerts disabled!", ephemeral=True)
+            return "Alerts disabled!"
+
+        await interaction.followup.send(
+            await update(COG, guild, "settings", disable), ephemeral=True
+        )
 
     @discord.app_commands.checks.has_permissions(manage_messages=True)
     @discord.app_commands.checks.bot_has_permissions(manage_messages=True)
@@ -725,14 +714,16 @@ class AlertsCog(commands.GroupCog, name="alerts"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def change_channel(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Alerts are not enabled!"
 
             settings_data["alerts_channel_id"] = alerts_channel.id
 
+            return f"Alerts channel changed to {alerts_channel.mention}!"
+
         await interaction.followup.send(
-            f"Alerts channel changed to {alerts_channel.mention}!", ephemeral=True
+            await update(COG, guild, "settings", change_channel), ephemeral=True
         )
 
     @discord.app_commands.checks.has_permissions(manage_messages=True)
@@ -751,14 +742,16 @@ class AlertsCog(commands.GroupCog, name="alerts"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def change_mod_role(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Alerts are not enabled!"
 
             settings_data["mod_role_id"] = mod_role.id
 
+            return f"Mod role changed to {mod_role.mention}!"
+
         await interaction.followup.send(
-            f"Mod role changed to {mod_role.mention}!", ephemeral=True
+            await update(COG, guild, "settings", change_mod_role), ephemeral=True
         )
 
     @discord.app_commands.checks.has_permissions(manage_messages=True)
@@ -772,14 +765,16 @@ class AlertsCog(commands.GroupCog, name="alerts"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def change_emoji(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Alerts are not enabled!"
 
             settings_data["alert_emoji_str"] = str(alert_emoji)
 
+            return f"Alert emoji changed to {str(alert_emoji)}!"
+
         await interaction.followup.send(
-            f"Alert emoji changed to {str(alert_emoji)}!", ephemeral=True
+            await update(COG, guild, "settings", change_emoji), ephemeral=True
         )
 
     @discord.app_commands.checks.has_permissions(manage_messages=True)
@@ -798,14 +793,16 @@ class AlertsCog(commands.GroupCog, name="alerts"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def change_threshold(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Alerts are not enabled!"
 
             settings_data["alert_threshold"] = alert_threshold
 
+            return f"Alert threshold changed to ``{alert_threshold}``!"
+
         await interaction.followup.send(
-            f"Alert threshold changed to ``{alert_threshold}``!", ephemeral=True
+            await update(COG, guild, "settings", change_threshold), ephemeral=True
         )
 
     alerts_ignore_group = discord.app_commands.Group(
@@ -817,19 +814,15 @@ class AlertsCog(commands.GroupCog, name="alerts"):
     @alerts_ignore_group.command(name="list", description="List ignored channels.")
     async def alerts_ignore_list(self, interaction: discord.Interaction):
         guild = interaction.guild
-        settings_data = safe_read(COG, guild, "settings")
 
-        if not await self.cog_is_enabled(settings_data, interaction):
+        if not (settings := await self.settings.get(guild)).enabled:
+            await interaction.response.send_message(
+                "Alerts are not enabled!", ephemeral=True
+            )
             return
 
         ignored_channels = ", ".join(
-            [
-                f"<#{channel_id}>"
-                for channel_id in settings_data.get(
-                    "ignored_channel_ids",
-                    DEFAULT_ALERTS_COG_SETTINGS["ignored_channel_ids"],
-                )
-            ]
+            [f"<#{channel_id}>" for channel_id in settings.ignored_channel_ids]
         )
 
         await interaction.response.send_message(
@@ -850,22 +843,21 @@ class AlertsCog(commands.GroupCog, name="alerts"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def ignore_channel(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Alerts are not enabled!"
             if channel.id in settings_data.get(
                 "ignored_channel_ids",
                 DEFAULT_ALERTS_COG_SETTINGS["ignored_channel_ids"],
             ):
-                await interaction.followup.send(
-                    f"{channel.mention} is already ignored!", ephemeral=True
-                )
-                return
+                return f"{channel.mention} is already ignored!"
 
             settings_data["ignored_channel_ids"].append(channel.id)
 
+            return f"Now ignoring {channel.mention}!"
+
         await interaction.followup.send(
-            f"Now ignoring {channel.mention}!", ephemeral=True
+            await update(COG, guild, "settings", ignore_channel), ephemeral=True
         )
 
     alerts_unignore_group = discord.app_commands.Group(
@@ -886,24 +878,23 @@ class AlertsCog(commands.GroupCog, name="alerts"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def unignore_channel(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Alerts are not enabled!"
             if not channel.id in (
                 settings_data.get(
                     "ignored_channel_ids",
                     DEFAULT_ALERTS_COG_SETTINGS["ignored_channel_ids"],
                 )
             ):
-                await interaction.followup.send(
-                    f"{channel.mention} is not ignored!", ephemeral=True
-                )
-                return
+                return f"{channel.mention} is not ignored!"
 
             settings_data["ignored_channel_ids"].remove(channel.id)
 
+            return f"No longer ignoring {channel.mention}!"
+
         await interaction.followup.send(
-            f"No longer ignoring {channel.mention}!", ephemeral=True
+            await update(COG, guild, "settings", unignore_channel), ephemeral=True
         )
 
     alerts_trust_group = discord.app_commands.Group(
@@ -918,27 +909,18 @@ class AlertsCog(commands.GroupCog, name="alerts"):
     )
     async def alerts_trust_list(self, interaction: discord.Interaction):
         guild = interaction.guild
-        settings_data = safe_read(COG, guild, "settings")
 
-        if not await self.cog_is_enabled(settings_data, interaction):
+        if not (settings := await self.settings.get(guild)).enabled:
+            await interaction.response.send_message(
+                "Alerts are not enabled!", ephemeral=True
+            )
             return
 
         trusted_members = ", ".join(
-            [
-                f"<@{member_id}>"
-                for member_id in settings_data.get(
-                    "trusted_member_ids",
-                    DEFAULT_ALERTS_COG_SETTINGS["trusted_member_ids"],
-                )
-            ]
+            [f"<@{member_id}>" for member_id in settings.trusted_member_ids]
         )
         trusted_roles = ", ".join(
-            [
-                f"<@&{role_id}>"
-                for role_id in settings_data.get(
-                    "trusted_role_ids", DEFAULT_ALERTS_COG_SETTINGS["trusted_role_ids"]
-                )
-            ]
+            [f"<@&{role_id}>" for role_id in settings.trusted_role_ids]
         )
 
         await interaction.response.send_message(
@@ -959,24 +941,23 @@ class AlertsCog(commands.GroupCog, name="alerts"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def trust_member(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Alerts are not enabled!"
             if member.id in (
                 settings_data.get(
                     "trusted_member_ids",
                     DEFAULT_ALERTS_COG_SETTINGS["trusted_member_ids"],
                 )
             ):
-                await interaction.followup.send(
-                    f"{member.mention} is already trusted!", ephemeral=True
-                )
-                return
+                return f"{member.mention} is already trusted!"
 
             settings_data["trusted_member_ids"].append(member.id)
 
+            return f"{member.mention} is now trusted!"
+
         await interaction.followup.send(
-            f"{member.mention} is now trusted!", ephemeral=True
+            await update(COG, guild, "settings", trust_member), ephemeral=True
         )
 
     @discord.app_commands.checks.has_permissions(manage_messages=True)
@@ -990,23 +971,22 @@ class AlertsCog(commands.GroupCog, name="alerts"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def trust_role(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Alerts are not enabled!"
             if role.id in (
                 settings_data.get(
                     "trusted_role_ids", DEFAULT_ALERTS_COG_SETTINGS["trusted_role_ids"]
                 )
             ):
-                await interaction.followup.send(
-                    f"{role.mention} is already trusted!", ephemeral=True
-                )
-                return
+                return f"{role.mention} is already trusted!"
 
             settings_data["trusted_role_ids"].append(role.id)
 
+            return f"{role.mention} is now trusted!"
+
         await interaction.followup.send(
-            f"{role.mention} is now trusted!", ephemeral=True
+            await update(COG, guild, "settings", trust_role), ephemeral=True
         )
 
     alerts_untrust_group = discord.app_commands.Group(
@@ -1027,24 +1007,23 @@ class AlertsCog(commands.GroupCog, name="alerts"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def untrust_member(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Alerts are not enabled!"
             if not member.id in (
                 settings_data.get(
                     "trusted_member_ids",
                     DEFAULT_ALERTS_COG_SETTINGS["trusted_member_ids"],
                 )
             ):
-                await interaction.followup.send(
-                    f"{member.mention} is not trusted!", ephemeral=True
-                )
-                return
+                return f"{member.mention} is not trusted!"
 
             settings_data["trusted_member_ids"].remove(member.id)
 
+            return f"{member.mention} is no longer trusted!"
+
         await interaction.followup.send(
-            f"{member.mention} is no longer trusted!", ephemeral=True
+            await update(COG, guild, "settings", untrust_member), ephemeral=True
         )
 
     @discord.app_commands.checks.has_permissions(manage_messages=True)
@@ -1060,35 +1039,30 @@ class AlertsCog(commands.GroupCog, name="alerts"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def untrust_role(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Alerts are not enabled!"
             if not role.id in (
                 settings_data.get(
                     "trusted_role_ids", DEFAULT_ALERTS_COG_SETTINGS["trusted_role_ids"]
                 )
             ):
-                await interaction.followup.send(
-                    f"{role.mention} is not trusted!", ephemeral=True
-                )
-                return
+                return f"{role.mention} is not trusted!"
 
             settings_data["trusted_role_ids"].remove(role.id)
 
+            return f"{role.mention} is no longer trusted!"
+
         await interaction.followup.send(
-            f"{role.mention} is no longer trusted!", ephemeral=True
+            await update(COG, guild, "settings", untrust_role), ephemeral=True
         )
 
     @staticmethod
-    async def cog_is_enabled(settings_data: dict, interaction: discord.Interaction):
+    def cog_is_enabled(settings_data: dict) -> bool:
         if not settings_data:
-            await interaction.followup.send("Alerts are not enabled!", ephemeral=True)
-            return False
-        if not settings_data.get("enabled", DEFAULT_ALERTS_COG_SETTINGS["enabled"]):
-            await interaction.followup.send("Alerts are not enabled!", ephemeral=True)
             return False
 
-        return True
+        return settings_data.get("enabled", DEFAULT_ALERTS_COG_SETTINGS["enabled"])
 
 
 async def setup(bot: Mammoth):
@@ -1,7 +1,10 @@
 from discord.ext import commands
 from main import Mammoth
-from utils.storage import safe_read, safe_edit, update_dict_defaults
+from utils.storage import StorageDerivedView, update, update_dict_defaults
 from utils.hash import get_media_sorted_link_hashes_from_message
+from utils.download import FAIL_FAST_RETRY_POLICIES
+from utils.imaging import IMAGE_HASH_TOLERANCE, image_hash_bits, image_hash_distance
+from utils.schema import Schema, string_set
 import discord
 import json
 import logging
@@ -17,24 +20,77 @@ with open("./settings.json", "r") as r:
     SETTINGS = json.load(r)
 
 
+def hash_matches(hash: str, link_hash) -> bool:
+    if hash in (link_hash.md5, link_hash.image_hash):
+        return True
+    if not IMAGE_HASH_TOLERANCE or not link_hash.image_hash:
+        return False
+    if (bits := image_hash_bits(hash)) is None:
+        return False
+    if (link_bits := image_hash_bits(link_hash.image_hash)) is None:
+        return False
+
+    return image_hash_distance(bits, link_bits) <= IMAGE_HASH_TOLERANCE
+
+
+class HashBlacklist(Schema):
+    FIELDS = {"blacklist": string_set}
+    DEFAULTS = DEFAULT_HASH_BLACKLIST
+
+    __slots__ = tuple(FIELDS) + ("image_hashes",)
+
+    @classmethod
+    def parse(cls, data: dict, path: str = None):
+        hash_blacklist = super().parse(data, path)
+        hash_blacklist.image_hashes = tuple(
+            bits
+            for hash in hash_blacklist.blacklist
+            if (bits := image_hash_bits(hash)) is not None
+        )
+
+        return hash_blacklist
+
+    def matches(self, link_hash) -> bool:
+        if link_hash.md5 in self.blacklist or link_hash.image_hash in self.blacklist:
+            return True
+        if not IMAGE_HASH_TOLERANCE or not link_hash.image_hash:
+            return False
+        if (bits := image_hash_bits(link_hash.image_hash)) is None:
+            return False
+
+        return any(
+            image_hash_distance(bits, blacklisted_bits) <= IMAGE_HASH_TOLERANCE
+            for blacklisted_bits in self.image_hashes
+        )
+
+
 @discord.app_commands.guild_only()
 class BlacklistCog(commands.GroupCog, name="blacklist"):
     def __init__(self, bot: Mammoth):
         self.bot = bot
+        self.hash_blacklist = StorageDerivedView(
+            "global", "hash_blacklist", HashBlacklist.parse
+        )
 
         super().__init__()
 
         log.info("Loaded")
 
+    def cog_unload(self):
+        self.hash_blacklist.close()
+        log.info("Unloaded")
+
     @commands.Cog.listener(name="on_message")
     async def handle_blacklisted_content(self, message: discord.Message):
         channel = message.channel
 
         if not (guild := message.guild):
             return
+        if not (hash_blacklist := await self.hash_blacklist.get(guild)).blacklist:
+            return
 
         media_sorted_link_hashes = await get_media_sorted_link_hashes_from_message(
-            message
+            message, FAIL_FAST_RETRY_POLICIES
         )
         all_media_sorted_link_hashes = (
             media_sorted_link_hashes.image_link_hashes
@@ -42,18 +98,8 @@ class BlacklistCog(commands.GroupCog, name="blacklist"):
             + media_sorted_link_hashes.audio_link_hashes
         )
 
-        if not (hash_blacklist_data := safe_read("global", guild, "hash_blacklist")):
-            return
-        if not hash_blacklist_data.get(
-            "blacklist", DEFAULT_HASH_BLACKLIST["blacklist"]
-        ):
-            return
-
         for link_hash in all_media_sorted_link_hashes:
-            if (
-                link_hash.md5 in hash_blacklist_data["blacklist"]
-                or link_hash.image_hash in hash_blacklist_data["blacklist"]
-            ):
+            if hash_blacklist.matches(link_hash):
                 try:
                     await message.delete()
 
@@ -75,15 +121,11 @@ class BlacklistCog(commands.GroupCog, name="blacklist"):
     async def blacklist_list(self, interaction: discord.Interaction):
         guild = interaction.guild
 
-        if not (hash_blacklist_data := safe_read("global", guild, "hash_blacklist")):
-            hash_blacklist_data = DEFAULT_HASH_BLACKLIST.copy()
-        if not hash_blacklist_data.get(
-            "blacklist", DEFAULT_HASH_BLACKLIST["blacklist"]
-        ):
-            hash_blacklist_data = DEFAULT_HASH_BLACKLIST.copy()
-
         hash_blacklist = ", ".join(
-            [f"``{hash}``" for hash in hash_blacklist["blacklist"]]
+            [
+                f"``{hash}``"
+                for hash in sorted((await self.hash_blacklist.get(guild)).blacklist)
+            ]
         )
 
         await interaction.response.send_message(
@@ -104,7 +146,7 @@ class BlacklistCog(commands.GroupCog, name="blacklist"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit("global", guild, "hash_blacklist") as hash_blacklist_data:
+        def add_hash(hash_blacklist_data: dict) -> bool:
             if not hash_blacklist_data:
                 update_dict_defaults(DEFAULT_HASH_BLACKLIST, hash_blacklist_data)
             if not hash_blacklist_data.get(
@@ -112,13 +154,18 @@ class BlacklistCog(commands.GroupCog, name="blacklist"):
             ):
                 update_dict_defaults(DEFAULT_HASH_BLACKLIST, hash_blacklist_data)
             if hash in hash_blacklist_data["blacklist"]:
-                await interaction.followup.send(
-                    f"``{hash}`` is already blacklisted!", ephemeral=True
-                )
-                return
+                return False
 
             hash_blacklist_data["blacklist"].append(hash)
 
+            return True
+
+        if not await update("global", guild, "hash_blacklist", add_hash):
+            await interaction.followup.send(
+                f"``{hash}`` is already blacklisted!", ephemeral=True
+            )
+            return
+
         await interaction.followup.send(f"``{hash}`` blacklisted!", ephemeral=True)
 
     @discord.app_commands.checks.has_permissions(manage_messages=True)
@@ -134,7 +181,7 @@ class BlacklistCog(commands.GroupCog, name="blacklist"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit("global", guild, "hash_blacklist") as hash_blacklist_data:
+        def remove_hash(hash_blacklist_data: dict) -> bool:
             if not hash_blacklist_data:
                 update_dict_defaults(DEFAULT_HASH_BLACKLIST, hash_blacklist_data)
             if not hash_blacklist_data.get(
@@ -142,13 +189,18 @@ class BlacklistCog(commands.GroupCog, name="blacklist"):
             ):
                 update_dict_defaults(DEFAULT_HASH_BLACKLIST, hash_blacklist_data)
             if hash not in hash_blacklist_data["blacklist"]:
-                await interaction.followup.send(
-                    f"``{hash}`` is not blacklisted!", ephemeral=True
-                )
-                return
+                return False
 
             hash_blacklist_data["blacklist"].remove(hash)
 
+            return True
+
+        if not await update("global", guild, "hash_blacklist", remove_hash):
+            await interaction.followup.send(
+                f"``{hash}`` is not blacklisted!", ephemeral=True
+            )
+            return
+
         await interaction.followup.send(f"``{hash}`` unblacklisted!", ephemeral=True)
 
 
@@ -1,8 +1,24 @@
 from typing import Optional
 from discord.ext import commands, tasks
 from main import Mammoth
-from utils.storage import safe_edit, safe_read, update_dict_defaults
+from utils.storage import (
+    StorageDerivedView,
+    read,
+    safe_edit,
+    safe_read,
+    update,
+    update_dict_defaults,
+)
 from utils.link import get_links_from_string
+from utils.schema import (
+    Schema,
+    boolean,
+    choice,
+    optional_integer,
+    optional_string,
+    parse_mapping,
+    string_tuple,
+)
 import discord
 import json
 import asyncio
@@ -15,7 +31,9 @@ import typing
 COG = __name__
 ONE_HOUR = 3600
 DEFAULT_TRAP_ROLE_SETTINGS = {}
+DEFAULT_TRAP_ROLE_ENTRY_SETTINGS = {"ban_reason": None}
 DEFAULT_AUTO_PURGE_SETTINGS = {}
+DEFAULT_AUTO_PURGE_CHANNEL_SETTINGS = {"lifetime": None}
 DEFAULT_LINK_FILTER_SETTINGS = {}
 DEFAULT_LINK_FILTER_CHANNEL_SETTINGS = {
     "enabled": False,
@@ -30,6 +48,68 @@ with open("./settings.json", "r") as r:
     SETTINGS = json.load(r)
 
 
+def channel_link_filter(link_filter_data: dict, channel_id: int) -> dict:
+    if not link_filter_data:
+        update_dict_defaults(DEFAULT_LINK_FILTER_SETTINGS, link_filter_data)
+    if not link_filter_data.get(str(channel_id)):
+        link_filter_data[str(channel_id)] = {}
+        update_dict_defaults(
+            DEFAULT_LINK_FILTER_CHANNEL_SETTINGS, link_filter_data[str(channel_id)]
+        )
+
+    return link_filter_data[str(channel_id)]
+
+
+class LinkFilterChannelSettings(Schema):
+    FIELDS = {
+        "enabled": boolean,
+        "linklist": string_tuple,
+        "mode": choice("whitelist", "blacklist"),
+    }
+    DEFAULTS = DEFAULT_LINK_FILTER_CHANNEL_SETTINGS
+
+    __slots__ = tuple(FIELDS)
+
+
+class TrapRoleSettings(Schema):
+    FIELDS = {"ban_reason": optional_string}
+    DEFAULTS = DEFAULT_TRAP_ROLE_ENTRY_SETTINGS
+
+    __slots__ = tuple(FIELDS)
+
+
+class AutoPurgeChannelSettings(Schema):
+    FIELDS = {"lifetime": optional_integer}
+    DEFAULTS = DEFAULT_AUTO_PURGE_CHANNEL_SETTINGS
+
+    __slots__ = tuple(FIELDS)
+
+
+class AutoPruneSettings(Schema):
+    FIELDS = {"no_roles": boolean}
+    DEFAULTS = DEFAULT_AUTO_PRUNE_SETTINGS
+
+    __slots__ = tuple(FIELDS)
+
+
+def compile_link_filters(link_filter_data: dict) -> dict:
+    return {
+        channel_id: channel_settings
+        for channel_id, channel_settings in parse_mapping(
+            LinkFilterChannelSettings, link_filter_data, int
+        ).items()
+        if channel_settings.enabled and channel_settings.linklist
+    }
+
+
+def compile_role_traps(role_traps_data: dict) -> dict:
+    return parse_mapping(TrapRoleSettings, role_traps_data, int)
+
+
+def compile_auto_purges(auto_purge_data: dict) -> dict:
+    return parse_mapping(AutoPurgeChannelSettings, auto_purge_data, int)
+
+
 class PruneView(discord.ui.View):
     def __init__(
         self,
@@ -97,24 +177,18 @@ class EditLinkFilterView(discord.ui.View):
     ):
         await interaction.response.defer()
 
-        async with safe_edit(
-            COG, interaction.guild, "link_filters"
-        ) as link_filter_data:
-            if not link_filter_data:
-                update_dict_defaults(DEFAULT_LINK_FILTER_SETTINGS, link_filter_data)
-            if not link_filter_data.get(str(self.channel.id)):
-                link_filter_data[str(self.channel.id)] = {}
-                update_dict_defaults(
-                    DEFAULT_LINK_FILTER_CHANNEL_SETTINGS,
-                    link_filter_data[str(self.channel.id)],
-                )
-
-            link_filter_data[str(self.channel.id)]["enabled"] = not link_filter_data[
-                str(self.channel.id)
-            ]["enabled"]
+        def toggle_state(link_filter_data: dict) -> dict:
+            channel_settings = channel_link_filter(link_filter_data, self.channel.id)
+            channel_settings["enabled"] = not channel_settings["enabled"]
+
+            return channel_settings
+
+        channel_settings = await update(
+            COG, interaction.guild, "link_filters", toggle_state
+        )
 
         embed = discord.Embed()
-        embed.description = f"> Channel: {self.channel.mention}\n> Enabled: ``{link_filter_data[str(self.channel.id)]['enabled']}``\n> Mode: ``{link_filter_data[str(self.channel.id)]['mode']}``\n\n**Link List**:\n```{', '.join(link for link in link_filter_data[str(self.channel.id)]['linklist'])}```"
+        embed.description = f"> Channel: {self.channel.mention}\n> Enabled: ``{channel_settings['enabled']}``\n> Mode: ``{channel_settings['mode']}``\n\n**Link List**:\n```{', '.join(link for link in channel_settings['linklist'])}```"
 
         await self.root_interaction.edit_original_response(embed=embed)
 
@@ -124,24 +198,20 @@ class EditLinkFilterView(discord.ui.View):
     ):
         await interaction.response.defer()
 
-        async with safe_edit(
-            COG, interaction.guild, "link_filters"
-        ) as link_filter_data:
-            if not link_filter_data:
-                update_dict_defaults(DEFAULT_LINK_FILTER_SETTINGS, link_filter_data)
-            if not link_filter_data.get(str(self.channel.id)):
-                link_filter_data[str(self.channel.id)] = {}
-                update_dict_defaults(
-                    DEFAULT_LINK_FILTER_CHANNEL_SETTINGS,
-                    link_filter_data[str(self.channel.id)],
-                )
-
-            link_filter_data[str(self.channel.id)]["mode"] = "whitelist" if link_filter_data[
-                str(self.channel.id)
-            ]["mode"] == "blacklist" else "blacklist"
+        def toggle_mode(link_filter_data: dict) -> dict:
+            channel_settings = channel_link_filter(link_filter_data, self.channel.id)
+            channel_settings["mode"] = "whitelist" if channel_settings[
+                "mode"
+            ] == "blacklist" else "blacklist"
+
+            return channel_settings
+
+        channel_settings = await update(
+            COG, interaction.guild, "link_filters", toggle_mode
+        )
 
         embed = discord.Embed()
-        embed.description = f"> Channel: {self.channel.mention}\n> Enabled: ``{link_filter_data[str(self.channel.id)]['enabled']}``\n> Mode: ``{link_filter_data[str(self.channel.id)]['mode']}``\n\n**Link List**:\n```{', '.join(link for link in link_filter_data[str(self.channel.id)]['linklist'])}```"
+        embed.description = f"> Channel: {self.channel.mention}\n> Enabled: ``{channel_settings['enabled']}``\n> Mode: ``{channel_settings['mode']}``\n\n**Link List**:\n```{', '.join(link for link in channel_settings['linklist'])}```"
 
         await self.root_interaction.edit_original_response(embed=embed)
 
@@ -166,10 +236,9 @@ class EditLinksModal(discord.ui.Modal):
             style=discord.TextStyle.paragraph,
             required=True,
             default=", ".join(
-                link
-                for link in self.link_filter_data.get(
-                    str(self.channel.id), DEFAULT_LINK_FILTER_CHANNEL_SETTINGS
-                )["linklist"]
+                LinkFilterChannelSettings.parse(
+                    self.link_filter_data.get(str(self.channel.id), {})
+                ).linklist
             ),
         )
 
@@ -178,24 +247,20 @@ class EditLinksModal(discord.ui.Modal):
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer()
 
-        async with safe_edit(
-            COG, interaction.guild, "link_filters"
-        ) as link_filter_data:
-            if not link_filter_data:
-                update_dict_defaults(DEFAULT_LINK_FILTER_SETTINGS, link_filter_data)
-            if not link_filter_data.get(str(self.channel.id)):
-                link_filter_data[str(self.channel.id)] = {}
-                update_dict_defaults(
-                    DEFAULT_LINK_FILTER_CHANNEL_SETTINGS,
-                    link_filter_data[str(self.channel.id)],
-                )
-
-            link_filter_data[str(self.channel.id)][
+        def edit_links(link_filter_data: dict) -> dict:
+            channel_settings = channel_link_filter(link_filter_data, self.channel.id)
+            channel_settings[
                 "linklist"
             ] = [f"{'https://' if not link.startswith(('http://', 'https://')) else ''}{link}" for link in self.link_list_input.value.replace(" ", "").split(",")]
 
+            return channel_settings
+
+        channel_settings = await update(
+            COG, interaction.guild, "link_filters", edit_links
+        )
+
         embed = discord.Embed()
-        embed.description = f"> Channel: {self.channel.mention}\n> Enabled: ``{link_filter_data[str(self.channel.id)]['enabled']}``\n> Mode: ``{link_filter_data[str(self.channel.id)]['mode']}``\n\n**Link List**:\n```{', '.join(link for link in link_filter_data[str(self.channel.id)]['linklist'])}```"
+        embed.description = f"> Channel: {self.channel.mention}\n> Enabled: ``{channel_settings['enabled']}``\n> Mode: ``{channel_settings['mode']}``\n\n**Link List**:\n```{', '.join(link for link in channel_settings['linklist'])}```"
 
         await self.root_interaction.edit_original_response(embed=embed)
 
@@ -205,6 +270,13 @@ class ModerationCog(commands.GroupCog, name="mod"):
     def __init__(self, bot: Mammoth):
         self.bot = bot
 
+        self.link_filters = StorageDerivedView(COG, "link_filters", compile_link_filters)
+        self.role_traps = StorageDerivedView(COG, "role_traps", compile_role_traps)
+        self.auto_purges = StorageDerivedView(COG, "auto_purge", compile_auto_purges)
+        self.auto_prune = StorageDerivedView(
+            COG, "auto_prune", AutoPruneSettings.parse
+        )
+
         super().__init__()
         self.run_auto_prunes.start()
         self.run_auto_purges.start()
@@ -216,24 +288,25 @@ class ModerationCog(commands.GroupCog, name="mod"):
         self.run_auto_prunes.cancel()
         self.run_auto_purges.cancel()
         self.run_role_traps.cancel()
+        self.link_filters.close()
+        self.role_traps.close()
+        self.auto_purges.close()
+        self.auto_prune.close()
         log.info("Unloaded")
 
     @tasks.loop(seconds=15)
     async def run_role_traps(self):
         for guild in self.bot.guilds:
             try:
-                if not (role_traps_data := safe_read(COG, guild, "role_traps")):
-                    continue
+                role_traps = await self.role_traps.get(guild)
 
-                for trapped_role_id in role_traps_data:
-                    if not (trapped_role := guild.get_role(int(trapped_role_id))):
+                for trapped_role_id, role_trap in role_traps.items():
+                    if not (trapped_role := guild.get_role(trapped_role_id)):
                         continue
 
                     for member in trapped_role.members:
                         try:
-                            await member.ban(
-                                reason=role_traps_data[trapped_role_id]["ban_reason"]
-                            )
+                            await member.ban(reason=role_trap.ban_reason)
                         except Exception:
                             log.exception(traceback.format_exc())
             except Exception:
@@ -243,22 +316,21 @@ class ModerationCog(commands.GroupCog, name="mod"):
     async def run_auto_purges(self):
         for guild in self.bot.guilds:
             try:
-                if not (auto_purge_data := safe_read(COG, guild, "auto_purge")):
-                    continue
+                auto_purges = await self.auto_purges.get(guild)
 
-                for channel_id in auto_purge_data:
-                    channel = guild.get_channel(int(channel_id))
+                for channel_id, auto_purge in auto_purges.items():
+                    channel = guild.get_channel(channel_id)
 
                     if not channel:
                         continue
+                    if auto_purge.lifetime is None:
+                        continue
 
                     async for message in channel.history(limit=None):
                         try:
                             if message.created_at < (
                                 datetime.datetime.now(tz=datetime.timezone.utc)
-                                - datetime.timedelta(
-                                    days=auto_purge_data[channel_id]["lifetime"]
-                                )
+                                - datetime.timedelta(days=auto_purge.lifetime)
                             ):
                                 await message.delete()
                         except Exception:
@@ -270,10 +342,7 @@ class ModerationCog(commands.GroupCog, name="mod"):
     async def run_auto_prunes(self):
         for guild in self.bot.guilds:
             try:
-                if not (auto_prune_data := safe_read(COG, guild, "auto_prune")):
-                    continue
-
-                if auto_prune_data["no_roles"]:
+                if (await self.auto_prune.get(guild)).no_roles:
                     members_to_prune = [
                         member
                         for member in guild.members
@@ -299,20 +368,14 @@ class ModerationCog(commands.GroupCog, name="mod"):
     async def handle_link_filters_on_message(self, message: discord.Message):
         if not (guild := message.guild):
             return
-        if not (link_filter_data := safe_read(COG, guild, "link_filters")):
-            return
-        if not link_filter_data.get(str(message.channel.id)):
+        if not (link_filter := (await self.link_filters.get(guild)).get(message.channel.id)):
             return
-        if not link_filter_data[str(message.channel.id)].get("enabled", DEFAULT_LINK_FILTER_CHANNEL_SETTINGS["enabled"]):
-            return
-        if not link_filter_data[str(message.channel.id)].get("linklist", DEFAULT_LINK_FILTER_CHANNEL_SETTINGS["linklist"]):
-            return
-        if not link_filter_data[str(message.channel.id)].get("mode", DEFAULT_LINK_FILTER_CHANNEL_SETTINGS["mode"]):
-            return
-        
-        if link_filter_data[str(message.channel.id)]["mode"] == "whitelist":
+
+        mode, linklist = link_filter.mode, link_filter.linklist
+
+        if mode == "whitelist":
             for link in get_links_from_string(message.content):
-                if link.startswith(tuple(link_filter_data[str(message.channel.id)]["linklist"])):
+                if link.startswith(linklist):
                     continue
 
                 try:
@@ -320,9 +383,9 @@ class ModerationCog(commands.GroupCog, name="mod"):
                     return
                 except Exception:
                     log.exception(traceback.format_exc())
-        elif link_filter_data[str(message.channel.id)]["mode"] == "blacklist":
+        elif mode == "blacklist":
             for link in get_links_from_string(message.content):
-                if link.startswith(tuple(link_filter_data[str(message.channel.id)]["linklist"])):
+                if link.startswith(linklist):
                     try:
                         await message.delete()
                         return
@@ -337,13 +400,13 @@ class ModerationCog(commands.GroupCog, name="mod"):
             return
         if not (guild := after.guild):
             return
-        if not (role_traps_data := safe_read(COG, guild, "role_traps")):
+        if not (role_traps := await self.role_traps.get(guild)):
             return
 
         for role in after.roles:
-            if str(role.id) in role_traps_data:
+            if role_trap := role_traps.get(role.id):
                 try:
-                    await after.ban(reason=role_traps_data[str(role.id)]["ban_reason"])
+                    await after.ban(reason=role_trap.ban_reason)
                 except Exception:
                     log.exception(traceback.format_exc())
 
@@ -361,16 +424,13 @@ class ModerationCog(commands.GroupCog, name="mod"):
     ):
         channel = interaction.channel if not channel else channel
 
-        if not (link_filter_data := safe_read(COG, channel.guild, "link_filters")):
-            update_dict_defaults(DEFAULT_LINK_FILTER_SETTINGS, link_filter_data)
-        if not link_filter_data.get(str(channel.id)):
-            link_filter_data[str(channel.id)] = {}
-            update_dict_defaults(
-                DEFAULT_LINK_FILTER_CHANNEL_SETTINGS, link_filter_data[str(channel.id)]
-            )
+        link_filter_data = await read(COG, channel.guild, "link_filters")
+        channel_settings = LinkFilterChannelSettings.parse(
+            link_filter_data.get(str(channel.id), {})
+        )
 
         embed = discord.Embed()
-        embed.description = f"> Channel: {channel.mention}\n> Enabled: ``{link_filter_data[str(channel.id)]['enabled']}``\n> Mode: ``{link_filter_data[str(channel.id)]['mode']}``\n\n**Link List**:\n```{', '.join(link for link in link_filter_data[str(channel.id)]['linklist'])}```"
+        embed.description = f"> Channel: {channel.mention}\n> Enabled: ``{channel_settings.enabled}``\n> Mode: ``{channel_settings.mode}``\n\n**Link List**:\n```{', '.join(link for link in channel_settings.linklist)}```"
 
         await interaction.response.send_message(
             embed=embed, view=EditLinkFilterView(interaction, channel), ephemeral=True
@@ -391,14 +451,19 @@ class ModerationCog(commands.GroupCog, name="mod"):
     ):
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, interaction.guild, "role_traps") as role_traps_data:
+        def add_trap(role_traps_data: dict) -> bool:
             if not role_traps_data:
                 update_dict_defaults(DEFAULT_TRAP_ROLE_SETTINGS, role_traps_data)
-            if role.id in role_traps_data:
-                await interaction.followup.send("Role is already trapped!")
-                return
+            if str(role.id) in role_traps_data:
+                return False
+
+            role_traps_data[str(role.id)] = {"ban_reason": ban_reason}
 
-            role_traps_data[role.id] = {"ban_reason": ban_reason}
+            return True
+
+        if not await update(COG, interaction.guild, "role_traps", add_trap):
+            await interaction.followup.send("Role is already trapped!")
+            return
 
         await interaction.followup.send(f"{role.mention} is now trapped!")
 
@@ -408,12 +473,12 @@ class ModerationCog(commands.GroupCog, name="mod"):
     async def mod_trap_role_list(self, interaction: discord.Interaction):
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        if not (role_traps_data := safe_read(COG, interaction.guild, "role_traps")):
+        if not (role_traps := await self.role_traps.get(interaction.guild)):
             await interaction.followup.send("No roles are trapped!")
             return
 
         await interaction.followup.send(
-            f"**Trapped Roles**\n {', '.join(interaction.guild.get_role(int(role_id)).mention for role_id in role_traps_data)}"
+            f"**Trapped Roles**\n {', '.join(f'<@&{role_id}>' for role_id in role_traps)}"
         )
 
     @discord.app_commands.checks.has_permissions(ban_members=True)
@@ -426,14 +491,19 @@ class ModerationCog(commands.GroupCog, name="mod"):
     ):
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, interaction.guild, "role_traps") as role_traps_data:
+        def remove_trap(role_traps_data: dict) -> bool:
             if not role_traps_data:
                 update_dict_defaults(DEFAULT_TRAP_ROLE_SETTINGS, role_traps_data)
-            if role.id not in role_traps_data:
-                await interaction.followup.send("Role is not trapped!")
-                return
+            if str(role.id) not in role_traps_data:
+                return False
 
-            del role_traps_data[role.id]
+            del role_traps_data[str(role.id)]
+
+            return True
+
+        if not await update(COG, interaction.guild, "role_traps", remove_trap):
+            await interaction.followup.send("Role is not trapped!")
+            return
 
         await interaction.followup.send(f"{role.mention} is no longer trapped!")
 
@@ -462,17 +532,22 @@ class ModerationCog(commands.GroupCog, name="mod"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, interaction.guild, "auto_purge") as auto_purge_data:
+        def enable_auto_purge(auto_purge_data: dict) -> bool:
             if not auto_purge_data:
                 update_dict_defaults(DEFAULT_AUTO_PURGE_SETTINGS, auto_purge_data)
             if str(channel.id) in auto_purge_data:
-                await interaction.followup.send(
-                    f"Automatic message purging is already enabled in {channel.mention}!"
-                )
-                return
+                return False
 
             auto_purge_data[str(channel.id)] = {"lifetime": lifetime}
 
+            return True
+
+        if not await update(COG, interaction.guild, "auto_purge", enable_auto_purge):
+            await interaction.followup.send(
+                f"Automatic message purging is already enabled in {channel.mention}!"
+            )
+            return
+
         await interaction.followup.send(f"Auto purge enabled for {channel.mention}!")
 
     @discord.app_commands.checks.has_permissions(manage_messages=True)
@@ -486,17 +561,22 @@ class ModerationCog(commands.GroupCog, name="mod"):
     ):
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, interaction.guild, "auto_purge") as auto_purge_data:
+        def disable_auto_purge(auto_purge_data: dict) -> bool:
             if not auto_purge_data:
                 update_dict_defaults(DEFAULT_AUTO_PURGE_SETTINGS, auto_purge_data)
             if str(channel.id) not in auto_purge_data:
-                await interaction.followup.send(
-                    f"Automatic message purging is not enabled in {channel.mention}!"
-                )
-                return
+                return False
 
             del auto_purge_data[str(channel.id)]
 
+            return True
+
+        if not await update(COG, interaction.guild, "auto_purge", disable_auto_purge):
+            await interaction.followup.send(
+                f"Automatic message purging is not enabled in {channel.mention}!"
+            )
+            return
+
         await interaction.followup.send(f"Auto purge disabled for {channel.mention}!")
 
     mod_role_group = discord.app_commands.Group(
@@ -551,7 +631,7 @@ class ModerationCog(commands.GroupCog, name="mod"):
 
         async with safe_edit(COG, guild, "auto_prune") as auto_prune_data:
             if not auto_prune_data:
-                update_dict_defaults(DEFAULT_AUTO_PURGE_SETTINGS, auto_prune_data)
+                update_dict_defaults(DEFAULT_AUTO_PRUNE_SETTINGS, auto_prune_data)
 
             auto_prune_data["no_roles"] = state
 
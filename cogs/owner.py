@@ -1,7 +1,18 @@
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
 from main import Mammoth
-from utils.storage import safe_read, safe_edit, update_dict_defaults
+from utils.storage import (
+    STORAGE_SNAPSHOT_INTERVAL_SECONDS,
+    STORAGE_STATS_LOG_SECONDS,
+    create_snapshot,
+    format_stats,
+    read,
+    storage_stats,
+    update,
+    update_dict_defaults,
+)
+from utils.schema import Schema, boolean, snowflake_set
+from utils.download import get_download_client
 import traceback
 import logging
 import discord
@@ -19,6 +30,13 @@ with open("./settings.json", "r") as r:
     SETTINGS = json.load(r)
 
 
+class WhitelistSettings(Schema):
+    FIELDS = {"enabled": boolean, "whitelist": snowflake_set}
+    DEFAULTS = DEFAULT_WHITELIST_DATA
+
+    __slots__ = tuple(FIELDS)
+
+
 def is_owner(interaction: discord.Interaction):
     return interaction.user.id in SETTINGS["ownerIDs"]
 
@@ -30,16 +48,41 @@ class OwnerCog(commands.GroupCog, name="owner"):
 
         super().__init__()
 
+        if STORAGE_STATS_LOG_SECONDS > 0:
+            self.log_storage_stats.change_interval(seconds=STORAGE_STATS_LOG_SECONDS)
+            self.log_storage_stats.start()
+        if STORAGE_SNAPSHOT_INTERVAL_SECONDS > 0:
+            self.snapshot_storage.change_interval(
+                seconds=STORAGE_SNAPSHOT_INTERVAL_SECONDS
+            )
+            self.snapshot_storage.start()
+
         log.info("Loaded")
 
+    def cog_unload(self):
+        self.log_storage_stats.cancel()
+        self.snapshot_storage.cancel()
+        log.info("Unloaded")
+
+    @tasks.loop(seconds=60)
+    async def log_storage_stats(self):
+        log.info(f"Storage stats\n{format_stats()}")
+
+    @tasks.loop(hours=24)
+    async def snapshot_storage(self):
+        try:
+            await create_snapshot()
+        except Exception:
+            log.exception(traceback.format_exc())
+
     @commands.Cog.listener(name="on_guild_join")
     async def handle_whitelist_on_guild_join(self, guild: discord.Guild):
-        if not (whitelist_data := safe_read(COG, 0, "whitelist")):
-            return
-        if not whitelist_data["enabled"]:
+        whitelist = WhitelistSettings.parse(await read(COG, 0, "whitelist"))
+
+        if not whitelist.enabled:
             return
 
-        if guild.id not in whitelist_data["whitelist"]:
+        if guild.id not in whitelist.whitelist:
             try:
                 await guild.leave()
                 log.info(
@@ -62,18 +105,17 @@ class OwnerCog(commands.GroupCog, name="owner"):
     async def owner_whitelist_enable(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True, thinking=True)
 
-        async with safe_edit(COG, 0, "whitelist") as whitelist_data:
+        def enable(whitelist_data: dict) -> str:
             if not whitelist_data:
                 update_dict_defaults(DEFAULT_WHITELIST_DATA, whitelist_data)
             if whitelist_data["enabled"]:
-                await interaction.followup.send(
-                    "Guild whitelisting is already enabled!"
-                )
-                return
+                return "Guild whitelisting is already enabled!"
 
             whitelist_data["enabled"] = True
 
-        await interaction.followup.send("Guild whitelisting enabled!")
+            return "Guild whitelisting enabled!"
+
+        await interaction.followup.send(await update(COG, 0, "whitelist", enable))
 
     @owner_whitelist_group.command(
         name="disabled", description="Disable guild whitelisting."
@@ -81,16 +123,17 @@ class OwnerCog(commands.GroupCog, name="owner"):
     async def owner_whitelist_disable(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True, thinking=True)
 
-        async with safe_edit(COG, 0, "whitelist") as whitelist_data:
+        def disable(whitelist_data: dict) -> str:
             if not whitelist_data:
                 update_dict_defaults(DEFAULT_WHITELIST_DATA, whitelist_data)
             if not whitelist_data["enabled"]:
-                await interaction.followup.send("Guild whitelisting is not enabled!")
-                return
+                return "Guild whitelisting is not enabled!"
 
             whitelist_data["enabled"] = False
 
-        await interaction.followup.send("Guild whitelisting disabled!")
+            return "Guild whitelisting disabled!"
+
+        await interaction.followup.send(await update(COG, 0, "whitelist", disable))
 
     @owner_whitelist_group.command(
         name="add", description="Add a guild to the whitelist."
@@ -107,21 +150,19 @@ class OwnerCog(commands.GroupCog, name="owner"):
 
         await interaction.response.defer(ephemeral=True, thinking=True)
 
-        async with safe_edit(COG, 0, "whitelist") as whitelist_data:
+        def add_guild(whitelist_data: dict) -> str:
             if not whitelist_data:
                 update_dict_defaults(DEFAULT_WHITELIST_DATA, whitelist_data)
             if not whitelist_data["enabled"]:
-                await interaction.followup.send("Guild whitelist is not enabled!")
-                return
+                return "Guild whitelist is not enabled!"
             if guild_id in whitelist_data["whitelist"]:
-                await interaction.followup.send(
-                    f"Guild ``{guild_id}`` is already whitelisted!"
-                )
-                return
+                return f"Guild ``{guild_id}`` is already whitelisted!"
 
             whitelist_data["whitelist"].append(guild_id)
 
-        await interaction.followup.send(f"Guild ``{guild_id}`` whitelisted!")
+            return f"Guild ``{guild_id}`` whitelisted!"
+
+        await interaction.followup.send(await update(COG, 0, "whitelist", add_guild))
 
     @owner_whitelist_group.command(
         name="remove", description="Remove a guild from the whitelist."
@@ -138,29 +179,25 @@ class OwnerCog(commands.GroupCog, name="owner"):
 
         await interaction.response.defer(ephemeral=True, thinking=True)
 
-        async with safe_edit(COG, 0, "whitelist") as whitelist_data:
+        def remove_guild(whitelist_data: dict) -> str:
             if not whitelist_data:
                 update_dict_defaults(DEFAULT_WHITELIST_DATA, whitelist_data)
             if not whitelist_data["enabled"]:
-                await interaction.followup.send("Guild whitelist is not enabled!")
-                return
+                return "Guild whitelist is not enabled!"
             if guild_id not in whitelist_data["whitelist"]:
-                await interaction.followup.send(
-                    f"Guild ``{guild_id}`` is not whitelisted!"
-                )
-                return
+                return f"Guild ``{guild_id}`` is not whitelisted!"
 
             whitelist_data["whitelist"].remove(guild_id)
 
-        await interaction.followup.send(
-            f"Guild ``{guild_id}`` removed from the whitelist!"
-        )
+            return f"Guild ``{guild_id}`` removed from the whitelist!"
+
+        await interaction.followup.send(await update(COG, 0, "whitelist", remove_guild))
 
     @owner_whitelist_remove.autocomplete("guild_id")
     async def owner_whitelist_remove_autocomplete(
         self, interaction: discord.Interaction, current: str
     ):
-        if not (whitelist_data := safe_read(COG, 0, "whitelist")):
+        if not (whitelist_data := await read(COG, 0, "whitelist")):
             return []
         if not whitelist_data.get("enabled", DEFAULT_WHITELIST_DATA["enabled"]):
             return []
@@ -328,6 +365,44 @@ class OwnerCog(commands.GroupCog, name="owner"):
             ephemeral=True,
         )
 
+    @app_commands.command(name="storage", description="Show storage statistics.")
+    @app_commands.describe(reset="Reset the per-key statistics after showing them.")
+    async def owner_storage(
+        self, interaction: discord.Interaction, reset: bool = False
+    ):
+        await interaction.response.send_message(
+            f"```{format_stats(15)[:1900]}```", ephemeral=True
+        )
+
+        if reset:
+            storage_stats.reset()
+
+    @app_commands.command(
+        name="downloads", description="Show media download pool statistics."
+    )
+    async def owner_downloads(self, interaction: discord.Interaction):
+        await interaction.response.send_message(
+            f"```{get_download_client().format_stats()}```", ephemeral=True
+        )
+
+    @app_commands.command(
+        name="snapshot", description="Take a point-in-time snapshot of stored data."
+    )
+    async def owner_snapshot(self, interaction: discord.Interaction):
+        await interaction.response.defer(thinking=True, ephemeral=True)
+
+        try:
+            report = await create_snapshot()
+        except Exception:
+            log.exception(traceback.format_exc())
+            await interaction.followup.send("Snapshot failed!", ephemeral=True)
+            return
+
+        await interaction.followup.send(
+            f"Snapshot ``{report['name']}`` created: {report['files']} files, {report['bytes'] / 1048576:.1f}MB ({report['new_bytes'] / 1048576:.1f}MB new), writers paused for {report['quiesced_ms']:.0f}ms.",
+            ephemeral=True,
+        )
+
     # These do not check against the settings specified owner list!
 
     @commands.is_owner()
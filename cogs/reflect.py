@@ -1,10 +1,11 @@
 from time import time
 from discord.ext import commands
 from main import Mammoth
-from utils.storage import safe_read, safe_edit, update_dict_defaults
+from utils.storage import StorageDerivedView, update, update_dict_defaults
 from discord.ui import Button, View, Select
 from lib.ui import HashBlacklistButton
 from utils.hash import get_media_sorted_link_hashes_from_message, LinkHash
+from utils.schema import Schema, boolean, snowflake, snowflake_set
 import logging
 import discord
 import json
@@ -26,6 +27,19 @@ with open("./settings.json", "r") as r:
     SETTINGS = json.load(r)
 
 
+class ReflectSettings(Schema):
+    FIELDS = {
+        "enabled": boolean,
+        "ignored_channel_ids": snowflake_set,
+        "ignored_role_ids": snowflake_set,
+        "ignored_member_ids": snowflake_set,
+        "reflect_channel_id": snowflake,
+    }
+    DEFAULTS = DEFAULT_REFLECT_COG_SETTINGS
+
+    __slots__ = tuple(FIELDS)
+
+
 class ReflectionDismissButton(Button):
     def __init__(
         self, message: discord.Message, appended_messages: list[discord.Message]
@@ -207,11 +221,16 @@ class CompactImageReflectionView(View):
 class ReflectCog(commands.GroupCog, name="reflect"):
     def __init__(self, bot: Mammoth):
         self.bot = bot
+        self.settings = StorageDerivedView(COG, "settings", ReflectSettings.parse)
 
         super().__init__()
 
         log.info(f"Loaded")
 
+    def cog_unload(self):
+        self.settings.close()
+        log.info("Unloaded")
+
     async def send_compact_image_reflection(
         self,
         *,
@@ -290,29 +309,20 @@ class ReflectCog(commands.GroupCog, name="reflect"):
         if not isinstance(message.author, discord.Member):
             return
 
-        if not (settings_data := safe_read(COG, guild, "settings")):
+        settings = await self.settings.get(guild)
+
+        if not settings.enabled:
             return
-        if not settings_data.get("enabled", DEFAULT_REFLECT_COG_SETTINGS["enabled"]):
+        if channel.id in settings.ignored_channel_ids:
             return
-        if channel.id in settings_data.get(
-            "ignored_channel_ids", DEFAULT_REFLECT_COG_SETTINGS["ignored_channel_ids"]
-        ):
+        if channel.id == (reflect_channel_id := settings.reflect_channel_id):
             return
-        if channel.id == (
-            reflect_channel_id := settings_data.get(
-                "reflect_channel_id", DEFAULT_REFLECT_COG_SETTINGS["reflect_channel_id"]
-            )
-        ):
+        if message.author.id in settings.ignored_member_ids:
             return
-        if message.author.id in settings_data.get(
-            "ignored_member_ids", DEFAULT_REFLECT_COG_SETTINGS["ignored_member_ids"]
+        if not settings.ignored_role_ids.isdisjoint(
+            role.id for role in message.author.roles
         ):
             return
-        for role in message.author.roles:
-            if role.id in settings_data.get(
-                "ignored_role_ids", DEFAULT_REFLECT_COG_SETTINGS["ignored_role_ids"]
-            ):
-                return
         if not (reflect_channel := guild.get_channel(reflect_channel_id)):
             return
 
@@ -476,19 +486,20 @@ class ReflectCog(commands.GroupCog, name="reflect"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
+        def enable(settings_data: dict) -> str:
             if not settings_data:
                 update_dict_defaults(DEFAULT_REFLECT_COG_SETTINGS, settings_data)
             if settings_data.get("enabled", DEFAULT_REFLECT_COG_SETTINGS["enabled"]):
-                await interaction.followup.send(
-                    "Reflect is already enabled!", ephemeral=True
-                )
-                return
+                return "Reflect is already enabled!"
 
             settings_data["enabled"] = True
             settings_data["reflect_channel_id"] = reflect_channel.id
 
-        await interaction.followup.send("Reflect enabled!", ephemeral=True)
+            return "Reflect enabled!"
+
+        await interaction.followup.send(
+            await update(COG, guild, "settings", enable), ephemeral=True
+        )
 
     @discord.app_commands.checks.has_permissions(manage_messages=True)
     @discord.app_commands.checks.bot_has_permissions(manage_messages=True)
@@ -500,13 +511,17 @@ class ReflectCog(commands.GroupCog, name="reflect"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def disable(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Reflect is not enabled!"
 
             settings_data["enabled"] = False
 
-        await interaction.followup.send("Reflect disabled!", ephemeral=True)
+            return "Reflect disabled!"
+
+        await interaction.followup.send(
+            await update(COG, guild, "settings", disable), ephemeral=True
+        )
 
     @discord.app_commands.checks.has_permissions(manage_messages=True)
     @discord.app_commands.checks.bot_has_permissions(manage_messages=True)
@@ -521,14 +536,16 @@ class ReflectCog(commands.GroupCog, name="reflect"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def change_channel(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Reflect is not enabled!"
 
             settings_data["reflect_channel_id"] = reflect_channel.id
 
+            return f"Reflect channel changed to {reflect_channel.mention}!"
+
         await interaction.followup.send(
-            f"Reflect channel changed to {reflect_channel.mention}!", ephemeral=True
+            await update(COG, guild, "settings", change_channel), ephemeral=True
         )
 
     reflect_ignore_group = discord.app_commands.Group(
@@ -544,42 +561,20 @@ class ReflectCog(commands.GroupCog, name="reflect"):
     async def reflect_ignore_list(self, interaction: discord.Interaction):
         guild = interaction.guild
 
-        if not (settings_data := safe_read(COG, guild, "settings")):
-            await interaction.response.send_message(
-                "Reflect is not enabled!", ephemeral=True
-            )
-            return
-        if not settings_data.get("enabled", DEFAULT_REFLECT_COG_SETTINGS["enabled"]):
+        if not (settings := await self.settings.get(guild)).enabled:
             await interaction.response.send_message(
                 "Reflect is not enabled!", ephemeral=True
             )
             return
 
         ignored_channels = ", ".join(
-            [
-                f"<#{channel_id}>"
-                for channel_id in settings_data.get(
-                    "ignored_channel_ids",
-                    DEFAULT_REFLECT_COG_SETTINGS["ignored_channel_ids"],
-                )
-            ]
+            [f"<#{channel_id}>" for channel_id in settings.ignored_channel_ids]
         )
         ignored_roles = ", ".join(
-            [
-                f"<@&{role_id}>"
-                for role_id in settings_data.get(
-                    "ignored_role_ids", DEFAULT_REFLECT_COG_SETTINGS["ignored_role_ids"]
-                )
-            ]
+            [f"<@&{role_id}>" for role_id in settings.ignored_role_ids]
         )
         ignored_members = ", ".join(
-            [
-                f"<@{member_id}>"
-                for member_id in settings_data.get(
-                    "ignored_member_ids",
-                    DEFAULT_REFLECT_COG_SETTINGS["ignored_member_ids"],
-                )
-            ]
+            [f"<@{member_id}>" for member_id in settings.ignored_member_ids]
         )
 
         await interaction.response.send_message(
@@ -600,21 +595,20 @@ class ReflectCog(commands.GroupCog, name="reflect"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def ignore_member(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Reflect is not enabled!"
             if member.id in settings_data.get(
                 "ignored_member_ids", DEFAULT_REFLECT_COG_SETTINGS["ignored_member_ids"]
             ):
-                await interaction.followup.send(
-                    f"{member.mention} is already ignored!", ephemeral=True
-                )
-                return
+                return f"{member.mention} is already ignored!"
 
             settings_data["ignored_member_ids"].append(member.id)
 
+            return f"Now ignoring {member.mention}!"
+
         await interaction.followup.send(
-            f"Now ignoring {member.mention}!", ephemeral=True
+            await update(COG, guild, "settings", ignore_member), ephemeral=True
         )
 
     @discord.app_commands.checks.has_permissions(manage_messages=True)
@@ -630,22 +624,21 @@ class ReflectCog(commands.GroupCog, name="reflect"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def ignore_channel(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Reflect is not enabled!"
             if channel.id in settings_data.get(
                 "ignored_channel_ids",
                 DEFAULT_REFLECT_COG_SETTINGS["ignored_channel_ids"],
             ):
-                await interaction.followup.send(
-                    f"{channel.mention} is already ignored!", ephemeral=True
-                )
-                return
+                return f"{channel.mention} is already ignored!"
 
             settings_data["ignored_channel_ids"].append(channel.id)
 
+            return f"Now ignoring {channel.mention}!"
+
         await interaction.followup.send(
-            f"Now ignoring {channel.mention}!", ephemeral=True
+            await update(COG, guild, "settings", ignore_channel), ephemeral=True
         )
 
     @discord.app_commands.checks.has_permissions(manage_messages=True)
@@ -661,20 +654,21 @@ class ReflectCog(commands.GroupCog, name="reflect"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def ignore_role(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Reflect is not enabled!"
             if role.id in settings_data.get(
                 "ignored_role_ids", DEFAULT_REFLECT_COG_SETTINGS["ignored_role_ids"]
             ):
-                await interaction.followup.send(
-                    f"{role.mention} is already ignored!", ephemeral=True
-                )
-                return
+                return f"{role.mention} is already ignored!"
 
             settings_data["ignored_role_ids"].append(role.id)
 
-        await interaction.followup.send(f"Now ignoring {role.mention}!", ephemeral=True)
+            return f"Now ignoring {role.mention}!"
+
+        await interaction.followup.send(
+            await update(COG, guild, "settings", ignore_role), ephemeral=True
+        )
 
     reflect_unignore_group = discord.app_commands.Group(
         name="unignore",
@@ -694,21 +688,20 @@ class ReflectCog(commands.GroupCog, name="reflect"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def unignore_member(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Reflect is not enabled!"
             if not member.id in settings_data.get(
                 "ignored_member_ids", DEFAULT_REFLECT_COG_SETTINGS["ignored_member_ids"]
             ):
-                await interaction.followup.send(
-                    f"{member.mention} is not ignored!", ephemeral=True
-                )
-                return
+                return f"{member.mention} is not ignored!"
 
             settings_data["ignored_member_ids"].remove(member.id)
 
+            return f"No longer ignoring {member.mention}!"
+
         await interaction.followup.send(
-            f"No longer ignoring {member.mention}!", ephemeral=True
+            await update(COG, guild, "settings", unignore_member), ephemeral=True
         )
 
     @discord.app_commands.checks.has_permissions(manage_messages=True)
@@ -724,22 +717,21 @@ class ReflectCog(commands.GroupCog, name="reflect"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def unignore_channel(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Reflect is not enabled!"
             if not channel.id in settings_data.get(
                 "ignored_channel_ids",
                 DEFAULT_REFLECT_COG_SETTINGS["ignored_channel_ids"],
             ):
-                await interaction.followup.send(
-                    f"{channel.mention} is not ignored!", ephemeral=True
-                )
-                return
+                return f"{channel.mention} is not ignored!"
 
             settings_data["ignored_channel_ids"].remove(channel.id)
 
+            return f"No longer ignoring {channel.mention}!"
+
         await interaction.followup.send(
-            f"No longer ignoring {channel.mention}!", ephemeral=True
+            await update(COG, guild, "settings", unignore_channel), ephemeral=True
         )
 
     @discord.app_commands.checks.has_permissions(manage_messages=True)
@@ -755,33 +747,28 @@ class ReflectCog(commands.GroupCog, name="reflect"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "settings") as settings_data:
-            if not await self.cog_is_enabled(settings_data, interaction):
-                return
+        def unignore_role(settings_data: dict) -> str:
+            if not self.cog_is_enabled(settings_data):
+                return "Reflect is not enabled!"
             if not role.id in settings_data.get(
                 "ignored_role_ids", DEFAULT_REFLECT_COG_SETTINGS["ignored_role_ids"]
             ):
-                await interaction.followup.send(
-                    f"{role.mention} is not ignored!", ephemeral=True
-                )
-                return
+                return f"{role.mention} is not ignored!"
 
             settings_data["ignored_role_ids"].remove(role.id)
 
+            return f"No longer ignoring {role.mention}!"
+
         await interaction.followup.send(
-            f"No longer ignoring {role.mention}!", ephemeral=True
+            await update(COG, guild, "settings", unignore_role), ephemeral=True
         )
 
     @staticmethod
-    async def cog_is_enabled(settings_data: dict, interaction: discord.Interaction):
+    def cog_is_enabled(settings_data: dict) -> bool:
         if not settings_data:
-            await interaction.followup.send("Reflect is not enabled!", ephemeral=True)
-            return False
-        if not settings_data.get("enabled", DEFAULT_REFLECT_COG_SETTINGS["enabled"]):
-            await interaction.followup.send("Reflect is not enabled!", ephemeral=True)
             return False
 
-        return True
+        return settings_data.get("enabled", DEFAULT_REFLECT_COG_SETTINGS["enabled"])
 
 
 async def setup(bot: Mammoth):
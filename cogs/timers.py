@@ -1,6 +1,22 @@
 from discord.ext import commands, tasks
 from main import Mammoth
-from utils.storage import safe_read, safe_edit, update_dict_defaults
+from utils.storage import (
+    StorageDerivedView,
+    read,
+    safe_read,
+    safe_edit,
+    update,
+    update_dict_defaults,
+)
+from utils.schema import (
+    Schema,
+    boolean,
+    number,
+    optional_number,
+    optional_string,
+    parse_mapping,
+    snowflake,
+)
 import discord
 import json
 import time
@@ -10,6 +26,14 @@ import logging
 
 COG = __name__
 DEFAULT_TIMER_DATA = {}
+DEFAULT_TIMER_SETTINGS = {
+    "interval": None,
+    "message": None,
+    "last_run": 0,
+    "enabled": False,
+    "channel_id": None,
+    "last_message_id": None,
+}
 
 log = logging.getLogger(COG)
 
@@ -17,6 +41,32 @@ with open("./settings.json", "r") as r:
     SETTINGS = json.load(r)
 
 
+class TimerSettings(Schema):
+    FIELDS = {
+        "interval": optional_number,
+        "message": optional_string,
+        "last_run": number,
+        "enabled": boolean,
+        "channel_id": snowflake,
+        "last_message_id": snowflake,
+    }
+    DEFAULTS = DEFAULT_TIMER_SETTINGS
+
+    __slots__ = tuple(FIELDS)
+
+
+def compile_timers(timer_data: dict) -> dict:
+    return parse_mapping(TimerSettings, timer_data)
+
+
+def record_timer_run(timer_data: dict, timer: str, last_message_id: int):
+    if timer not in timer_data:
+        return
+
+    timer_data[timer]["last_message_id"] = last_message_id
+    timer_data[timer]["last_run"] = time.time()
+
+
 class NewTimerModal(discord.ui.Modal):
     def __init__(self):
         super().__init__(title="Create New Timer")
@@ -56,20 +106,13 @@ class NewTimerModal(discord.ui.Modal):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "timers") as timer_data:
+        def create_timer(timer_data: dict) -> str:
             if not timer_data:
                 update_dict_defaults(DEFAULT_TIMER_DATA, timer_data)
             if len(timer_data) >= 25:
-                await interaction.followup.send(
-                    "Timer limit of 25 reached! Please delete a timer before creating a new one.",
-                    ephemeral=True,
-                )
-                return
+                return "Timer limit of 25 reached! Please delete a timer before creating a new one."
             if self.name_input.value in timer_data:
-                await interaction.followup.send(
-                    f"``{self.name_input.value}`` already exists!", ephemeral=True
-                )
-                return
+                return f"``{self.name_input.value}`` already exists!"
 
             timer_data[self.name_input.value] = {
                 "interval": int(self.interval_input.value) * 60,
@@ -80,9 +123,10 @@ class NewTimerModal(discord.ui.Modal):
                 "last_message_id": None,
             }
 
+            return f"New timer created:\n\n**Name**: ``{self.name_input.value}``\n**Interval**: ``{self.interval_input.value} Minutes``\n**Message**: ``{self.message_input.value}``"
+
         await interaction.followup.send(
-            f"New timer created:\n\n**Name**: ``{self.name_input.value}``\n**Interval**: ``{self.interval_input.value} Minutes``\n**Message**: ``{self.message_input.value}``",
-            ephemeral=True,
+            await update(COG, guild, "timers", create_timer), ephemeral=True
         )
 
 
@@ -154,6 +198,7 @@ class EditTimerModal(discord.ui.Modal):
 class TimersCog(commands.GroupCog, name="timer"):
     def __init__(self, bot: Mammoth):
         self.bot = bot
+        self.timers = StorageDerivedView(COG, "timers", compile_timers)
 
         super().__init__()
 
@@ -163,50 +208,50 @@ class TimersCog(commands.GroupCog, name="timer"):
 
     def cog_unload(self):
         self.run_timers.cancel()
+        self.timers.close()
         log.info("Unloaded")
 
     @tasks.loop(seconds=15)
     async def run_timers(self):
         for guild in self.bot.guilds:
-            async with safe_edit(COG, guild, "timers") as timer_data:
-                if not timer_data:
+            timers = await self.timers.get(guild)
+
+            for timer, timer_settings in timers.items():
+                if not (channel := guild.get_channel(timer_settings.channel_id)):
+                    continue
+                if channel.last_message_id == timer_settings.last_message_id:
+                    continue
+                if not timer_settings.enabled:
+                    continue
+                if timer_settings.interval is None or not timer_settings.message:
+                    continue
+                if (time.time() - timer_settings.last_run) < timer_settings.interval:
                     continue
 
-                for timer in timer_data:
-                    if not (
-                        channel := guild.get_channel(timer_data[timer]["channel_id"])
-                    ):
-                        continue
-                    if channel.last_message_id == timer_data[timer]["last_message_id"]:
-                        continue
-                    if not timer_data[timer]["enabled"]:
+                try:
+                    new_last_message = await channel.send(timer_settings.message)
+                    old_last_message_id = timer_settings.last_message_id
+
+                    await update(
+                        COG,
+                        guild,
+                        "timers",
+                        lambda current_timer_data: record_timer_run(
+                            current_timer_data, timer, new_last_message.id
+                        ),
+                    )
+
+                    if not old_last_message_id:
                         continue
-                    if (time.time() - timer_data[timer]["last_run"]) < (
-                        timer_data[timer]["interval"]
+                    if not (
+                        last_message := await channel.fetch_message(old_last_message_id)
                     ):
                         continue
 
-                    try:
-                        new_last_message = await channel.send(
-                            timer_data[timer]["message"]
-                        )
-                        old_last_message_id = timer_data[timer]["last_message_id"]
-                        timer_data[timer]["last_message_id"] = new_last_message.id
-                        timer_data[timer]["last_run"] = time.time()
-
-                        if not old_last_message_id:
-                            continue
-                        if not (
-                            last_message := await channel.fetch_message(
-                                old_last_message_id
-                            )
-                        ):
-                            continue
-
-                        await last_message.delete()
-                    except Exception:
-                        log.exception(traceback.format_exc())
-                        continue
+                    await last_message.delete()
+                except Exception:
+                    log.exception(traceback.format_exc())
+                    continue
 
     @discord.app_commands.checks.has_permissions(manage_messages=True)
     @discord.app_commands.checks.bot_has_permissions(manage_messages=True)
@@ -225,7 +270,7 @@ class TimersCog(commands.GroupCog, name="timer"):
     @discord.app_commands.describe(name="Name of the timer to edit.")
     async def timer_edit(self, interaction: discord.Interaction, name: str):
         guild = interaction.guild
-        if not (timer_data := safe_read(COG, guild, "timers")) or not timer_data.get(
+        if not (timer_data := await read(COG, guild, "timers")) or not timer_data.get(
             name
         ):
             await interaction.response.send_message(f"``{name}`` does not exist!")
@@ -240,7 +285,7 @@ class TimersCog(commands.GroupCog, name="timer"):
         self, interaction: discord.Interaction, current: str
     ):
         guild = interaction.guild
-        timer_data = safe_read(COG, guild, "timers")
+        timer_data = await read(COG, guild, "timers")
 
         return [
             discord.app_commands.Choice(name=name, value=name)
@@ -259,24 +304,26 @@ class TimersCog(commands.GroupCog, name="timer"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        async with safe_edit(COG, guild, "timers") as timer_data:
+        def delete_timer(timer_data: dict) -> str:
             if not timer_data:
-                await interaction.followup.send(f"Timer ``{name}`` doesn't exist!")
-                return
+                return f"Timer ``{name}`` doesn't exist!"
             if name not in timer_data:
-                await interaction.followup.send(f"Timer ``{name}`` doesn't exist!")
-                return
+                return f"Timer ``{name}`` doesn't exist!"
 
             del timer_data[name]
 
-        await interaction.followup.send(f"Timer ``{name}`` deleted!")
+            return f"Timer ``{name}`` deleted!"
+
+        await interaction.followup.send(
+            await update(COG, guild, "timers", delete_timer)
+        )
 
     @timer_delete.autocomplete("name")
     async def timer_delete_autocomplete(
         self, interaction: discord.Interaction, current: str
     ):
         guild = interaction.guild
-        timer_data = safe_read(COG, guild, "timers")
+        timer_data = await read(COG, guild, "timers")
 
         return [
             discord.app_commands.Choice(name=name, value=name)
@@ -292,7 +339,7 @@ class TimersCog(commands.GroupCog, name="timer"):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        if not (timer_data := safe_read(COG, guild, "timers")):
+        if not (timer_data := await read(COG, guild, "timers")):
             await interaction.followup.send("No timers exist!")
             return
 
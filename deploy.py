@@ -32,6 +32,94 @@ parser.add_argument(
     required=False,
     help="Disable caching hashes.",
 )
+parser.add_argument(
+    "--storage-cache-size",
+    dest="storage_cache_megabytes",
+    type=int,
+    default=64,
+    required=False,
+    help="Memory budget in megabytes for the in-process storage cache.",
+)
+parser.add_argument(
+    "--storage-backend",
+    dest="storage_backend",
+    type=str,
+    choices=["json", "sqlite"],
+    default="json",
+    required=False,
+    help="Where bot data is stored: one JSON file per key, or a SQLite database.",
+)
+parser.add_argument(
+    "--storage-format",
+    dest="storage_format",
+    type=str,
+    choices=["json", "compact", "msgpack"],
+    default="compact",
+    required=False,
+    help="Encoding for stored data. msgpack requires the msgpack package; compact uses orjson when installed.",
+)
+parser.add_argument(
+    "--storage-durability",
+    dest="storage_durability",
+    type=str,
+    choices=["none", "batched", "write"],
+    default="none",
+    required=False,
+    help="When storage writes are fsynced: never (fastest, but edits from the last few seconds can be lost if the host crashes), grouped across concurrent edits, or on every write. batched and write hold the guild's storage lock until the flush completes.",
+)
+parser.add_argument(
+    "--storage-journal",
+    dest="storage_journal",
+    action="store_true",
+    required=False,
+    help="Append each json storage edit to a per-guild journal instead of rewriting the guild document, compacting it in the background.",
+)
+parser.add_argument(
+    "--storage-background-migration",
+    dest="storage_background_migration",
+    action="store_true",
+    required=False,
+    help="Serve guilds while storage migrations run in the background, migrating a guild on demand when it is first read.",
+)
+parser.add_argument(
+    "--storage-watch",
+    dest="storage_watch",
+    type=str,
+    choices=["off", "auto", "inotify", "poll"],
+    default="off",
+    required=False,
+    help="Watch the data directory for changes made by other processes: inotify where available (auto), or polling.",
+)
+parser.add_argument(
+    "--storage-preload",
+    dest="storage_preload",
+    action="store_true",
+    required=False,
+    help="Load every guild's stored data into the storage cache in the background once the bot is ready.",
+)
+parser.add_argument(
+    "--storage-gc",
+    dest="storage_gc",
+    action="store_true",
+    required=False,
+    help="Periodically remove stored data of guilds the bot left more than 30 days ago, prune old cached link hashes and compact journals.",
+)
+parser.add_argument(
+    "--download-concurrency",
+    dest="download_concurrency",
+    type=int,
+    default=32,
+    required=False,
+    help="Maximum number of media downloads in flight at once across all guilds.",
+)
+parser.add_argument(
+    "--hash-processes",
+    dest="hash_processes",
+    type=int,
+    default=min(4, os.cpu_count() or 1),
+    required=False,
+    help="Worker processes used to decode and hash images. 0 hashes on the bot's event loop.",
+)
 parser.add_argument(
     "--owner-ids",
     dest="owner_ids",
@@ -124,6 +212,17 @@ settings = {
     "ownerIDs": [],
     "asyncio_gather": True,
     "caching": True,
+    "storageCacheMegabytes": 64,
+    "storageBackend": "json",
+    "storageFormat": "compact",
+    "storageDurability": "none",
+    "storageJournal": False,
+    "storageBackgroundMigration": False,
+    "storageWatch": "off",
+    "storagePreload": False,
+    "storageGc": False,
+    "downloadConcurrency": 32,
+    "hashProcesses": 4,
     "debugPrinting": True,
     "spammyDebugPrinting": False,
     "dataPath": "",
@@ -137,6 +236,17 @@ def main(
     auto_restart,
     asyncio_gather,
     caching,
+    storage_cache_megabytes,
+    storage_backend,
+    storage_format,
+    storage_durability,
+    storage_journal,
+    storage_background_migration,
+    storage_watch,
+    storage_preload,
+    storage_gc,
+    download_concurrency,
+    hash_processes,
     owner_ids,
     debug_printing,
     spammy_debug_printing,
@@ -156,6 +266,17 @@ def main(
     settings["dataPath"] = f"{'' if docker_mode else '.'}/{deployment_id}_data"
     settings["asyncio_gather"] = asyncio_gather
     settings["caching"] = caching
+    settings["storageCacheMegabytes"] = storage_cache_megabytes
+    settings["storageBackend"] = storage_backend
+    settings["storageFormat"] = storage_format
+    settings["storageDurability"] = storage_durability
+    settings["storageJournal"] = storage_journal
+    settings["storageBackgroundMigration"] = storage_background_migration
+    settings["storageWatch"] = storage_watch
+    settings["storagePreload"] = storage_preload
+    settings["storageGc"] = storage_gc
+    settings["downloadConcurrency"] = download_concurrency
+    settings["hashProcesses"] = hash_processes
     settings["ownerIDs"] = owner_ids
     settings["debugPrinting"] = debug_printing
     settings["spammyDebugPrinting"] = spammy_debug_printing
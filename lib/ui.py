@@ -1,7 +1,7 @@
 from discord.ui import Button
-from utils.storage import safe_read, safe_edit, update_dict_defaults
+from utils.storage import safe_read, update, update_dict_defaults
 from utils.hash import LinkHash
-from cogs.blacklist import DEFAULT_HASH_BLACKLIST
+from cogs.blacklist import DEFAULT_HASH_BLACKLIST, HashBlacklist, hash_matches
 import discord
 
 
@@ -27,78 +27,50 @@ class HashBlacklistButton(Button):
         await self.unblacklist_mode(interaction)
 
     async def blacklist_mode(self, interaction: discord.Interaction):
-        guild = interaction.guild
-
-        async with safe_edit("global", guild, "hash_blacklist") as hash_blacklist_data:
-            if not hash_blacklist_data or not hash_blacklist_data.get(
-                "blacklist", DEFAULT_HASH_BLACKLIST["blacklist"]
-            ):
-                update_dict_defaults(DEFAULT_HASH_BLACKLIST, hash_blacklist_data)
-            if (
-                self.link_hash.md5 in hash_blacklist_data["blacklist"]
-                or self.link_hash.image_hash in hash_blacklist_data["blacklist"]
-            ):
-                self.update_mode()
-
-                await interaction.response.edit_message(view=self.view)
-
-                return
-
-            if self.link_hash.md5:
-                hash_blacklist_data["blacklist"].append(self.link_hash.md5)
-            if self.link_hash.image_hash:
-                hash_blacklist_data["blacklist"].append(self.link_hash.image_hash)
+        await update("global", interaction.guild, "hash_blacklist", self.add_hashes)
 
         self.update_mode()
 
         await interaction.response.edit_message(view=self.view)
 
     async def unblacklist_mode(self, interaction: discord.Interaction):
-        guild = interaction.guild
-
-        async with safe_edit("global", guild, "hash_blacklist") as hash_blacklist_data:
-            if not hash_blacklist_data or not hash_blacklist_data.get(
-                "blacklist", DEFAULT_HASH_BLACKLIST["blacklist"]
-            ):
-                self.update_mode()
-
-                await interaction.response.edit_message(view=self.view)
-
-                return
-            if not (
-                self.link_hash.md5 in hash_blacklist_data["blacklist"]
-                or self.link_hash.image_hash in hash_blacklist_data["blacklist"]
-            ):
-                self.update_mode()
-
-                await interaction.response.edit_message(view=self.view)
-
-                return
-
-            if self.link_hash.md5:
-                hash_blacklist_data["blacklist"].remove(self.link_hash.md5)
-            if self.link_hash.image_hash:
-                hash_blacklist_data["blacklist"].remove(self.link_hash.image_hash)
+        await update("global", interaction.guild, "hash_blacklist", self.remove_hashes)
 
         self.update_mode()
 
         await interaction.response.edit_message(view=self.view)
 
-    def update_mode(self):
-        if not (
-            hash_blacklist_data := safe_read(
-                "global", self.message.guild, "hash_blacklist"
-            )
+    def add_hashes(self, hash_blacklist_data: dict):
+        if not hash_blacklist_data or not hash_blacklist_data.get(
+            "blacklist", DEFAULT_HASH_BLACKLIST["blacklist"]
         ):
-            hash_blacklist_data = DEFAULT_HASH_BLACKLIST.copy()
-        if not hash_blacklist_data.get(
+            update_dict_defaults(DEFAULT_HASH_BLACKLIST, hash_blacklist_data)
+        if HashBlacklist.parse(hash_blacklist_data).matches(self.link_hash):
+            return
+
+        if self.link_hash.md5:
+            hash_blacklist_data["blacklist"].append(self.link_hash.md5)
+        if self.link_hash.image_hash:
+            hash_blacklist_data["blacklist"].append(self.link_hash.image_hash)
+
+    def remove_hashes(self, hash_blacklist_data: dict):
+        if not hash_blacklist_data or not hash_blacklist_data.get(
             "blacklist", DEFAULT_HASH_BLACKLIST["blacklist"]
         ):
-            hash_blacklist_data = DEFAULT_HASH_BLACKLIST.copy()
+            return
+
+        # Near matches are removed too, otherwise the media would stay blacklisted
+        hash_blacklist_data["blacklist"] = [
+            hash
+            for hash in hash_blacklist_data["blacklist"]
+            if not hash_matches(hash, self.link_hash)
+        ]
+
+    def update_mode(self):
+        hash_blacklist = HashBlacklist.parse(
+            safe_read("global", self.message.guild, "hash_blacklist")
+        )
 
         self.label = (
-            "Unblacklist"
-            if self.link_hash.md5 in hash_blacklist_data["blacklist"]
-            or self.link_hash.image_hash in hash_blacklist_data["blacklist"]
-            else "Blacklist"
+            "Unblacklist" if hash_blacklist.matches(self.link_hash) else "Blacklist"
         )
@@ -1,7 +1,13 @@
 from discord.ext.commands import Bot
 from discord import Intents
 from logging.handlers import RotatingFileHandler
-from utils.storage import migrate_storage
+from utils.migration import migrate
+from utils.storage import STORAGE_PRELOAD, preload
+from utils.cleanup import STORAGE_GC, run_collector, track_departure, untrack_departure
+from utils.watcher import start_watcher, stop_watcher
+from utils.download import start_download_client, stop_download_client
+from utils.imaging import start_image_hash_pool, stop_image_hash_pool
+import asyncio
 import json
 import os
 import contextlib
@@ -63,17 +69,51 @@ class Mammoth(Bot):
     def __init__(self):
         super().__init__("mm!", intents=Intents.all())
 
+        self.preload_task = None
+        self.collector_task = None
+        self.download_client = None
+        self.image_hash_pool = None
+
     async def on_ready(self):
         log.info(f"Logged in as {self.user}")
         log.info(
             f"Invite: https://discord.com/api/oauth2/authorize?client_id={self.user.id}&permissions=8&scope=bot%20applications.commands"
         )
 
+        if STORAGE_PRELOAD and self.preload_task is None:
+            self.preload_task = asyncio.create_task(
+                preload([0] + [guild.id for guild in self.guilds])
+            )
+        if STORAGE_GC and self.collector_task is None:
+            self.collector_task = asyncio.create_task(
+                run_collector([guild.id for guild in self.guilds])
+            )
+
+    async def on_guild_join(self, guild: discord.Guild):
+        if STORAGE_GC:
+            await untrack_departure(guild.id)
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        if STORAGE_GC:
+            await track_departure(guild.id)
+
     async def setup_hook(self):
-        migrate_storage()
+        await migrate()
+        start_watcher()
+        self.download_client = start_download_client()
+        self.image_hash_pool = start_image_hash_pool()
 
         await self.load_cogs()
 
+    async def close(self):
+        stop_watcher()
+
+        await super().close()
+        await stop_download_client()
+        self.download_client = None
+        stop_image_hash_pool()
+        self.image_hash_pool = None
+
     async def load_cogs(self):
         for cog in [
             f'cogs.{x[:x.find(".py")]}'
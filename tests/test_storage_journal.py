@@ -0,0 +1,74 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PHASE = """
+import asyncio
+import sys
+
+from utils import storage
+
+
+async def main(prefix):
+    if prefix == "show":
+        print(",".join(sorted(storage.load_document(1, True)["s"]["k"])))
+        return
+
+    for i in range(3):
+        async with storage.edit("s", 1, "k") as data:
+            data[f"{prefix}{i}"] = i
+
+
+asyncio.run(main(sys.argv[1]))
+"""
+
+
+class TornJournalTest(unittest.TestCase):
+    def run_phase(self, directory: str, phase: str) -> str:
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+
+        result = subprocess.run(
+            [sys.executable, "-c", PHASE, phase],
+            cwd=directory,
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout.strip()
+
+    def test_append_after_crash(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data_path = os.path.join(directory, "data")
+
+            with open(os.path.join(directory, "settings.json"), "w") as f:
+                json.dump(
+                    {
+                        "dataPath": data_path,
+                        "storageBackend": "json",
+                        "storageJournal": True,
+                    },
+                    f,
+                )
+
+            self.run_phase(directory, "a")
+
+            # A crash mid-append leaves a record without its newline
+            with open(os.path.join(data_path, "guilds", "1.log"), "ab") as f:
+                f.write(b'[["set",["s","k","c0"')
+
+            self.run_phase(directory, "b")
+
+            self.assertEqual(self.run_phase(directory, "show"), "a0,a1,a2,b0,b1,b2")
+
+
+if __name__ == "__main__":
+    unittest.main()
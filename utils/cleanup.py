@@ -0,0 +1,221 @@
+import asyncio
+import gzip
+import logging
+import os
+import time
+import traceback
+
+from utils import storage
+
+
+log = logging.getLogger(__name__)
+
+
+STORAGE_GC = storage.SETTINGS.get("storageGc", False)
+STORAGE_GC_INTERVAL_SECONDS = storage.SETTINGS.get("storageGcIntervalHours", 6) * 3600
+STORAGE_GC_GRACE_SECONDS = storage.SETTINGS.get("storageGcGraceDays", 30) * 86400
+STORAGE_GC_ARCHIVE = storage.SETTINGS.get("storageGcArchive", True)
+STORAGE_GC_GUILDS_PER_SECOND = storage.SETTINGS.get("storageGcGuildsPerSecond", 10)
+LINK_HASH_CACHE_SECONDS = storage.SETTINGS.get("linkHashCacheDays", 30) * 86400
+LINK_HASH_CACHE_MAX_ENTRIES = storage.SETTINGS.get("linkHashCacheMaxEntries", 10000)
+
+
+def mark_departed(departed_data: dict, guild_ids: list[int], now: float):
+    for guild_id in guild_ids:
+        departed_data.setdefault(str(guild_id), now)
+
+
+def mark_present(departed_data: dict, guild_ids: set[int]):
+    for guild_id in list(departed_data):
+        if int(guild_id) in guild_ids:
+            del departed_data[guild_id]
+
+
+async def track_departure(guild_id: int):
+    await storage.update(
+        "global",
+        0,
+        "departed_guilds",
+        lambda departed_data: mark_departed(departed_data, [guild_id], time.time()),
+    )
+
+
+async def untrack_departure(guild_id: int):
+    await storage.update(
+        "global",
+        0,
+        "departed_guilds",
+        lambda departed_data: mark_present(departed_data, {guild_id}),
+    )
+
+
+async def reconcile(present_guild_ids: list[int]):
+    present_guild_ids = set(present_guild_ids) | {0}
+    stored_guild_ids = await storage.run_in_storage_thread(
+        storage.storage_backend.guild_ids
+    )
+    departed_guild_ids = [
+        guild_id for guild_id in stored_guild_ids if guild_id not in present_guild_ids
+    ]
+
+    def reconcile_departed(departed_data: dict):
+        mark_present(departed_data, present_guild_ids)
+        mark_departed(departed_data, departed_guild_ids, time.time())
+
+    await storage.update("global", 0, "departed_guilds", reconcile_departed)
+
+    if departed_guild_ids:
+        log.info(f"{len(departed_guild_ids)} stored guilds are no longer joined")
+
+
+def prune_link_hash_cache(link_hash_cache_data: dict, now: float) -> int:
+    if not (cache := link_hash_cache_data.get("cache")):
+        return 0
+
+    added = link_hash_cache_data.setdefault("added", {})
+    expired = {
+        url
+        for url in cache
+        if now - added.setdefault(url, int(now)) > LINK_HASH_CACHE_SECONDS
+    }
+    remaining = [url for url in cache if url not in expired]
+    expired.update(remaining[: max(0, len(remaining) - LINK_HASH_CACHE_MAX_ENTRIES)])
+
+    for url in expired:
+        cache.pop(url, None)
+        added.pop(url, None)
+
+    for url in [url for url in added if url not in cache]:
+        del added[url]
+
+    return len(expired)
+
+
+class StorageCollector:
+    def __init__(self, guilds_per_second: float, grace_seconds: float, archive: bool):
+        self.delay = 1 / guilds_per_second
+        self.grace_seconds = grace_seconds
+        self.archive = archive
+        self.last_report = None
+
+    def archive_guild(self, guild_id: int, document: dict) -> int:
+        raw = gzip.compress(storage.encode_storage(document))
+        storage.commit_file(
+            f"{storage.DATA_PATH}/archive/{guild_id}.{int(time.time())}.gz", raw, True
+        )
+
+        return len(raw)
+
+    async def remove_guild(self, guild_id: int, report: dict):
+        backend = storage.storage_backend
+
+        async with storage.storage_locks.acquire(backend.lock_path(guild_id)):
+            document = await storage.run_in_storage_thread(
+                storage.load_document, guild_id, True, True
+            )
+
+            if self.archive and document:
+                report["bytes_reclaimed"] -= await storage.run_in_storage_thread(
+                    self.archive_guild, guild_id, document
+                )
+                report["archived"] += 1
+
+            report["bytes_reclaimed"] += await storage.run_in_storage_thread(
+                backend.delete, guild_id
+            )
+            storage.storage_cache.invalidate(guild_id)
+
+        await untrack_departure(guild_id)
+        report["removed"] += 1
+
+        log.info(f"Removed stored data for departed guild [{guild_id}]")
+
+    async def collect_guild(self, guild_id: int, report: dict):
+        backend = storage.storage_backend
+        size = await storage.run_in_storage_thread(backend.disk_size, guild_id)
+
+        if (await storage.read("global", guild_id, "url_to_link_hash_cache")).get(
+            "cache"
+        ):
+            report["pruned_entries"] += await storage.update(
+                "global",
+                guild_id,
+                "url_to_link_hash_cache",
+                lambda link_hash_cache_data: prune_link_hash_cache(
+                    link_hash_cache_data, time.time()
+                ),
+            )
+
+        if backend.journal and os.path.exists(backend.log_path(guild_id)):
+            if guild_id not in backend.compacting:
+                await backend.compact(guild_id)
+                report["compacted"] += 1
+
+        report["bytes_reclaimed"] += size - await storage.run_in_storage_thread(
+            backend.disk_size, guild_id
+        )
+
+    async def run(self) -> dict:
+        backend = storage.storage_backend
+        start = time.perf_counter()
+        now = time.time()
+        report = {
+            "guilds": 0,
+            "removed": 0,
+            "archived": 0,
+            "pruned_entries": 0,
+            "compacted": 0,
+            "deferred": 0,
+            "bytes_reclaimed": 0,
+        }
+
+        departed_data = await storage.read("global", 0, "departed_guilds")
+        guild_ids = await storage.run_in_storage_thread(backend.guild_ids)
+
+        for guild_id in guild_ids:
+            await asyncio.sleep(self.delay)
+
+            if backend.lock_path(guild_id) in storage.storage_locks.locks:
+                report["deferred"] += 1
+                continue
+
+            try:
+                departed = departed_data.get(str(guild_id))
+
+                if departed is not None and now - departed >= self.grace_seconds:
+                    await self.remove_guild(guild_id, report)
+                else:
+                    await self.collect_guild(guild_id, report)
+
+                report["guilds"] += 1
+            except Exception:
+                log.exception(traceback.format_exc())
+
+        report["seconds"] = time.perf_counter() - start
+        self.last_report = report
+
+        log.info(
+            f"Storage GC checked {report['guilds']} guilds in {report['seconds']:.1f}s: removed {report['removed']} departed ({report['archived']} archived), pruned {report['pruned_entries']} cached link hashes, compacted {report['compacted']} journals, reclaimed {report['bytes_reclaimed'] / 1048576:.2f}MB ({report['deferred']} deferred)"
+        )
+
+        return report
+
+
+storage_collector = StorageCollector(
+    STORAGE_GC_GUILDS_PER_SECOND, STORAGE_GC_GRACE_SECONDS, STORAGE_GC_ARCHIVE
+)
+
+
+async def run_collector(present_guild_ids: list[int]):
+    try:
+        await reconcile(present_guild_ids)
+    except Exception:
+        log.exception(traceback.format_exc())
+
+    while True:
+        try:
+            await storage_collector.run()
+        except Exception:
+            log.exception(traceback.format_exc())
+
+        await asyncio.sleep(STORAGE_GC_INTERVAL_SECONDS)
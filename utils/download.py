@@ -0,0 +1,327 @@
+import asyncio
+import contextlib
+import json
+import logging
+import random
+
+import aiohttp
+
+
+log = logging.getLogger(__name__)
+
+
+with open("./settings.json", "r") as r:
+    SETTINGS = json.load(r)
+
+
+DOWNLOAD_CONNECTIONS = SETTINGS.get("downloadConnections", 100)
+DOWNLOAD_CONNECTIONS_PER_HOST = SETTINGS.get("downloadConnectionsPerHost", 16)
+DOWNLOAD_CONCURRENCY = SETTINGS.get("downloadConcurrency", 32)
+DOWNLOAD_DNS_CACHE_SECONDS = SETTINGS.get("downloadDnsCacheSeconds", 300)
+DOWNLOAD_KEEPALIVE_SECONDS = SETTINGS.get("downloadKeepaliveSeconds", 30)
+DOWNLOAD_RETRY = SETTINGS.get("downloadRetry", {})
+
+DEFAULT_DOWNLOAD_RETRY = {
+    "attempts": 3,
+    "connectTimeoutSeconds": 5,
+    "readTimeoutSeconds": 15,
+    "totalTimeoutSeconds": 60,
+    "backoffSeconds": 0.5,
+    "backoffMaxSeconds": 5,
+}
+DEFAULT_FAIL_FAST_DOWNLOAD_RETRY = {
+    "attempts": 1,
+    "connectTimeoutSeconds": 2,
+    "readTimeoutSeconds": 5,
+    "totalTimeoutSeconds": 10,
+}
+DOWNLOAD_COUNTERS = (
+    "attempts",
+    "retries",
+    "timeouts",
+    "errors",
+    "failures",
+    "oversize",
+    "completed",
+)
+
+
+class RetryPolicy:
+    __slots__ = (
+        "attempts",
+        "connect_timeout",
+        "read_timeout",
+        "total_timeout",
+        "backoff",
+        "backoff_max",
+    )
+
+    def __init__(
+        self,
+        attempts: int,
+        connect_timeout: float,
+        read_timeout: float,
+        total_timeout: float,
+        backoff: float,
+        backoff_max: float,
+    ):
+        self.attempts = max(1, attempts)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+
+    @classmethod
+    def from_settings(cls, *settings: dict):
+        merged = {}
+
+        for overrides in (DEFAULT_DOWNLOAD_RETRY,) + settings:
+            merged.update(overrides)
+
+        return cls(
+            merged["attempts"],
+            merged["connectTimeoutSeconds"],
+            merged["readTimeoutSeconds"],
+            merged["totalTimeoutSeconds"],
+            merged["backoffSeconds"],
+            merged["backoffMaxSeconds"],
+        )
+
+    def timeout(self) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(
+            total=self.total_timeout,
+            sock_connect=self.connect_timeout,
+            sock_read=self.read_timeout,
+        )
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2**attempt))
+
+
+RETRY_POLICIES = {
+    media_type: RetryPolicy.from_settings(
+        DOWNLOAD_RETRY.get("default", {}), DOWNLOAD_RETRY.get(media_type, {})
+    )
+    for media_type in ("default", "image", "video", "audio")
+}
+FAIL_FAST_RETRY_POLICIES = {
+    media_type: RetryPolicy.from_settings(
+        DOWNLOAD_RETRY.get("default", {}),
+        DOWNLOAD_RETRY.get(media_type, {}),
+        DEFAULT_FAIL_FAST_DOWNLOAD_RETRY,
+        DOWNLOAD_RETRY.get("failFast", {}),
+    )
+    for media_type in RETRY_POLICIES
+}
+
+download_counters = {}
+
+
+def count_download(media_type: str, counter: str):
+    counters = download_counters.setdefault(
+        media_type or "other", dict.fromkeys(DOWNLOAD_COUNTERS, 0)
+    )
+    counters[counter] += 1
+
+
+def retry_policy(media_type: str, policies: dict = None) -> RetryPolicy:
+    policies = policies or RETRY_POLICIES
+
+    return policies.get(media_type) or policies["default"]
+
+
+class DownloadClient:
+    def __init__(
+        self,
+        connections: int,
+        connections_per_host: int,
+        concurrency: int,
+        dns_cache_seconds: float,
+        keepalive_seconds: float,
+    ):
+        self.connections = connections
+        self.connections_per_host = connections_per_host
+        self.concurrency = concurrency
+        self.dns_cache_seconds = dns_cache_seconds
+        self.keepalive_seconds = keepalive_seconds
+        self.session = None
+        self.semaphore = None
+
+        self.counters = {
+            "requests": 0,
+            "waiting": 0,
+            "active": 0,
+            "peak_active": 0,
+            "connections_created": 0,
+            "connections_reused": 0,
+            "connection_queued": 0,
+            "dns_cache_hits": 0,
+            "dns_cache_misses": 0,
+        }
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        def count(counter: str):
+            async def on_signal(session, context, params):
+                self.counters[counter] += 1
+
+            return on_signal
+
+        trace_config.on_connection_create_end.append(count("connections_created"))
+        trace_config.on_connection_reuseconn.append(count("connections_reused"))
+        trace_config.on_connection_queued_start.append(count("connection_queued"))
+        trace_config.on_dns_cache_hit.append(count("dns_cache_hits"))
+        trace_config.on_dns_cache_miss.append(count("dns_cache_misses"))
+
+        return trace_config
+
+    def start(self):
+        if self.session is not None and not self.session.closed:
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit=self.connections,
+            limit_per_host=self.connections_per_host,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_seconds,
+            keepalive_timeout=self.keepalive_seconds,
+            enable_cleanup_closed=True,
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector, trace_configs=[self.trace_config()]
+        )
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+        log.info(
+            f"Download pool started with {self.connections} connections ({self.connections_per_host} per host) and {self.concurrency} concurrent downloads"
+        )
+
+    async def close(self):
+        if self.session is None:
+            return
+
+        session, self.session = self.session, None
+
+        await session.close()
+        # Lets the SSL transports finish closing before the loop goes away
+        await asyncio.sleep(0.25)
+
+        log.info("Download pool closed")
+
+    @contextlib.asynccontextmanager
+    async def get(self, url: str, **kwargs):
+        self.start()
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        timeout = kwargs.get("timeout")
+        total = timeout.total if isinstance(timeout, aiohttp.ClientTimeout) else None
+
+        self.counters["waiting"] += 1
+
+        try:
+            # Waiting for a download slot counts against the request's total deadline
+            await asyncio.wait_for(self.semaphore.acquire(), total)
+        finally:
+            self.counters["waiting"] -= 1
+
+        if total:
+            if (remaining := total - (loop.time() - start)) <= 0:
+                self.semaphore.release()
+                raise asyncio.TimeoutError
+
+            kwargs["timeout"] = aiohttp.ClientTimeout(
+                total=remaining,
+                connect=timeout.connect,
+                sock_connect=timeout.sock_connect,
+                sock_read=timeout.sock_read,
+            )
+
+        self.counters["requests"] += 1
+        self.counters["active"] += 1
+        self.counters["peak_active"] = max(
+            self.counters["peak_active"], self.counters["active"]
+        )
+
+        try:
+            async with self.session.get(url, **kwargs) as response:
+                yield response
+        finally:
+            self.counters["active"] -= 1
+            self.semaphore.release()
+
+    def stats(self) -> dict:
+        stats = dict(self.counters)
+        connector = self.session.connector if self.session is not None else None
+
+        if connector is not None:
+            stats["connections_open"] = len(getattr(connector, "_acquired", ()))
+            stats["connections_idle"] = sum(
+                len(connections)
+                for connections in getattr(connector, "_conns", {}).values()
+            )
+
+        return stats
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        reused = stats["connections_reused"]
+        created = stats["connections_created"]
+
+        lines = [
+            f"requests {stats['requests']}, active {stats['active']}/{self.concurrency} (peak {stats['peak_active']}), waiting {stats['waiting']}",
+            f"connections created {created}, reused {reused} ({reused / max(1, created + reused):.1%}), queued {stats['connection_queued']}",
+            f"dns cache hits {stats['dns_cache_hits']}, misses {stats['dns_cache_misses']}",
+        ]
+
+        if "connections_open" in stats:
+            lines.append(
+                f"connections open {stats['connections_open']}, idle {stats['connections_idle']}, limit {self.connections} ({self.connections_per_host} per host)"
+            )
+
+        for media_type, counters in sorted(download_counters.items()):
+            lines.append(
+                f"{media_type}: "
+                + ", ".join(
+                    f"{counter} {counters[counter]}" for counter in DOWNLOAD_COUNTERS
+                )
+            )
+
+        return "\n".join(lines)
+
+
+download_client = None
+
+
+def start_download_client() -> DownloadClient:
+    global download_client
+
+    if download_client is None:
+        download_client = DownloadClient(
+            DOWNLOAD_CONNECTIONS,
+            DOWNLOAD_CONNECTIONS_PER_HOST,
+            DOWNLOAD_CONCURRENCY,
+            DOWNLOAD_DNS_CACHE_SECONDS,
+            DOWNLOAD_KEEPALIVE_SECONDS,
+        )
+
+    download_client.start()
+
+    return download_client
+
+
+def get_download_client() -> DownloadClient:
+    if download_client is None or download_client.session is None:
+        return start_download_client()
+
+    return download_client
+
+
+async def stop_download_client():
+    global download_client
+
+    if download_client is not None:
+        await download_client.close()
+        download_client = None
@@ -1,35 +1,60 @@
 from dataclasses import dataclass
 from typing import Optional, Tuple
 from utils.link import get_media_sorted_links_from_message, MediaSortedLinks
-from PIL import Image
-from utils.storage import safe_read, safe_edit, update_dict_defaults
-import imagehash
+from utils.storage import read, safe_edit, update_dict_defaults
+from utils.download import (
+    RETRY_POLICIES,
+    count_download,
+    get_download_client,
+    retry_policy,
+)
+from utils.imaging import get_image_hash_pool
 import discord
 import aiohttp
 import asyncio
 import hashlib
-import io
 import json
+import logging
+import time
+import traceback
 
 
 DEFAULT_URL_TO_LINK_HASH_CACHE = {"cache": {}}
+DEFAULT_DOWNLOAD_MAX_MEGABYTES = {"image": 25, "video": 100, "audio": 50}
+
+log = logging.getLogger(__name__)
 
 
 with open("./settings.json", "r") as r:
     SETTINGS = json.load(r)
 
 
+DOWNLOAD_MAX_BYTES = {
+    media_type: megabytes * 1048576
+    for media_type, megabytes in {
+        **DEFAULT_DOWNLOAD_MAX_MEGABYTES,
+        **SETTINGS.get("downloadMaxMegabytes", {}),
+    }.items()
+}
+DOWNLOAD_CHUNK_BYTES = SETTINGS.get("downloadChunkKilobytes", 64) * 1024
+
+
 @dataclass(frozen=True)
 class LinkHash:
     link: str
     md5: Optional[str]
     image_hash: Optional[str]
     media_type: str = None or "image" or "video" or "audio"
+    oversize: bool = False
 
     @classmethod
     def from_dict(cls, data: dict):
         return cls(**data)
 
+    @property
+    def download_failed(self) -> bool:
+        return self.md5 is None and not self.oversize
+
 
 @dataclass(frozen=True)
 class MediaSortedLinkHashes:
@@ -39,42 +64,96 @@ class MediaSortedLinkHashes:
     other_link_hashes: list[LinkHash]
 
 
+async def read_link_data(response, media_type: str):
+    max_bytes = DOWNLOAD_MAX_BYTES.get(media_type, DOWNLOAD_MAX_BYTES["video"])
+
+    if response.content_length is not None and response.content_length > max_bytes:
+        return None, None, True
+
+    digest = hashlib.md5()
+    chunks = [] if media_type == "image" else None
+    size = 0
+
+    async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_BYTES):
+        size += len(chunk)
+
+        if size > max_bytes:
+            return None, None, True
+
+        digest.update(chunk)
+
+        if chunks is not None:
+            chunks.append(chunk)
+
+    return digest.hexdigest(), b"".join(chunks) if chunks else None, False
+
+
 async def get_link_hash(
-    link: str, media_type: str = None or "image" or "video" or "audio"
+    link: str,
+    media_type: str = None or "image" or "video" or "audio",
+    retry_policies: dict = RETRY_POLICIES,
 ):
+    policy = retry_policy(media_type, retry_policies)
     md5_hash = None
     image_hash = None
+    data = None
+    oversize = False
 
-    while True:
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(link) as response:
-                    data = await response.read()
-
-                    try:
-                        md5_hash = hashlib.md5(data).hexdigest()
-                        md5_hash = f"{md5_hash}"
-                    except:
-                        pass
-
-                    try:
-                        image = Image.open(io.BytesIO(data))
-                        image_hash = imagehash.average_hash(image)
-                        image_hash = f"{image_hash}"
-                    except:
-                        pass
+    for attempt in range(policy.attempts):
+        if attempt:
+            count_download(media_type, "retries")
+            await asyncio.sleep(policy.delay(attempt))
+
+        count_download(media_type, "attempts")
 
+        try:
+            async with get_download_client().get(
+                link, timeout=policy.timeout()
+            ) as response:
+                if response.status == 429 or response.status >= 500:
+                    count_download(media_type, "errors")
+                    log.debug(f"Got {response.status} for [{link}], retrying")
+                    continue
+                if response.status >= 400:
+                    count_download(media_type, "failures")
+                    log.debug(f"Got {response.status} for [{link}], not retrying")
                     break
+
+                md5_hash, data, oversize = await read_link_data(response, media_type)
+
+            if oversize:
+                count_download(media_type, "oversize")
+                log.info(
+                    f"Skipped hashing [{link}], larger than {DOWNLOAD_MAX_BYTES.get(media_type, DOWNLOAD_MAX_BYTES['video']) // 1048576}MB"
+                )
+            else:
+                count_download(media_type, "completed")
+
+            break
         except asyncio.TimeoutError:
-            pass
+            count_download(media_type, "timeouts")
+            log.debug(f"Timed out downloading [{link}] on attempt {attempt + 1}")
+        except aiohttp.ClientError:
+            count_download(media_type, "errors")
+            log.debug(f"Failed downloading [{link}] on attempt {attempt + 1}")
         except Exception:
+            count_download(media_type, "failures")
+            log.exception(traceback.format_exc())
             break
+    else:
+        count_download(media_type, "failures")
+        log.info(f"Gave up downloading [{link}] after {policy.attempts} attempts")
+
+    if data:
+        image_hash = await get_image_hash_pool().image_hash(data)
 
-    return LinkHash(link, md5_hash, image_hash, media_type)
+    return LinkHash(link, md5_hash, image_hash, media_type, oversize)
 
 
 async def get_media_sorted_link_hashes_from_media_sorted_links(
-    media_sorted_links: MediaSortedLinks, guild: discord.Guild
+    media_sorted_links: MediaSortedLinks,
+    guild: discord.Guild,
+    retry_policies: dict = RETRY_POLICIES,
 ):
     image_link_hashes = []
     video_link_hashes = []
@@ -84,23 +163,23 @@ async def get_media_sorted_link_hashes_from_media_sorted_links(
 
     if SETTINGS["caching"]:
         if not (
-            temp_url_to_link_hash_cache_data := safe_read(
+            temp_url_to_link_hash_cache_data := await read(
                 "global", guild, "url_to_link_hash_cache"
             )
         ) or not temp_url_to_link_hash_cache_data.get(
             "cache", DEFAULT_URL_TO_LINK_HASH_CACHE["cache"]
         ):
-            temp_url_to_link_hash_cache_data = DEFAULT_URL_TO_LINK_HASH_CACHE.copy()
+            temp_url_to_link_hash_cache_data = {"cache": {}}
     else:
-        temp_url_to_link_hash_cache_data = DEFAULT_URL_TO_LINK_HASH_CACHE.copy()
+        temp_url_to_link_hash_cache_data = {"cache": {}}
 
     for link in media_sorted_links.image_links:
         if not (link_hash_data := temp_url_to_link_hash_cache_data["cache"].get(link)):
             if SETTINGS["asyncio_gather"]:
-                tasks.append(get_link_hash(link, "image"))
+                tasks.append(get_link_hash(link, "image", retry_policies))
                 continue
 
-            link_hash = await get_link_hash(link, "image")
+            link_hash = await get_link_hash(link, "image", retry_policies)
             temp_url_to_link_hash_cache_data["cache"][link] = link_hash
         else:
             link_hash = LinkHash.from_dict(link_hash_data)
@@ -109,10 +188,10 @@ async def get_media_sorted_link_hashes_from_media_sorted_links(
     for link in media_sorted_links.video_links:
         if not (link_hash_data := temp_url_to_link_hash_cache_data["cache"].get(link)):
             if SETTINGS["asyncio_gather"]:
-                tasks.append(get_link_hash(link, "video"))
+                tasks.append(get_link_hash(link, "video", retry_policies))
                 continue
 
-            link_hash = await get_link_hash(link, "video")
+            link_hash = await get_link_hash(link, "video", retry_policies)
             temp_url_to_link_hash_cache_data["cache"][link] = link_hash
         else:
             link_hash = LinkHash.from_dict(link_hash_data)
@@ -121,10 +200,10 @@ async def get_media_sorted_link_hashes_from_media_sorted_links(
     for link in media_sorted_links.audio_links:
         if not (link_hash_data := temp_url_to_link_hash_cache_data["cache"].get(link)):
             if SETTINGS["asyncio_gather"]:
-                tasks.append(get_link_hash(link, "audio"))
+                tasks.append(get_link_hash(link, "audio", retry_policies))
                 continue
 
-            link_hash = await get_link_hash(link, "audio")
+            link_hash = await get_link_hash(link, "audio", retry_policies)
             temp_url_to_link_hash_cache_data["cache"][link] = link_hash
         else:
             link_hash = LinkHash.from_dict(link_hash_data)
@@ -160,8 +239,13 @@ async def get_media_sorted_link_hashes_from_media_sorted_links(
                 )
 
             for url, link_hash in temp_url_to_link_hash_cache_data["cache"].items():
+                if isinstance(link_hash, LinkHash) and link_hash.download_failed:
+                    continue
                 if not url_to_link_hash_cache_data["cache"].get(url):
                     url_to_link_hash_cache_data["cache"][url] = link_hash.__dict__
+                    url_to_link_hash_cache_data.setdefault("added", {})[url] = int(
+                        time.time()
+                    )
 
             for url, link_hash in url_to_link_hash_cache_data["cache"].items():
                 if isinstance(link_hash, LinkHash):
@@ -172,11 +256,13 @@ async def get_media_sorted_link_hashes_from_media_sorted_links(
     )
 
 
-async def get_media_sorted_link_hashes_from_message(message: discord.Message):
+async def get_media_sorted_link_hashes_from_message(
+    message: discord.Message, retry_policies: dict = RETRY_POLICIES
+):
     media_sorted_links = get_media_sorted_links_from_message(message)
     media_sorted_link_hashes = (
         await get_media_sorted_link_hashes_from_media_sorted_links(
-            media_sorted_links, message.guild
+            media_sorted_links, message.guild, retry_policies
         )
     )
 
@@ -0,0 +1,139 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+import imagehash
+import asyncio
+import io
+import json
+import logging
+import multiprocessing
+import os
+
+
+log = logging.getLogger(__name__)
+
+
+with open("./settings.json", "r") as r:
+    SETTINGS = json.load(r)
+
+
+HASH_PROCESSES = SETTINGS.get("hashProcesses", min(4, os.cpu_count() or 1))
+IMAGE_MAX_PIXELS = SETTINGS.get("imageMaxPixels", Image.MAX_IMAGE_PIXELS)
+IMAGE_DRAFT_SIZE = SETTINGS.get("imageDraftSize", 128)
+IMAGE_HASH_TOLERANCE = SETTINGS.get("imageHashTolerance", 1)
+
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+
+def open_image(data: bytes, draft_size: int = IMAGE_DRAFT_SIZE) -> Image.Image:
+    image = Image.open(io.BytesIO(data))
+
+    if image.width * image.height > IMAGE_MAX_PIXELS:
+        raise Image.DecompressionBombError(
+            f"{image.width}x{image.height} is more than {IMAGE_MAX_PIXELS} pixels"
+        )
+
+    if not draft_size:
+        return image
+
+    image.draft("L", (draft_size, draft_size))
+
+    return image
+
+
+def image_hash_from_bytes(data: bytes, draft_size: int = IMAGE_DRAFT_SIZE):
+    try:
+        image = open_image(data, draft_size)
+        image_hash = imagehash.average_hash(image)
+    except Exception:
+        return None
+
+    return f"{image_hash}"
+
+
+def image_hash_bits(image_hash: str):
+    if len(image_hash) != 16:
+        return None
+
+    try:
+        return int(image_hash, 16)
+    except ValueError:
+        return None
+
+
+def image_hash_distance(image_hash_bits: int, other_image_hash_bits: int) -> int:
+    return (image_hash_bits ^ other_image_hash_bits).bit_count()
+
+
+class ImageHashPool:
+    def __init__(self, processes: int):
+        self.processes = processes
+        self.executor = None
+
+    def start(self):
+        if self.processes <= 0 or self.executor is not None:
+            return
+
+        # Forking the bot would copy its threads, sockets and caches into every worker
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+        )
+
+        log.info(f"Image hash pool started with {self.processes} processes")
+
+    def close(self):
+        if self.executor is None:
+            return
+
+        executor, self.executor = self.executor, None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        log.info("Image hash pool closed")
+
+    async def image_hash(self, data: bytes):
+        if self.executor is None:
+            return image_hash_from_bytes(data)
+
+        executor = self.executor
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, image_hash_from_bytes, data
+            )
+        except BrokenProcessPool:
+            if self.executor is executor:
+                log.warning("Image hash pool broke, restarting it")
+
+                self.close()
+                self.start()
+
+            return image_hash_from_bytes(data)
+
+
+image_hash_pool = None
+
+
+def start_image_hash_pool() -> ImageHashPool:
+    global image_hash_pool
+
+    if image_hash_pool is None:
+        image_hash_pool = ImageHashPool(HASH_PROCESSES)
+
+    image_hash_pool.start()
+
+    return image_hash_pool
+
+
+def get_image_hash_pool() -> ImageHashPool:
+    if image_hash_pool is None:
+        return start_image_hash_pool()
+
+    return image_hash_pool
+
+
+def stop_image_hash_pool():
+    global image_hash_pool
+
+    if image_hash_pool is not None:
+        image_hash_pool.close()
+        image_hash_pool = None
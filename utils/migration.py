@@ -0,0 +1,589 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
+import logging
+import os
+import time
+import traceback
+import json
+import pickle
+import threading
+
+from utils import storage
+
+
+log = logging.getLogger(__name__)
+
+
+STORAGE_MIGRATION_WORKERS = storage.SETTINGS.get("storageMigrationWorkers", 8)
+STORAGE_MIGRATION_PROGRESS_SECONDS = storage.SETTINGS.get(
+    "storageMigrationProgressSeconds", 5
+)
+STORAGE_BACKGROUND_MIGRATION = storage.SETTINGS.get("storageBackgroundMigration", False)
+
+
+def read_version_data(dry_run: bool = False) -> dict:
+    if not os.path.exists(f"{storage.DATA_PATH}/version.json"):
+        if dry_run:
+            return {"version": 0}
+
+        os.makedirs(storage.DATA_PATH, exist_ok=True)
+        write_version_data({"version": 0})
+
+    with open(f"{storage.DATA_PATH}/version.json", "r") as r:
+        return json.load(r)
+
+
+def write_version_data(version_data: dict):
+    storage.commit_file(
+        f"{storage.DATA_PATH}/version.json", storage.encode_json(version_data), True
+    )
+
+
+def read_version_zero_data(base_path, file_path):
+    log.debug(f"Read-only request for [{file_path}]")
+
+    """ Load the storage object """
+
+    log.debug(f"Loading [{file_path}]...")
+
+    if not os.path.exists(file_path):
+        os.makedirs(base_path, exist_ok=True)
+        log.debug(f"File was not found [{file_path}], creating empty StorageObject")
+
+        storage_object = storage.StorageObject()
+    else:
+        try:
+            with open(file_path, "rb") as rb:
+                loaded_object = pickle.load(rb)
+        except Exception as e:
+            log.debug(f"Failed to load [{file_path}]\n\n{e}\n")
+
+            loaded_object = storage.StorageObject()
+
+        if not isinstance(loaded_object, storage.StorageObject):
+            log.debug(
+                f"File is not StorageObject [{file_path}], creating empty StorageObject"
+            )
+
+            storage_object = storage.StorageObject()
+
+        log.debug(f"Loaded [{file_path}]")
+
+        storage_object = loaded_object
+
+    """ Return the storage object """
+
+    log.debug(f"Returning [{file_path}]")
+    return storage_object
+
+
+def quarantine_file(file_path: str):
+    quarantine_path = f"{storage.DATA_PATH}/quarantine/{os.path.relpath(file_path, storage.DATA_PATH)}"
+
+    os.makedirs(os.path.dirname(quarantine_path), exist_ok=True)
+    os.replace(file_path, quarantine_path)
+
+    return quarantine_path
+
+
+class MigrationCheckpoint:
+    def __init__(self, name: str, dry_run: bool):
+        self.path = f"{storage.DATA_PATH}/migrations/{name}.checkpoint"
+        self.dry_run = dry_run
+        self.lock = threading.Lock()
+        self.completed = set()
+        self.file = None
+
+        if os.path.exists(self.path):
+            with open(self.path, "r") as r:
+                self.completed = {
+                    line.rstrip("\n") for line in r if line.endswith("\n")
+                }
+
+    def __contains__(self, entry: str) -> bool:
+        return entry in self.completed
+
+    def mark(self, entry: str):
+        with self.lock:
+            self.completed.add(entry)
+
+            if self.dry_run:
+                return
+            if self.file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.file = open(self.path, "a")
+
+            self.file.write(f"{entry}\n")
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def remove(self):
+        self.close()
+
+        if not self.dry_run and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class MigrationStep:
+    name = None
+    from_version = None
+
+    def applies(self, version_data: dict) -> bool:
+        return version_data["version"] == self.from_version
+
+    def units(self) -> dict:
+        return {}
+
+    def guild_unit(self, guild_id: int):
+        return storage.guild_directories(guild_id) or None
+
+    def migrate_unit(self, unit, checkpoint: MigrationCheckpoint, dry_run: bool) -> int:
+        return 0
+
+    def finish(self, version_data: dict, dry_run: bool):
+        if self.from_version is not None:
+            version_data["version"] = self.from_version + 1
+        if not dry_run:
+            write_version_data(version_data)
+
+
+class ZeroToOneStep(MigrationStep):
+    name = "zero_to_one"
+    from_version = 0
+
+    def units(self) -> dict:
+        return {
+            guild_id: [
+                (scope, path) for scope, path in directories if scope != "global"
+            ]
+            for guild_id, directories in storage.list_guild_directories().items()
+        }
+
+    def guild_unit(self, guild_id: int):
+        return [
+            (scope, path)
+            for scope, path in storage.guild_directories(guild_id)
+            if scope != "global"
+        ] or None
+
+    def migrate_unit(self, unit, checkpoint: MigrationCheckpoint, dry_run: bool) -> int:
+        migrated = 0
+
+        for _, base_path in unit:
+            for file_name in os.listdir(base_path):
+                if not file_name.endswith(".pickle"):
+                    continue
+
+                file_path = f"{base_path}/{file_name}"
+
+                if file_path in checkpoint:
+                    continue
+
+                data = read_version_zero_data(base_path, file_path).get()
+
+                if not dry_run:
+                    storage.commit_file(
+                        file_path.replace(".pickle", ".json"),
+                        storage.encode_json(data),
+                        False,
+                    )
+
+                checkpoint.mark(file_path)
+                migrated += 1
+
+        return migrated
+
+
+class OneToTwoStep(MigrationStep):
+    name = "one_to_two"
+    from_version = 1
+
+    def units(self) -> dict:
+        guild_ids = set(storage.list_guild_directories())
+
+        if isinstance(storage.storage_backend, storage.SQLiteStorageBackend):
+            guild_ids.update(storage.storage_backend.legacy_guild_ids())
+
+        return {guild_id: guild_id for guild_id in guild_ids}
+
+    def guild_unit(self, guild_id: int):
+        return guild_id
+
+    def migrate_unit(self, unit, checkpoint: MigrationCheckpoint, dry_run: bool) -> int:
+        backend = storage.JSONStorageBackend()
+        document = loaded[0] if (loaded := backend.load(unit)) else {}
+        merged = []
+
+        for scope, base_path in storage.guild_directories(unit):
+            for file_name in os.listdir(base_path):
+                if not file_name.endswith(".json"):
+                    continue
+
+                file_path = f"{base_path}/{file_name}"
+
+                try:
+                    with open(file_path, "rb") as rb:
+                        data = storage.decode_data(rb.read())
+                except ValueError:
+                    if dry_run:
+                        log.error(
+                            f"Could not decode [{file_path}], it would be quarantined"
+                        )
+                    else:
+                        log.error(
+                            f"Could not decode [{file_path}], quarantined to [{quarantine_file(file_path)}]"
+                        )
+
+                    continue
+
+                document.setdefault(scope, {})[file_name[:-5]] = data
+                merged.append(file_path)
+
+        if merged and not dry_run:
+            backend.write_snapshot(unit, document)
+
+            for merged_path in merged:
+                os.remove(merged_path)
+                checkpoint.mark(merged_path)
+
+            for _, base_path in storage.guild_directories(unit):
+                if not os.listdir(base_path):
+                    os.rmdir(base_path)
+
+        if isinstance(storage.storage_backend, storage.SQLiteStorageBackend):
+            return len(merged) + storage.storage_backend.fold_legacy_rows(unit, dry_run)
+
+        return len(merged)
+
+    def finish(self, version_data: dict, dry_run: bool):
+        if not dry_run:
+            for scope in os.listdir(storage.DATA_PATH):
+                if scope in storage.RESERVED_DIRECTORIES:
+                    continue
+                if os.path.isdir(root_path := f"{storage.DATA_PATH}/{scope}"):
+                    if not os.listdir(root_path):
+                        os.rmdir(root_path)
+
+            if isinstance(storage.storage_backend, storage.SQLiteStorageBackend):
+                storage.storage_backend.drop_legacy_rows()
+
+        super().finish(version_data, dry_run)
+
+
+class SQLiteImportStep(MigrationStep):
+    name = "sqlite_import"
+
+    def applies(self, version_data: dict) -> bool:
+        return (
+            isinstance(storage.storage_backend, storage.SQLiteStorageBackend)
+            and version_data["version"] == storage.CURRENT_STORAGE_VERSION
+            and not storage.storage_backend.is_json_imported()
+        )
+
+    def units(self) -> dict:
+        return {
+            guild_id: guild_id for guild_id in storage.JSONStorageBackend().guild_ids()
+        }
+
+    def guild_unit(self, guild_id: int):
+        return guild_id
+
+    def migrate_unit(self, unit, checkpoint: MigrationCheckpoint, dry_run: bool) -> int:
+        if not (loaded := storage.JSONStorageBackend().load(unit)):
+            return 0
+        if not dry_run:
+            storage.storage_backend.import_documents(
+                [(unit, storage.encode_storage(loaded[0]))]
+            )
+
+        return 1
+
+    def finish(self, version_data: dict, dry_run: bool):
+        if not dry_run:
+            storage.storage_backend.mark_json_imported()
+
+
+class FormatStep(MigrationStep):
+    name = "format"
+
+    def applies(self, version_data: dict) -> bool:
+        return (
+            version_data["version"] == storage.CURRENT_STORAGE_VERSION
+            and version_data.get("format", "json") != storage.STORAGE_FORMAT
+        )
+
+    def units(self) -> dict:
+        return {guild_id: guild_id for guild_id in storage.storage_backend.guild_ids()}
+
+    def guild_unit(self, guild_id: int):
+        return guild_id
+
+    def migrate_unit(self, unit, checkpoint: MigrationCheckpoint, dry_run: bool) -> int:
+        try:
+            converted, _ = storage.storage_backend.convert_guild(unit, dry_run)
+        except FileNotFoundError:
+            return 0
+
+        return converted
+
+    def finish(self, version_data: dict, dry_run: bool):
+        version_data["format"] = storage.STORAGE_FORMAT
+        super().finish(version_data, dry_run)
+
+
+def remove_empty_directories(path: str, dry_run: bool) -> int:
+    removed = set()
+
+    for directory, directory_names, file_names in os.walk(path, topdown=False):
+        if file_names or any(
+            os.path.join(directory, name) not in removed for name in directory_names
+        ):
+            continue
+
+        if not dry_run:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                continue
+
+        removed.add(directory)
+
+    return len(removed)
+
+
+class EmptyDirectoryStep(MigrationStep):
+    name = "empty_directories"
+
+    def applies(self, version_data: dict) -> bool:
+        return version_data["version"] == storage.CURRENT_STORAGE_VERSION and not (
+            version_data.get("empty_directories_removed", False)
+        )
+
+    def units(self) -> dict:
+        return {
+            name: f"{storage.DATA_PATH}/{name}"
+            for name in os.listdir(storage.DATA_PATH)
+            if name != "migrations" and os.path.isdir(f"{storage.DATA_PATH}/{name}")
+        }
+
+    def guild_unit(self, guild_id: int):
+        return None
+
+    def migrate_unit(self, unit, checkpoint: MigrationCheckpoint, dry_run: bool) -> int:
+        return remove_empty_directories(unit, dry_run)
+
+    def finish(self, version_data: dict, dry_run: bool):
+        version_data["empty_directories_removed"] = True
+        super().finish(version_data, dry_run)
+
+
+MIGRATION_STEPS = [
+    ZeroToOneStep(),
+    OneToTwoStep(),
+    SQLiteImportStep(),
+    FormatStep(),
+    EmptyDirectoryStep(),
+]
+
+
+class MigrationRunner:
+    def __init__(self, workers: int, dry_run: bool = False):
+        self.workers = max(1, workers)
+        self.dry_run = dry_run
+        self.lock = threading.Lock()
+        self.unit_locks = {}
+        self.steps = []
+
+    def plan(self, version_data: dict) -> list[MigrationStep]:
+        planned = []
+        version_data = dict(version_data)
+
+        for step in MIGRATION_STEPS:
+            if step.applies(version_data):
+                planned.append(step)
+                step.finish(version_data, True)
+
+        self.steps = [
+            (step, MigrationCheckpoint(step.name, self.dry_run)) for step in planned
+        ]
+
+        return planned
+
+    def unit_lock(self, step: MigrationStep, unit_id) -> threading.Lock:
+        with self.lock:
+            return self.unit_locks.setdefault((step.name, unit_id), threading.Lock())
+
+    def run_unit(
+        self, step: MigrationStep, checkpoint: MigrationCheckpoint, unit_id, unit
+    ) -> int:
+        with self.unit_lock(step, unit_id):
+            if f"unit {unit_id}" in checkpoint:
+                return 0
+
+            migrated = step.migrate_unit(unit, checkpoint, self.dry_run)
+            checkpoint.mark(f"unit {unit_id}")
+
+            return migrated
+
+    def ensure_guild(self, guild_id: int):
+        for step, checkpoint in list(self.steps):
+            if (unit := step.guild_unit(guild_id)) is not None:
+                self.run_unit(step, checkpoint, guild_id, unit)
+
+    def run_step(
+        self, step: MigrationStep, checkpoint: MigrationCheckpoint, version_data: dict
+    ) -> bool:
+        units = step.units()
+        remaining = [
+            unit_id for unit_id in units if f"unit {unit_id}" not in checkpoint
+        ]
+
+        log.info(
+            f"{'Dry-running' if self.dry_run else 'Running'} storage migration [{step.name}] over {len(remaining)} units ({len(units) - len(remaining)} already done) with {self.workers} workers"
+        )
+
+        start = time.perf_counter()
+        last_report = start
+        completed = 0
+        migrated = 0
+        failed = 0
+
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="mammoth-migration"
+        ) as executor:
+            futures = {
+                executor.submit(
+                    self.run_unit, step, checkpoint, unit_id, units[unit_id]
+                ): unit_id
+                for unit_id in remaining
+            }
+
+            for future in as_completed(futures):
+                completed += 1
+
+                try:
+                    migrated += future.result()
+                except Exception:
+                    failed += 1
+                    log.error(
+                        f"Failed to migrate unit [{futures[future]}] in [{step.name}]"
+                    )
+                    log.exception(traceback.format_exc())
+
+                if (
+                    now := time.perf_counter()
+                ) - last_report >= STORAGE_MIGRATION_PROGRESS_SECONDS:
+                    last_report = now
+                    rate = completed / (now - start)
+
+                    log.info(
+                        f"Storage migration [{step.name}]: {completed}/{len(remaining)} units, {migrated} entries, {rate:.1f} units/s, ETA {(len(remaining) - completed) / rate:.0f}s"
+                    )
+
+        log.info(
+            f"Storage migration [{step.name}] {'would migrate' if self.dry_run else 'migrated'} {migrated} entries across {completed} units in {time.perf_counter() - start:.2f}s ({failed} failed)"
+        )
+
+        if failed:
+            checkpoint.close()
+            log.error(
+                f"Storage migration [{step.name}] is incomplete, it will resume on the next start"
+            )
+            return False
+
+        step.finish(version_data, self.dry_run)
+        checkpoint.remove()
+
+        with self.lock:
+            self.steps.remove((step, checkpoint))
+
+        return True
+
+    def run(self, version_data: dict) -> bool:
+        if not self.steps:
+            self.plan(version_data)
+
+        for step, checkpoint in list(self.steps):
+            if not self.run_step(step, checkpoint, version_data):
+                return False
+
+        return True
+
+
+def migrate_storage(workers: int = None, dry_run: bool = False) -> bool:
+    runner = MigrationRunner(workers or STORAGE_MIGRATION_WORKERS, dry_run)
+
+    if dry_run:
+        if not os.path.isdir(storage.DATA_PATH):
+            log.info(f"Nothing to migrate, [{storage.DATA_PATH}] does not exist")
+            return True
+        if isinstance(storage.storage_backend, storage.SQLiteStorageBackend):
+            storage.storage_backend.read_only = True
+
+    return runner.run(read_version_data(dry_run))
+
+
+def migrate_storage_in_background(workers: int = None):
+    runner = MigrationRunner(workers or STORAGE_MIGRATION_WORKERS)
+    version_data = read_version_data()
+
+    if not runner.plan(version_data):
+        return
+
+    log.info("Serving storage while the migration runs in the background")
+
+    storage.pending_migration = runner.ensure_guild
+
+    def run():
+        try:
+            if not runner.run(version_data):
+                # Keep migrating the remaining guilds as they are first read
+                return
+        except Exception:
+            log.exception(traceback.format_exc())
+            return
+
+        storage.pending_migration = None
+        storage.storage_cache.clear()
+
+    threading.Thread(target=run, name="mammoth-migration", daemon=True).start()
+
+
+async def migrate():
+    if STORAGE_BACKGROUND_MIGRATION:
+        migrate_storage_in_background()
+    else:
+        if not await storage.run_in_storage_thread(migrate_storage):
+            raise RuntimeError(
+                "Storage migration is incomplete, refusing to start on partially migrated data"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run pending storage migrations. Run from the repository root."
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        type=int,
+        default=STORAGE_MIGRATION_WORKERS,
+        required=False,
+        help="Number of guild directories migrated in parallel.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        dest="dry_run",
+        action="store_true",
+        required=False,
+        help="Report what would be migrated without writing anything.",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    migrate_storage(**vars(args))
@@ -0,0 +1,150 @@
+import logging
+
+
+log = logging.getLogger(__name__)
+
+
+class SchemaError(ValueError):
+    pass
+
+
+def boolean(value) -> bool:
+    if not isinstance(value, bool):
+        raise SchemaError(f"expected a boolean, got {value!r}")
+
+    return value
+
+
+def number(value) -> int | float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise SchemaError(f"expected a number, got {value!r}")
+
+    return value
+
+
+def optional_number(value) -> int | float | None:
+    if value is None:
+        return None
+
+    return number(value)
+
+
+def optional_integer(value) -> int | None:
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise SchemaError(f"expected an integer, got {value!r}")
+
+    return value
+
+
+def string(value) -> str:
+    if not isinstance(value, str):
+        raise SchemaError(f"expected a string, got {value!r}")
+
+    return value
+
+
+def optional_string(value) -> str | None:
+    if value is None:
+        return None
+
+    return string(value)
+
+
+def snowflake(value) -> int | None:
+    if not value:
+        return None
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise SchemaError(f"expected an id, got {value!r}")
+
+    return value
+
+
+def sequence(value) -> list:
+    if not isinstance(value, (list, tuple)):
+        raise SchemaError(f"expected a list, got {value!r}")
+
+    return value
+
+
+def snowflake_set(value) -> frozenset[int]:
+    return frozenset(snowflake(item) for item in sequence(value) if item)
+
+
+def string_tuple(value) -> tuple[str, ...]:
+    return tuple(string(item) for item in sequence(value))
+
+
+def string_set(value) -> frozenset[str]:
+    return frozenset(string(item) for item in sequence(value) if item)
+
+
+def choice(*options):
+    def convert(value):
+        if value not in options:
+            raise SchemaError(f"expected one of {options}, got {value!r}")
+
+        return value
+
+    return convert
+
+
+class Schema:
+    __slots__ = ()
+
+    FIELDS = {}
+    DEFAULTS = {}
+
+    @classmethod
+    def parse(cls, data: dict, path: str = None):
+        schema = cls.__new__(cls)
+        path = path or cls.__name__
+
+        if not isinstance(data, dict):
+            log.warning(
+                f"Expected an object for [{path}], got {data!r}, using defaults"
+            )
+            data = {}
+
+        for name, convert in cls.FIELDS.items():
+            default = cls.DEFAULTS[name]
+
+            try:
+                value = convert(data.get(name, default))
+            except (SchemaError, TypeError, ValueError) as e:
+                log.warning(f"Invalid [{path}.{name}], using default: {e}")
+                value = convert(default)
+
+            setattr(schema, name, value)
+
+        return schema
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()})"
+
+
+def parse_mapping(schema: type[Schema], data: dict, key=str) -> dict:
+    parsed = {}
+
+    if not isinstance(data, dict):
+        log.warning(
+            f"Expected an object of [{schema.__name__}], got {data!r}, ignoring"
+        )
+        return parsed
+
+    for name, item in data.items():
+        try:
+            parsed_key = key(name)
+        except (TypeError, ValueError):
+            log.warning(f"Invalid [{schema.__name__}] key {name!r}, ignoring")
+            continue
+
+        parsed[parsed_key] = schema.parse(item, f"{schema.__name__}[{name}]")
+
+    return parsed
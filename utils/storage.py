@@ -1,13 +1,35 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from datetime import datetime
-from pathlib import Path
+import bisect
 import logging
 import asyncio
 import os
+import random
+import shutil
+import time
 import traceback
 import discord
 import json
-import pickle
+import marshal
+import sqlite3
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 
 log = logging.getLogger(__name__)
@@ -16,8 +38,48 @@ log = logging.getLogger(__name__)
 with open("./settings.json", "r") as r:
     SETTINGS = json.load(r)
 
-CURRENT_STORAGE_VERSION = 1
+CURRENT_STORAGE_VERSION = 2
 DATA_PATH = SETTINGS["dataPath"]
+STORAGE_CACHE_BUDGET = SETTINGS.get("storageCacheMegabytes", 64) * 1024 * 1024
+STORAGE_CACHE_REVALIDATE_SECONDS = SETTINGS.get("storageCacheRevalidateSeconds", 5)
+STORAGE_LOCK_TIMEOUT = SETTINGS.get("storageLockTimeout", 30)
+STORAGE_STALE_LOCK_SECONDS = SETTINGS.get("storageStaleLockSeconds", 120)
+STORAGE_DURABILITY = SETTINGS.get("storageDurability", "none")
+STORAGE_GROUP_COMMIT_SECONDS = SETTINGS.get("storageGroupCommitMilliseconds", 0) / 1000
+STORAGE_GROUP_COMMIT_MAX_BATCH = 256
+STORAGE_BACKEND = SETTINGS.get("storageBackend", "json")
+STORAGE_THREADS = SETTINGS.get("storageThreads", 4)
+STORAGE_FORMAT = SETTINGS.get("storageFormat", "compact")
+STORAGE_JOURNAL = SETTINGS.get("storageJournal", False)
+STORAGE_JOURNAL_COMPACT_BYTES = (
+    SETTINGS.get("storageJournalCompactKilobytes", 64) * 1024
+)
+STORAGE_UPDATE_ATTEMPTS = SETTINGS.get("storageUpdateAttempts", 5)
+STORAGE_STATS_LOG_SECONDS = SETTINGS.get("storageStatsLogSeconds", 0)
+STORAGE_LATENCY_BUCKETS = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    1.0,
+    float("inf"),
+)
+STORAGE_SNAPSHOT_INTERVAL_SECONDS = (
+    SETTINGS.get("storageSnapshotIntervalHours", 0) * 3600
+)
+STORAGE_SNAPSHOT_KEEP = SETTINGS.get("storageSnapshotKeep", 7)
+STORAGE_PRELOAD = SETTINGS.get("storagePreload", False)
+STORAGE_PRELOAD_CONCURRENCY = SETTINGS.get(
+    "storagePreloadConcurrency", max(1, STORAGE_THREADS // 2)
+)
 
 
 class StorageObject:
@@ -35,190 +97,1954 @@ class StorageObject:
         self.last_edit = datetime.now()
 
 
-def migrate_zero_to_one():
-    log.info("Migrating storage from version 0 to 1")
+def json_keys(value):
+    if isinstance(value, dict):
+        return {
+            k if isinstance(k, str) else json.dumps(k): json_keys(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [json_keys(v) for v in value]
 
-    for scope in os.listdir(DATA_PATH):
-        if scope in "global" or os.path.isfile(f"{DATA_PATH}/{scope}"):
-            continue
+    return value
+
+
+def encode_json(data: dict) -> bytes:
+    return json.dumps(data, indent=4).encode()
+
+
+def encode_compact(data: dict) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def encode_msgpack(data: dict) -> bytes:
+    return msgpack.packb(json_keys(data))
+
+
+STORAGE_ENCODERS = {
+    "json": encode_json,
+    "compact": encode_compact,
+    "msgpack": encode_msgpack,
+}
+
+
+def detect_format(raw: bytes) -> str:
+    if raw and (0x80 <= raw[0] <= 0x8F or raw[0] in (0xDE, 0xDF)):
+        return "msgpack"
+
+    return "json"
+
+
+def decode_data(raw: bytes) -> dict:
+    if detect_format(raw) == "msgpack":
+        return msgpack.unpackb(raw, strict_map_key=False)
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass
+
+    return json.loads(raw)
+
+
+if STORAGE_FORMAT not in STORAGE_ENCODERS:
+    log.warning(f"Unknown storage format [{STORAGE_FORMAT}], using compact")
+    STORAGE_FORMAT = "compact"
+if STORAGE_FORMAT == "msgpack" and msgpack is None:
+    log.warning("msgpack is not installed, using compact storage format")
+    STORAGE_FORMAT = "compact"
+
+encode_storage = STORAGE_ENCODERS[STORAGE_FORMAT]
+
+
+def histogram_percentile(histogram: list[int], percentile: float) -> float:
+    if not (total := sum(histogram)):
+        return 0.0
+
+    seen = 0
+
+    for bucket, count in zip(STORAGE_LATENCY_BUCKETS, histogram):
+        seen += count
+
+        if seen >= total * percentile:
+            return bucket
+
+    return STORAGE_LATENCY_BUCKETS[-1]
+
+
+class StorageKeyStats:
+    __slots__ = (
+        "reads",
+        "hits",
+        "writes",
+        "skipped",
+        "read_histogram",
+        "write_histogram",
+        "lock_waits",
+        "lock_wait_seconds",
+        "max_lock_wait_seconds",
+        "key_bytes",
+        "max_key_bytes",
+        "document_bytes",
+        "max_document_bytes",
+    )
+
+    def __init__(self):
+        self.reads = 0
+        self.hits = 0
+        self.writes = 0
+        self.skipped = 0
+        self.read_histogram = [0] * len(STORAGE_LATENCY_BUCKETS)
+        self.write_histogram = [0] * len(STORAGE_LATENCY_BUCKETS)
+        self.lock_waits = 0
+        self.lock_wait_seconds = 0.0
+        self.max_lock_wait_seconds = 0.0
+        self.key_bytes = 0
+        self.max_key_bytes = 0
+        self.document_bytes = 0
+        self.max_document_bytes = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "reads": self.reads,
+            "hit_rate": self.hits / self.reads if self.reads else None,
+            "read_p50_ms": histogram_percentile(self.read_histogram, 0.5) * 1000,
+            "read_p99_ms": histogram_percentile(self.read_histogram, 0.99) * 1000,
+            "writes": self.writes,
+            "skipped_writes": self.skipped,
+            "write_p50_ms": histogram_percentile(self.write_histogram, 0.5) * 1000,
+            "write_p99_ms": histogram_percentile(self.write_histogram, 0.99) * 1000,
+            "lock_wait_ms": self.lock_wait_seconds * 1000,
+            "max_lock_wait_ms": self.max_lock_wait_seconds * 1000,
+            "mean_key_bytes": self.key_bytes // self.writes if self.writes else None,
+            "max_key_bytes": self.max_key_bytes,
+            "mean_document_bytes": self.document_bytes // self.writes
+            if self.writes
+            else None,
+            "max_document_bytes": self.max_document_bytes,
+            "read_histogram": self.read_histogram,
+            "write_histogram": self.write_histogram,
+        }
+
+
+class StorageStats:
+    def __init__(self):
+        self.keys: dict[tuple[str, str], StorageKeyStats] = {}
+        self.since = time.time()
+
+    def key(self, scope: str, key: str) -> StorageKeyStats:
+        if not (key_stats := self.keys.get((scope, key))):
+            key_stats = self.keys[(scope, key)] = StorageKeyStats()
+
+        return key_stats
+
+    def record_read(self, scope: str, key: str, seconds: float, hit: bool):
+        key_stats = self.key(scope, key)
+        key_stats.reads += 1
+        key_stats.hits += hit
+        key_stats.read_histogram[
+            bisect.bisect_left(STORAGE_LATENCY_BUCKETS, seconds)
+        ] += 1
+
+    def record_write(
+        self, scope: str, key: str, seconds: float, key_size: int, document_size: int
+    ):
+        key_stats = self.key(scope, key)
+        key_stats.writes += 1
+        key_stats.write_histogram[
+            bisect.bisect_left(STORAGE_LATENCY_BUCKETS, seconds)
+        ] += 1
+        key_stats.key_bytes += key_size
+        key_stats.max_key_bytes = max(key_stats.max_key_bytes, key_size)
+        key_stats.document_bytes += document_size
+        key_stats.max_document_bytes = max(key_stats.max_document_bytes, document_size)
+
+    def record_skip(self, scope: str, key: str):
+        self.key(scope, key).skipped += 1
+
+    def record_lock_wait(self, scope: str, key: str, seconds: float):
+        key_stats = self.key(scope, key)
+        key_stats.lock_waits += 1
+        key_stats.lock_wait_seconds += seconds
+        key_stats.max_lock_wait_seconds = max(key_stats.max_lock_wait_seconds, seconds)
+
+    def reset(self):
+        self.keys = {}
+        self.since = time.time()
+
+
+storage_stats = StorageStats()
+
+
+class StorageCacheEntry:
+    __slots__ = ("data", "size", "token", "checked")
+
+    def __init__(self, data: dict, size: int, token):
+        self.data = data
+        self.size = size
+        self.token = token
+        self.checked = time.monotonic()
+
+
+class StorageCache:
+    def __init__(self, budget: int, revalidate_seconds: float):
+        self.budget = budget
+        self.revalidate_seconds = revalidate_seconds
+        self.entries: OrderedDict[int, StorageCacheEntry] = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+        # Bumped on every change so a slow load can tell it was overtaken
+        self.sequence = 0
+        self.generations: dict[int, int] = {}
+        self.cleared = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_fresh_entry(self, cache_key: int):
+        with self.lock:
+            if not (entry := self.entries.get(cache_key)):
+                return None
+            if time.monotonic() - entry.checked >= self.revalidate_seconds:
+                return None
+
+            self.entries.move_to_end(cache_key)
+            self.hits += 1
+
+            return entry
+
+    def get_fresh(self, cache_key: int):
+        if entry := self.get_fresh_entry(cache_key):
+            return entry.data
+
+        return None
+
+    def peek(self, cache_key: int, data: dict):
+        with self.lock:
+            if (entry := self.entries.get(cache_key)) and entry.data is data:
+                return entry
+
+        return None
+
+    def get(self, cache_key: int, revalidate: bool = False):
+        with self.lock:
+            entry = self.entries.get(cache_key)
+
+        if not entry:
+            self.misses += 1
+            return None
+
+        now = time.monotonic()
+
+        if revalidate or now - entry.checked >= self.revalidate_seconds:
+            if storage_backend.token(cache_key) != entry.token:
+                with self.lock:
+                    if self.entries.get(cache_key) is entry:
+                        self.remove(cache_key)
+
+                self.misses += 1
+                return None
+
+            entry.checked = now
+
+        with self.lock:
+            if cache_key in self.entries:
+                self.entries.move_to_end(cache_key)
+
+        self.hits += 1
+
+        return entry.data
+
+    def generation(self, cache_key: int) -> int:
+        with self.lock:
+            return max(self.generations.get(cache_key, 0), self.cleared)
+
+    def put(self, cache_key: int, data: dict, size: int, token, generation: int = None):
+        with self.lock:
+            if generation is not None and generation != max(
+                self.generations.get(cache_key, 0), self.cleared
+            ):
+                return
+
+            self.remove(cache_key)
+
+            if size > self.budget:
+                return
+
+            self.entries[cache_key] = StorageCacheEntry(data, size, token)
+            self.size += size
+
+            while self.size > self.budget:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.size
+                self.evictions += 1
+
+    def invalidate(self, cache_key: int):
+        with self.lock:
+            self.remove(cache_key)
+
+    def remove(self, cache_key: int):
+        self.sequence += 1
+        self.generations[cache_key] = self.sequence
+
+        if entry := self.entries.pop(cache_key, None):
+            self.size -= entry.size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.sequence += 1
+            self.cleared = self.sequence
+
+
+ABSENT_DOCUMENT_SIZE = 64
+
+storage_cache = StorageCache(STORAGE_CACHE_BUDGET, STORAGE_CACHE_REVALIDATE_SECONDS)
+storage_executor = ThreadPoolExecutor(STORAGE_THREADS, thread_name_prefix="storage")
+
+
+async def run_in_storage_thread(function, *args):
+    return await asyncio.get_running_loop().run_in_executor(
+        storage_executor, function, *args
+    )
+
+
+class StorageLockTimeout(Exception):
+    pass
+
+
+class StorageLock:
+    __slots__ = ("lock", "users", "fd")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+        self.fd = None
+
+
+class StorageLockManager:
+    def __init__(self, timeout: float, stale_seconds: float):
+        self.timeout = timeout
+        self.stale_seconds = stale_seconds
+        self.locks: dict[str, StorageLock] = {}
+        self.quiescing: asyncio.Event | None = None
+
+        self.acquisitions = 0
+        self.contended = 0
+        self.timeouts = 0
+        self.stale_recoveries = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @asynccontextmanager
+    async def acquire(self, path: str):
+        while self.quiescing is not None:
+            await self.quiescing.wait()
+
+        if not (storage_lock := self.locks.get(path)):
+            storage_lock = self.locks[path] = StorageLock()
+
+        storage_lock.users += 1
+        wait_start = time.monotonic()
+
+        try:
+            if storage_lock.users > 1:
+                self.contended += 1
+
+            try:
+                await asyncio.wait_for(storage_lock.lock.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise StorageLockTimeout(f"Timed out waiting for [{path}]")
+
+            try:
+                remaining = self.timeout - (time.monotonic() - wait_start)
+                storage_lock.fd = await self.acquire_file_lock(path, remaining)
+            except BaseException:
+                storage_lock.lock.release()
+                raise
+
+            waited = time.monotonic() - wait_start
+            self.acquisitions += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+            try:
+                yield
+            finally:
+                self.release_file_lock(path, storage_lock.fd)
+                storage_lock.fd = None
+                storage_lock.lock.release()
+        finally:
+            storage_lock.users -= 1
+
+            if not storage_lock.users:
+                del self.locks[path]
+
+    @asynccontextmanager
+    async def quiesce(self):
+        while self.quiescing is not None:
+            await self.quiescing.wait()
+
+        self.quiescing = asyncio.Event()
+        deadline = time.monotonic() + self.timeout
+
+        try:
+            while self.locks:
+                if time.monotonic() >= deadline:
+                    self.timeouts += 1
+                    raise StorageLockTimeout("Timed out waiting for writers to finish")
+
+                await asyncio.sleep(0.005)
+
+            yield
+        finally:
+            quiescing, self.quiescing = self.quiescing, None
+            quiescing.set()
+
+    async def acquire_file_lock(self, path: str, timeout: float):
+        lock_path = f"{path}.lock"
+        deadline = time.monotonic() + timeout
+        delay = 0.005
+
+        while True:
+            try:
+                if (fd := self.try_file_lock(lock_path)) is not None:
+                    return fd
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+                continue
+
+            if time.monotonic() >= deadline:
+                self.timeouts += 1
+                raise StorageLockTimeout(f"Timed out waiting for [{lock_path}]")
+
+            self.contended += 1
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    def try_file_lock(self, lock_path: str):
+        if fcntl is None:
+            try:
+                return os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                pass
+
+            try:
+                if time.time() - os.stat(lock_path).st_mtime >= self.stale_seconds:
+                    log.warning(f"Removing stale lock [{lock_path}]")
+                    os.remove(lock_path)
+                    self.stale_recoveries += 1
+            except FileNotFoundError:
+                pass
+
+            return None
+
+        fd = os.open(lock_path, os.O_CREAT | os.O_RDWR)
+
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
 
+        # The previous holder may have unlinked the file between our open and flock.
+        try:
+            if os.fstat(fd).st_ino == os.stat(lock_path).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+
+        os.close(fd)
+        return None
+
+    def release_file_lock(self, path: str, fd: int):
+        try:
+            os.remove(f"{path}.lock")
+        except FileNotFoundError:
+            pass
+        except Exception:
+            log.exception(traceback.format_exc())
+        finally:
+            os.close(fd)
+
+
+storage_locks = StorageLockManager(STORAGE_LOCK_TIMEOUT, STORAGE_STALE_LOCK_SECONDS)
+
+
+def write_temp_file(file_path: str, raw: bytes, fsync: bool) -> str:
+    temp_path = f"{file_path}.{os.getpid()}.tmp"
+
+    try:
+        w = open(temp_path, "wb")
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        w = open(temp_path, "wb")
+
+    with w:
+        w.write(raw)
+        w.flush()
+
+        if fsync:
+            os.fsync(w.fileno())
+
+    return temp_path
+
+
+def fsync_directory(directory: str):
+    if os.name == "nt":
+        return
+
+    fd = os.open(directory, os.O_RDONLY)
+
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def commit_file(file_path: str, raw: bytes, fsync: bool) -> os.stat_result:
+    os.replace(write_temp_file(file_path, raw, fsync), file_path)
+
+    if fsync:
+        fsync_directory(os.path.dirname(file_path))
+
+    return os.stat(file_path)
+
+
+def append_file(file_path: str, raw: bytes, fsync: bool) -> os.stat_result:
+    created = not os.path.exists(file_path)
+
+    try:
+        w = open(file_path, "ab")
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        w = open(file_path, "ab")
+
+    with w:
+        w.write(raw)
+        w.flush()
+
+        if fsync:
+            os.fsync(w.fileno())
+            if created:
+                fsync_directory(os.path.dirname(file_path))
+
+        return os.fstat(w.fileno())
+
+
+def truncate_torn_tail(file_path: str) -> int:
+    with open(file_path, "rb+") as f:
+        end = size = f.seek(0, os.SEEK_END)
+
+        if not size:
+            return 0
+
+        f.seek(size - 1)
+
+        if f.read(1) == b"\n":
+            return 0
+
+        while end:
+            start = max(0, end - 65536)
+            f.seek(start)
+
+            if (index := f.read(end - start).rfind(b"\n")) != -1:
+                end = start + index + 1
+                break
+
+            end = start
+
+        f.truncate(end)
+
+    return size - end
+
+
+def commit_batch(items: list[tuple[str | None, str]]) -> list:
+    results = []
+    directories = set()
+
+    for temp_path, file_path in items:
+        try:
+            with open(temp_path or file_path, "rb+") as f:
+                os.fsync(f.fileno())
+
+            if temp_path is not None:
+                os.replace(temp_path, file_path)
+
+            directories.add(os.path.dirname(file_path))
+            results.append(os.stat(file_path))
+        except Exception as e:
+            results.append(e)
+
+    # One directory fsync covers every rename and new file in the batch
+    for directory in directories:
+        fsync_directory(directory)
+
+    return results
+
+
+class StorageCommitter:
+    def __init__(self, durability: str, window: float, max_batch: int):
+        if durability not in ("none", "batched", "write"):
+            log.warning(f"Unknown storage durability [{durability}], using none")
+            durability = "none"
+
+        self.durability = durability
+        self.window = window
+        self.max_batch = max_batch
+        self.pending: list[tuple[str | None, str, asyncio.Future]] = []
+        self.flushing = False
+
+        self.commits = 0
+        self.batches = 0
+
+    async def commit(self, file_path: str, raw: bytes) -> os.stat_result:
+        if self.durability != "batched":
+            self.commits += 1
+            return await run_in_storage_thread(
+                commit_file, file_path, raw, self.durability == "write"
+            )
+
+        temp_path = await run_in_storage_thread(write_temp_file, file_path, raw, False)
+
+        return await self.enqueue(temp_path, file_path)
+
+    async def append(self, file_path: str, raw: bytes) -> os.stat_result:
+        if self.durability != "batched":
+            self.commits += 1
+            return await run_in_storage_thread(
+                append_file, file_path, raw, self.durability == "write"
+            )
+
+        await run_in_storage_thread(append_file, file_path, raw, False)
+
+        return await self.enqueue(None, file_path)
+
+    async def enqueue(self, temp_path: str | None, file_path: str) -> os.stat_result:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((temp_path, file_path, future))
+
+        if not self.flushing:
+            self.flushing = True
+            loop.create_task(self.flush())
+
+        return await future
+
+    async def flush(self):
+        try:
+            while self.pending:
+                if self.window:
+                    await asyncio.sleep(self.window)
+
+                batch = self.pending[: self.max_batch]
+                del self.pending[: self.max_batch]
+
+                try:
+                    results = await run_in_storage_thread(
+                        commit_batch, [(temp, path) for temp, path, _ in batch]
+                    )
+                except Exception as e:
+                    results = [e] * len(batch)
+
+                self.batches += 1
+                self.commits += len(batch)
+
+                for (_, _, future), result in zip(batch, results):
+                    if future.done():
+                        continue
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+        finally:
+            self.flushing = False
+
+
+storage_committer = StorageCommitter(
+    STORAGE_DURABILITY, STORAGE_GROUP_COMMIT_SECONDS, STORAGE_GROUP_COMMIT_MAX_BATCH
+)
+
+
+RESERVED_DIRECTORIES = (
+    "guilds",
+    "locks",
+    "migrations",
+    "archive",
+    "snapshots",
+    "quarantine",
+)
+
+
+def list_guild_directories() -> dict[int, list[tuple[str, str]]]:
+    guild_directories = {}
+
+    for scope in os.listdir(DATA_PATH):
         root_path = f"{DATA_PATH}/{scope}"
 
+        if scope in RESERVED_DIRECTORIES or not os.path.isdir(root_path):
+            continue
+
         for guild_id in os.listdir(root_path):
             base_path = f"{root_path}/{guild_id}"
 
-            for file_name in os.listdir(base_path):
-                if not file_name.endswith(".pickle"):
-                    continue
-
-                file_path = f"{base_path}/{file_name}"
+            if not guild_id.isdigit() or not os.path.isdir(base_path):
+                continue
 
-                data = read_version_zero_data(base_path, file_path).get()
+            guild_directories.setdefault(int(guild_id), []).append((scope, base_path))
 
-                new_file_path = file_path.replace(".pickle", ".json")
+    return guild_directories
 
-                try:
-                    with open(new_file_path, "w") as w:
-                        json.dump(data, w, indent=4)
-                except Exception:
-                    log.error(f"Failed to migrate [{file_path}] from version 0 to 1!")
-                    log.exception(traceback.format_exc())
 
-    with open(f"{DATA_PATH}/version.json", "w") as w:
-        json.dump({"version": 1}, w, indent=4)
+def guild_directories(guild_id: int) -> list[tuple[str, str]]:
+    return [
+        (scope, f"{DATA_PATH}/{scope}/{guild_id}")
+        for scope in os.listdir(DATA_PATH)
+        if scope not in RESERVED_DIRECTORIES
+        and os.path.isdir(f"{DATA_PATH}/{scope}/{guild_id}")
+    ]
 
-    log.info("Migrated storage from version 0 to 1")
 
+JOURNAL_GENERATION_KEY = "__generation__"
 
-def read_version_zero_data(base_path, file_path):
-    log.debug(f"Read-only request for [{file_path}]")
 
-    """ Load the storage object """
+def stat_token(file_path: str):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
 
-    log.debug(f"Loading [{file_path}]...")
+    return stat.st_mtime_ns, stat.st_size
 
-    if not os.path.exists(file_path):
-        os.makedirs(base_path, exist_ok=True)
-        log.debug(f"File was not found [{file_path}], creating empty StorageObject")
 
-        storage_object = StorageObject()
+def diff_journal(path: list, old, new, ops: list):
+    if old is new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                ops.append(["del", path + [key]])
+
+        for key, value in new.items():
+            if key not in old:
+                ops.append(["set", path + [key], value])
+            elif old[key] is not value and old[key] != value:
+                diff_journal(path + [key], old[key], value, ops)
+    elif isinstance(old, list) and isinstance(new, list):
+        prefix = 0
+
+        while prefix < min(len(old), len(new)) and old[prefix] == new[prefix]:
+            prefix += 1
+
+        ops.append(["splice", path, prefix, new[prefix:]])
     else:
+        ops.append(["set", path, new])
+
+
+def apply_journal(document: dict, ops: list, copied: set | None = None):
+    for op, path, *args in ops:
+        parent = document
+
+        for key in path[:-1]:
+            if not isinstance(child := parent.get(key), dict):
+                child = parent[key] = {}
+            elif copied is not None and id(child) not in copied:
+                child = parent[key] = dict(child)
+            if copied is not None:
+                copied.add(id(child))
+
+            parent = child
+
+        if op == "set":
+            parent[path[-1]] = args[0]
+        elif op == "del":
+            parent.pop(path[-1], None)
+        elif op == "splice":
+            if not isinstance(items := parent.get(path[-1]), list):
+                items = parent[path[-1]] = []
+            elif copied is not None and id(items) not in copied:
+                items = parent[path[-1]] = list(items)
+            if copied is not None:
+                copied.add(id(items))
+
+            items[args[0] :] = args[1]
+
+
+class JSONStorageBackend:
+    name = "json"
+    absent_token = (None, None)
+
+    def __init__(self):
+        self.journal = STORAGE_JOURNAL
+        self.generations: dict[int, int] = {}
+        self.compacting: dict[int, asyncio.Task] = {}
+
+        self.appends = 0
+        self.compactions = 0
+
+    def file_path(self, guild_id: int) -> str:
+        return f"{DATA_PATH}/guilds/{guild_id}.json"
+
+    def log_path(self, guild_id: int) -> str:
+        return f"{DATA_PATH}/guilds/{guild_id}.log"
+
+    def lock_path(self, guild_id: int) -> str:
+        return self.file_path(guild_id)
+
+    def token(self, guild_id: int):
+        return stat_token(self.file_path(guild_id)), stat_token(self.log_path(guild_id))
+
+    def load(self, guild_id: int):
+        document = {}
+        size = 0
+        snapshot_token = None
+        log_token = None
+
         try:
-            with open(file_path, "rb") as rb:
-                loaded_object = pickle.load(rb)
-        except Exception as e:
-            log.debug(f"Failed to load [{file_path}]\n\n{e}\n")
+            with open(self.file_path(guild_id), "rb") as rb:
+                stat = os.fstat(rb.fileno())
+                raw = rb.read()
+
+            document = decode_data(raw)
+            size = len(raw)
+            snapshot_token = stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            pass
+
+        generation = document.pop(JOURNAL_GENERATION_KEY, 0)
+
+        try:
+            with open(self.log_path(guild_id), "rb") as rb:
+                stat = os.fstat(rb.fileno())
+                lines = rb.read().split(b"\n")
+
+            size += stat.st_size
+            log_token = stat.st_mtime_ns, stat.st_size
+
+            if decode_data(lines[0]).get("generation") == generation:
+                for line in lines[1:]:
+                    if not line:
+                        continue
+
+                    try:
+                        apply_journal(document, decode_data(line))
+                    except ValueError:
+                        log.warning(f"Ignoring torn journal record for [{guild_id}]")
+                        break
+        except (FileNotFoundError, ValueError):
+            pass
+
+        if snapshot_token is None and log_token is None:
+            return None
+
+        self.generations[guild_id] = generation
+
+        return document, size, (snapshot_token, log_token)
+
+    def encode_snapshot(self, guild_id: int, document: dict):
+        generation = self.generations.get(guild_id, 0)
+
+        if has_log := os.path.exists(self.log_path(guild_id)):
+            generation += 1
+        if generation:
+            document = {**document, JOURNAL_GENERATION_KEY: generation}
+
+        return encode_storage(document), has_log, generation
+
+    def commit_snapshot(
+        self, guild_id: int, raw: bytes, has_log: bool, generation: int
+    ):
+        commit_file(self.file_path(guild_id), raw, False)
+        self.generations[guild_id] = generation
+
+        if has_log:
+            os.remove(self.log_path(guild_id))
+
+    def write_snapshot(self, guild_id: int, document: dict) -> int:
+        raw, has_log, generation = self.encode_snapshot(guild_id, document)
+
+        self.commit_snapshot(guild_id, raw, has_log, generation)
+
+        return len(raw)
+
+    async def store_snapshot(self, guild_id: int, document: dict):
+        raw, has_log, generation = await run_in_storage_thread(
+            self.encode_snapshot, guild_id, document
+        )
+        stat = await storage_committer.commit(self.file_path(guild_id), raw)
+        self.generations[guild_id] = generation
 
-            loaded_object = StorageObject()
+        if has_log:
+            await run_in_storage_thread(os.remove, self.log_path(guild_id))
 
-        if not isinstance(loaded_object, StorageObject):
-            log.debug(
-                f"File is not StorageObject [{file_path}], creating empty StorageObject"
+        return stat.st_size, ((stat.st_mtime_ns, stat.st_size), None)
+
+    def encode_journal(self, guild_id: int, ops: list):
+        raw = encode_compact(ops) + b"\n"
+        log_path = self.log_path(guild_id)
+        generation = self.generations.get(guild_id, 0)
+
+        try:
+            # Records appended after a torn one would share its line and be lost too
+            if torn := truncate_torn_tail(log_path):
+                log.warning(f"Truncated {torn} bytes of torn journal for [{guild_id}]")
+
+            with open(log_path, "rb") as rb:
+                header = rb.readline()
+
+            if decode_data(header).get("generation") != generation:
+                os.remove(log_path)
+                raise FileNotFoundError(log_path)
+        except (FileNotFoundError, ValueError):
+            raw = encode_compact({"generation": generation}) + b"\n" + raw
+
+        return raw, stat_token(self.file_path(guild_id))
+
+    async def store(self, guild_id: int, document: dict, ops: list):
+        if not self.journal:
+            return await self.store_snapshot(guild_id, document)
+
+        raw, snapshot_token = await run_in_storage_thread(
+            self.encode_journal, guild_id, ops
+        )
+        stat = await storage_committer.append(self.log_path(guild_id), raw)
+        snapshot_size = snapshot_token[1] if snapshot_token else 0
+        self.appends += 1
+
+        if (
+            stat.st_size >= max(STORAGE_JOURNAL_COMPACT_BYTES, snapshot_size)
+            and guild_id not in self.compacting
+        ):
+            self.compacting[guild_id] = asyncio.get_running_loop().create_task(
+                self.compact(guild_id)
             )
 
-            storage_object = StorageObject()
+        return snapshot_size + stat.st_size, (
+            snapshot_token,
+            (stat.st_mtime_ns, stat.st_size),
+        )
+
+    async def compact(self, guild_id: int):
+        try:
+            async with storage_locks.acquire(self.lock_path(guild_id)):
+                document = await run_in_storage_thread(
+                    load_document, guild_id, True, True
+                )
+                size, token = await self.store_snapshot(guild_id, document)
+
+                storage_cache.put(guild_id, document, size, token)
+                self.compactions += 1
+                log.debug(f"Compacted journal for [{guild_id}]")
+        except Exception:
+            log.exception(traceback.format_exc())
+        finally:
+            self.compacting.pop(guild_id, None)
+
+    def disk_size(self, guild_id: int) -> int:
+        size = 0
+
+        for file_path in (self.file_path(guild_id), self.log_path(guild_id)):
+            if (token := stat_token(file_path)) is not None:
+                size += token[1]
+
+        return size
+
+    def delete(self, guild_id: int) -> int:
+        size = 0
+
+        for file_path in (self.file_path(guild_id), self.log_path(guild_id)):
+            try:
+                size += os.stat(file_path).st_size
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+
+        self.generations.pop(guild_id, None)
+
+        return size
 
-        log.debug(f"Loaded [{file_path}]")
+    def guild_ids(self) -> list[int]:
+        if not os.path.isdir(f"{DATA_PATH}/guilds"):
+            return []
 
-        storage_object = loaded_object
+        guild_ids = set()
 
-    """ Return the storage object """
+        for file_name in os.listdir(f"{DATA_PATH}/guilds"):
+            guild_id, extension = os.path.splitext(file_name)
 
-    log.debug(f"Returning [{file_path}]")
-    return storage_object
+            if extension in (".json", ".log") and guild_id.isdigit():
+                guild_ids.add(int(guild_id))
 
+        return list(guild_ids)
+
+    def convert_guild(self, guild_id: int, dry_run: bool = False) -> tuple[int, int]:
+        if not (loaded := self.load(guild_id)):
+            return 0, 0
+
+        document, size, (_, log_token) = loaded
+        raw, has_log, generation = self.encode_snapshot(guild_id, document)
+
+        if log_token is None:
+            with open(self.file_path(guild_id), "rb") as rb:
+                if rb.read() == raw:
+                    return 0, 0
+        if not dry_run:
+            self.commit_snapshot(guild_id, raw, has_log, generation)
+
+        return 1, size - len(raw)
+
+
+SQLITE_TABLES = {
+    "guilds": "guild_id INTEGER PRIMARY KEY, data BLOB NOT NULL, version INTEGER NOT NULL",
+    "meta": "name TEXT PRIMARY KEY, value TEXT",
+}
+
+
+class SQLiteStorageBackend:
+    name = "sqlite"
+    absent_token = None
+
+    def __init__(self):
+        self.local = threading.local()
+        self.journal = False
+        self.read_only = False
+
+    def database_path(self) -> str:
+        return f"{DATA_PATH}/storage.sqlite3"
+
+    def read_only_connection(self) -> sqlite3.Connection:
+        database_path = self.database_path()
+
+        if not os.path.exists(database_path):
+            conn = sqlite3.connect(
+                ":memory:", isolation_level=None, check_same_thread=False
+            )
+        else:
+            # Opening read-only still creates the WAL files unless there is none to replay
+            conn = sqlite3.connect(
+                f"file:{database_path}?"
+                + (
+                    "mode=ro"
+                    if os.path.exists(f"{database_path}-wal")
+                    else "immutable=1"
+                ),
+                uri=True,
+                timeout=STORAGE_LOCK_TIMEOUT,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+
+        tables = {
+            row[0]
+            for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            )
+        }
+
+        for name, columns in SQLITE_TABLES.items():
+            if name not in tables:
+                conn.execute(f"CREATE TEMP TABLE {name} ({columns})")
+
+        self.local.conn = conn
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        if (conn := getattr(self.local, "conn", None)) is not None:
+            return conn
+        if self.read_only:
+            return self.read_only_connection()
 
-def migrate_storage():
-    if not os.path.exists(DATA_PATH):
         os.makedirs(DATA_PATH, exist_ok=True)
 
-    if not os.path.exists(f"{DATA_PATH}/version.json"):
-        with open(f"{DATA_PATH}/version.json", "w") as w:
-            json.dump({"version": 0}, w, indent=4)
+        conn = sqlite3.connect(
+            self.database_path(),
+            timeout=STORAGE_LOCK_TIMEOUT,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "PRAGMA synchronous="
+            + {"none": "OFF", "batched": "NORMAL", "write": "FULL"}.get(
+                STORAGE_DURABILITY, "OFF"
+            )
+        )
 
-    with open(f"{DATA_PATH}/version.json", "r") as r:
-        storage_version_data = json.load(r)
+        for name, columns in SQLITE_TABLES.items():
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {name} ({columns})")
 
-    if storage_version_data["version"] == CURRENT_STORAGE_VERSION:
-        return
+        self.local.conn = conn
+        return conn
+
+    def lock_path(self, guild_id: int) -> str:
+        return f"{DATA_PATH}/locks/{guild_id}"
+
+    def token(self, guild_id: int):
+        row = (
+            self.connection()
+            .execute("SELECT version FROM guilds WHERE guild_id = ?", (guild_id,))
+            .fetchone()
+        )
+
+        return row[0] if row else None
+
+    def load(self, guild_id: int):
+        row = (
+            self.connection()
+            .execute("SELECT data, version FROM guilds WHERE guild_id = ?", (guild_id,))
+            .fetchone()
+        )
+
+        if not row:
+            return None
+
+        return decode_data(row[0]), len(row[0]), row[1]
+
+    async def store(self, guild_id: int, document: dict, ops: list):
+        return await run_in_storage_thread(self.store_sync, guild_id, document)
+
+    def store_sync(self, guild_id: int, document: dict):
+        raw = encode_storage(document)
+        conn = self.connection()
+
+        conn.execute("BEGIN IMMEDIATE")
+
+        try:
+            conn.execute(
+                "INSERT INTO guilds (guild_id, data, version) VALUES (?, ?, 1) "
+                "ON CONFLICT (guild_id) DO UPDATE SET data = excluded.data, version = version + 1",
+                (guild_id, raw),
+            )
+            version = conn.execute(
+                "SELECT version FROM guilds WHERE guild_id = ?", (guild_id,)
+            ).fetchone()[0]
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        return len(raw), version
+
+    def is_json_imported(self) -> bool:
+        return bool(
+            self.connection()
+            .execute("SELECT value FROM meta WHERE name = 'json_imported'")
+            .fetchone()
+        )
+
+    def mark_json_imported(self):
+        self.connection().execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES ('json_imported', ?)",
+            (datetime.now().isoformat(),),
+        )
+
+    def import_documents(self, rows: list[tuple[int, bytes]]):
+        conn = self.connection()
+
+        conn.execute("BEGIN IMMEDIATE")
+
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO guilds (guild_id, data, version) VALUES (?, ?, 1)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def has_legacy_rows(self) -> bool:
+        return bool(
+            self.connection()
+            .execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'storage'"
+            )
+            .fetchone()
+        )
+
+    def legacy_guild_ids(self) -> list[int]:
+        if not self.has_legacy_rows():
+            return []
+
+        return [
+            row[0]
+            for row in self.connection().execute(
+                "SELECT DISTINCT guild_id FROM storage"
+            )
+        ]
+
+    def fold_legacy_rows(self, guild_id: int, dry_run: bool = False) -> int:
+        if not self.has_legacy_rows():
+            return 0
+
+        conn = self.connection()
+
+        conn.execute("BEGIN IMMEDIATE")
+
+        try:
+            rows = conn.execute(
+                "SELECT scope, key, data FROM storage WHERE guild_id = ?", (guild_id,)
+            ).fetchall()
+            document = {}
+
+            for scope, key, data in rows:
+                document.setdefault(scope, {})[key] = decode_data(
+                    data.encode() if isinstance(data, str) else data
+                )
 
-    if storage_version_data["version"] == 0:
-        migrate_zero_to_one()
-        return migrate_storage()
+            if rows and not dry_run:
+                conn.execute(
+                    "INSERT OR IGNORE INTO guilds (guild_id, data, version) VALUES (?, ?, 1)",
+                    (guild_id, encode_storage(document)),
+                )
+                conn.execute("DELETE FROM storage WHERE guild_id = ?", (guild_id,))
+
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        return len(rows)
+
+    def drop_legacy_rows(self):
+        self.connection().execute("DROP TABLE IF EXISTS storage")
+
+    def disk_size(self, guild_id: int) -> int:
+        row = (
+            self.connection()
+            .execute("SELECT length(data) FROM guilds WHERE guild_id = ?", (guild_id,))
+            .fetchone()
+        )
+
+        return row[0] if row else 0
+
+    def delete(self, guild_id: int) -> int:
+        size = self.disk_size(guild_id)
+        self.connection().execute("DELETE FROM guilds WHERE guild_id = ?", (guild_id,))
+
+        return size
+
+    def guild_ids(self) -> list[int]:
+        return [
+            row[0] for row in self.connection().execute("SELECT guild_id FROM guilds")
+        ]
+
+    def convert_guild(self, guild_id: int, dry_run: bool = False) -> tuple[int, int]:
+        conn = self.connection()
+
+        conn.execute("BEGIN IMMEDIATE")
+
+        try:
+            row = conn.execute(
+                "SELECT data FROM guilds WHERE guild_id = ?", (guild_id,)
+            ).fetchone()
+            converted = 0
+            saved = 0
+
+            if row and (new_raw := encode_storage(decode_data(row[0]))) != row[0]:
+                if not dry_run:
+                    conn.execute(
+                        "UPDATE guilds SET data = ?, version = version + 1 WHERE guild_id = ?",
+                        (new_raw, guild_id),
+                    )
+
+                converted = 1
+                saved = len(row[0]) - len(new_raw)
+
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        return converted, saved
+
+
+STORAGE_BACKENDS = {
+    JSONStorageBackend.name: JSONStorageBackend,
+    SQLiteStorageBackend.name: SQLiteStorageBackend,
+}
+
+
+def use_storage_backend(name: str):
+    global storage_backend
+
+    if name not in STORAGE_BACKENDS:
+        log.warning(f"Unknown storage backend [{name}], using json")
+        name = JSONStorageBackend.name
+
+    storage_backend = STORAGE_BACKENDS[name]()
+    storage_cache.clear()
+
+    return storage_backend
+
+
+storage_backend = use_storage_backend(STORAGE_BACKEND)
+storage_write_counters = {"performed": 0, "skipped": 0}
+storage_update_counters = {"committed": 0, "conflicts": 0, "locked": 0}
+storage_subscribers: dict[tuple[str, str], list] = {}
+storage_event_tasks: set[asyncio.Task] = set()
+pending_migration = None
+
+
+def copy_json(value):
+    return marshal.loads(marshal.dumps(value))
 
 
 def update_dict_defaults(defaults: dict, data_dict: dict):
     for key, value in defaults.items():
         if key not in data_dict:
-            data_dict[key] = value
+            data_dict[key] = copy_json(value)
+
+
+def fetch_document(
+    guild_id: int, revalidate: bool = False, strict: bool = False
+) -> tuple[dict, bool]:
+    if pending_migration is not None:
+        pending_migration(guild_id)
+
+    if (document := storage_cache.get(guild_id, revalidate)) is not None:
+        return document, True
+
+    generation = storage_cache.generation(guild_id)
+
+    try:
+        if not (loaded := storage_backend.load(guild_id)):
+            document = {}
+            storage_cache.put(
+                guild_id,
+                document,
+                ABSENT_DOCUMENT_SIZE,
+                storage_backend.absent_token,
+                generation,
+            )
+
+            return document, False
+
+        document, size, token = loaded
+    except Exception:
+        # Only a missing document is empty; anything else must not be written over
+        if strict:
+            raise
+
+        log.exception(traceback.format_exc())
+
+        return {}, False
+
+    storage_cache.put(guild_id, document, size, token, generation)
+
+    return document, False
+
+
+def fetch_entry(guild_id: int):
+    document, _ = fetch_document(guild_id)
+
+    return document, storage_cache.peek(guild_id, document)
+
+
+def load_document(
+    guild_id: int, revalidate: bool = False, strict: bool = False
+) -> dict:
+    return fetch_document(guild_id, revalidate, strict)[0]
 
 
 def safe_read(scope: str, identifier: discord.Guild | int, key: str) -> dict:
     guild_id = identifier.id if isinstance(identifier, discord.Guild) else identifier
-    base_path = f"{DATA_PATH}/{scope}/{guild_id}"
-    file_path = f"{base_path}/{key}.json"
+    start = time.perf_counter()
 
-    log.debug(f"Read-only request for [{file_path}]")
-    log.debug(f"Loading [{file_path}]...")
+    document, hit = fetch_document(guild_id)
+    data_dict = copy_json(document.get(scope, {}).get(key, {}))
 
-    if not os.path.exists(file_path):
-        os.makedirs(base_path, exist_ok=True)
-        log.debug(f"File was not found [{file_path}]")
+    storage_stats.record_read(scope, key, time.perf_counter() - start, hit)
 
-        data_dict: dict = {}
-    else:
-        try:
-            with open(file_path, "r") as r:
-                data_dict: dict = json.load(r)
-        except Exception:
-            log.exception(traceback.format_exc())
+    return data_dict
 
-            data_dict: dict = {}
 
-        log.debug(f"Loaded [{file_path}]")
+def load_data_copy(
+    scope: str, guild_id: int, key: str, revalidate: bool = False, strict: bool = False
+):
+    document, hit = fetch_document(guild_id, revalidate, strict)
 
-    log.debug(f"Returning [{file_path}]")
-    return data_dict
+    return document, copy_json(document.get(scope, {}).get(key, {})), hit
 
 
-@asynccontextmanager
-async def safe_edit(scope: str, identifier: discord.Guild | int, key: str) -> dict:
+async def read(scope: str, identifier: discord.Guild | int, key: str) -> dict:
     guild_id = identifier.id if isinstance(identifier, discord.Guild) else identifier
-    base_path = f"{DATA_PATH}/{scope}/{guild_id}"
-    file_path = f"{base_path}/{key}.json"
+    start = time.perf_counter()
 
-    log.debug(f"Edit request opened for [{file_path}]")
+    if (document := storage_cache.get_fresh(guild_id)) is not None:
+        data_dict = copy_json(document.get(scope, {}).get(key, {}))
+        storage_stats.record_read(scope, key, time.perf_counter() - start, True)
 
-    while os.path.exists(f"{file_path}.lock"):
-        log.debug(f"File is locked [{file_path}], waiting...")
+        return data_dict
 
-        await asyncio.sleep(1)
+    _, data_dict, hit = await run_in_storage_thread(
+        load_data_copy, scope, guild_id, key
+    )
+    storage_stats.record_read(scope, key, time.perf_counter() - start, hit)
 
-    log.debug(f"Loading [{file_path}]...")
+    return data_dict
 
-    if not os.path.exists(file_path):
-        os.makedirs(base_path, exist_ok=True)
-        log.debug(f"File was not found [{file_path}]")
 
-        data_dict: dict = {}
-    else:
-        try:
-            with open(file_path, "r") as r:
-                data_dict: dict = json.load(r)
-        except Exception:
-            log.exception(traceback.format_exc())
+def update_document(document: dict, scope: str, key: str, data_dict: dict):
+    ops = []
+    diff_journal([scope, key], document.get(scope, {}).get(key, {}), data_dict, ops)
 
-            data_dict: dict = {}
+    ops = decode_data(encode_storage({"ops": ops}))["ops"]
 
-        log.debug(f"Loaded [{file_path}]")
+    for op in ops:
+        op[1] = [k if isinstance(k, str) else json.dumps(k) for k in op[1]]
 
-    log.debug(f"Locking [{file_path}]...")
+    new_document = dict(document)
+    apply_journal(new_document, ops, {id(new_document)})
 
-    try:
-        Path(f"{file_path}.lock").touch()
-        log.debug(f"Locked [{file_path}]")
-    except Exception:
-        log.exception(traceback.format_exc())
+    return new_document, ops, len(encode_storage(data_dict))
+
+
+async def save_data(
+    backend, document: dict, scope: str, guild_id: int, key: str, data_dict: dict
+):
+    start = time.perf_counter()
+
+    storage_cache.invalidate(guild_id)
 
     try:
-        log.debug(f"Yielding [{file_path}]")
-        yield data_dict
+        new_document, ops, key_size = await run_in_storage_thread(
+            update_document, document, scope, key, data_dict
+        )
+        size, token = await backend.store(guild_id, new_document, ops)
+
+        storage_cache.put(guild_id, new_document, size, token)
+        storage_write_counters["performed"] += 1
+        storage_stats.record_write(
+            scope, key, time.perf_counter() - start, key_size, size
+        )
+
+        publish(scope, guild_id, key, new_document[scope][key])
     except Exception:
         log.exception(traceback.format_exc())
-    finally:
-        log.debug(f"Saving [{file_path}]...")
+
+
+@asynccontextmanager
+async def edit(scope: str, identifier: discord.Guild | int, key: str) -> dict:
+    guild_id = identifier.id if isinstance(identifier, discord.Guild) else identifier
+    backend = storage_backend
+
+    start = time.perf_counter()
+
+    async with storage_locks.acquire(backend.lock_path(guild_id)):
+        storage_stats.record_lock_wait(scope, key, time.perf_counter() - start)
+        start = time.perf_counter()
+
+        document, data_dict, hit = await run_in_storage_thread(
+            load_data_copy, scope, guild_id, key, True, True
+        )
+        storage_stats.record_read(scope, key, time.perf_counter() - start, hit)
 
         try:
-            with open(file_path, "w") as w:
-                json.dump(data_dict, w, indent=4)
-                log.debug(f"Saved [{file_path}]")
+            yield data_dict
         except Exception:
             log.exception(traceback.format_exc())
         finally:
-            log.debug(f"Unlocking [{file_path}]...")
+            if data_dict == document.get(scope, {}).get(key, {}):
+                storage_write_counters["skipped"] += 1
+                storage_stats.record_skip(scope, key)
+            else:
+                await save_data(backend, document, scope, guild_id, key, data_dict)
+
+
+safe_edit = edit
+
+
+async def read_version(scope: str, identifier: discord.Guild | int, key: str):
+    data_dict = await read(scope, identifier, key)
+
+    return data_dict, copy_json(data_dict)
+
+
+async def compare_and_swap(
+    scope: str,
+    identifier: discord.Guild | int,
+    key: str,
+    version: dict,
+    data_dict: dict,
+) -> bool:
+    guild_id = identifier.id if isinstance(identifier, discord.Guild) else identifier
+    backend = storage_backend
+
+    start = time.perf_counter()
+
+    async with storage_locks.acquire(backend.lock_path(guild_id)):
+        storage_stats.record_lock_wait(scope, key, time.perf_counter() - start)
+
+        document = await run_in_storage_thread(load_document, guild_id, True, True)
+        current = document.get(scope, {}).get(key, {})
+
+        if current != version:
+            storage_update_counters["conflicts"] += 1
+
+            return False
+
+        if data_dict == current:
+            storage_write_counters["skipped"] += 1
+            storage_stats.record_skip(scope, key)
+        else:
+            await save_data(backend, document, scope, guild_id, key, data_dict)
+
+    storage_update_counters["committed"] += 1
+
+    return True
+
+
+async def update(
+    scope: str,
+    identifier: discord.Guild | int,
+    key: str,
+    mutate,
+    attempts: int = STORAGE_UPDATE_ATTEMPTS,
+):
+    for attempt in range(attempts - 1):
+        data_dict, version = await read_version(scope, identifier, key)
+        result = mutate(data_dict)
+
+        if await compare_and_swap(scope, identifier, key, version, data_dict):
+            return result
+
+        await asyncio.sleep(random.uniform(0, 0.005 * 2**attempt))
+
+    storage_update_counters["locked"] += 1
+    result = error = None
+
+    async with edit(scope, identifier, key) as data_dict:
+        # edit() logs and swallows errors, so mutate a copy and raise like the CAS path
+        working = copy_json(data_dict)
+
+        try:
+            result = mutate(working)
+        except Exception as e:
+            error = e
+        else:
+            data_dict.clear()
+            data_dict.update(working)
+
+    if error is not None:
+        raise error
+
+    return result
+
+
+def get_stats() -> dict:
+    lookups = storage_cache.hits + storage_cache.misses
+
+    return {
+        "since": storage_stats.since,
+        "keys": {
+            f"{scope}/{key}": key_stats.to_dict()
+            for (scope, key), key_stats in storage_stats.keys.items()
+        },
+        "cache": {
+            "entries": len(storage_cache.entries),
+            "bytes": storage_cache.size,
+            "budget_bytes": storage_cache.budget,
+            "hits": storage_cache.hits,
+            "misses": storage_cache.misses,
+            "hit_rate": storage_cache.hits / lookups if lookups else None,
+            "evictions": storage_cache.evictions,
+        },
+        "locks": {
+            "acquisitions": storage_locks.acquisitions,
+            "contended": storage_locks.contended,
+            "timeouts": storage_locks.timeouts,
+            "stale_recoveries": storage_locks.stale_recoveries,
+            "wait_seconds": storage_locks.wait_seconds,
+            "max_wait_seconds": storage_locks.max_wait_seconds,
+        },
+        "writes": dict(storage_write_counters),
+        "updates": dict(storage_update_counters),
+    }
+
+
+def format_stats(limit: int = 10) -> str:
+    stats = get_stats()
+    lines = [
+        f"cache {stats['cache']['entries']} entries, {stats['cache']['bytes'] / 1048576:.1f}/{stats['cache']['budget_bytes'] / 1048576:.0f}MB, hit rate {stats['cache']['hit_rate'] or 0:.1%}, {stats['cache']['evictions']} evictions",
+        f"locks {stats['locks']['acquisitions']} acquired, {stats['locks']['contended']} contended, {stats['locks']['timeouts']} timeouts, {stats['locks']['wait_seconds']:.2f}s waited",
+        f"{'key':<40} {'reads':>8} {'hit':>5} {'r p99':>8} {'writes':>7} {'w p99':>8} {'lock ms':>9} {'bytes':>9} {'doc bytes':>10}",
+    ]
+
+    for name, key_stats in sorted(
+        stats["keys"].items(),
+        key=lambda item: item[1]["reads"] + item[1]["writes"],
+        reverse=True,
+    )[:limit]:
+        lines.append(
+            f"{name[-40:]:<40} {key_stats['reads']:>8} {key_stats['hit_rate'] or 0:>5.0%} {key_stats['read_p99_ms']:>8.2f} {key_stats['writes']:>7} {key_stats['write_p99_ms']:>8.2f} {key_stats['lock_wait_ms']:>9.1f} {key_stats['mean_key_bytes'] or 0:>9} {key_stats['mean_document_bytes'] or 0:>10}"
+        )
+
+    return "\n".join(lines)
+
+
+def resident_memory() -> int:
+    try:
+        with open("/proc/self/statm", "r") as r:
+            return int(r.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+async def preload(
+    guild_ids: list[int], concurrency: int = STORAGE_PRELOAD_CONCURRENCY
+) -> dict:
+    log.info(f"Preloading storage for {len(guild_ids)} guilds...")
+
+    start = time.perf_counter()
+    start_memory = resident_memory()
+    start_cache_size = storage_cache.size
+    remaining = iter(guild_ids)
+    loaded = 0
+
+    async def worker():
+        nonlocal loaded
+
+        for guild_id in remaining:
+            if storage_cache.size >= storage_cache.budget:
+                return
 
             try:
-                os.remove(f"{file_path}.lock")
-                log.debug(f"Unlocked [{file_path}]")
+                await run_in_storage_thread(load_document, guild_id)
+                loaded += 1
             except Exception:
                 log.exception(traceback.format_exc())
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+
+    report = {
+        "guilds": len(guild_ids),
+        "loaded": loaded,
+        "seconds": time.perf_counter() - start,
+        "cache_bytes": storage_cache.size - start_cache_size,
+        "memory_bytes": resident_memory() - start_memory,
+    }
+
+    log.info(
+        f"Preloaded {loaded}/{len(guild_ids)} guilds in {report['seconds']:.2f}s, cache +{report['cache_bytes'] / 1048576:.1f}MB, resident memory +{report['memory_bytes'] / 1048576:.1f}MB"
+    )
+
+    if loaded < len(guild_ids):
+        log.warning("Storage cache budget reached, preload stopped early")
+
+    return report
+
+
+def snapshot_root() -> str:
+    return f"{DATA_PATH}/snapshots"
+
+
+def list_snapshots() -> list[str]:
+    if not os.path.isdir(snapshot_root()):
+        return []
+
+    return sorted(
+        name for name in os.listdir(snapshot_root()) if not name.endswith(".tmp")
+    )
+
+
+def link_snapshot_files(snapshot_path: str) -> dict:
+    report = {"files": 0, "bytes": 0, "new_bytes": 0}
+    previous = list_snapshots()
+    previous_path = f"{snapshot_root()}/{previous[-1]}" if previous else None
+
+    def add(relative_path: str, copy: bool):
+        source = f"{DATA_PATH}/{relative_path}"
+        target = f"{snapshot_path}/{relative_path}"
+
+        try:
+            if copy:
+                shutil.copy2(source, target)
+            else:
+                os.link(source, target)
+        except FileNotFoundError:
+            return
+
+        stat = os.stat(target)
+        report["files"] += 1
+        report["bytes"] += stat.st_size
+
+        try:
+            if (
+                copy
+                or os.stat(f"{previous_path}/{relative_path}").st_ino != stat.st_ino
+            ):
+                report["new_bytes"] += stat.st_size
+        except OSError:
+            report["new_bytes"] += stat.st_size
+
+    os.makedirs(f"{snapshot_path}/guilds")
+    add("version.json", False)
+
+    if os.path.isdir(f"{DATA_PATH}/guilds"):
+        for file_name in os.listdir(f"{DATA_PATH}/guilds"):
+            _, extension = os.path.splitext(file_name)
+
+            if extension in (".json", ".log"):
+                add(f"guilds/{file_name}", extension == ".log")
+
+    return report
+
+
+def backup_sqlite(snapshot_path: str) -> int:
+    if not os.path.exists(database_path := f"{DATA_PATH}/storage.sqlite3"):
+        return 0
+
+    source = sqlite3.connect(database_path, timeout=STORAGE_LOCK_TIMEOUT)
+    target = sqlite3.connect(f"{snapshot_path}/storage.sqlite3")
+
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+    return os.path.getsize(f"{snapshot_path}/storage.sqlite3")
+
+
+def prune_snapshots(keep: int) -> list[str]:
+    if os.path.isdir(snapshot_root()):
+        for name in os.listdir(snapshot_root()):
+            if name.endswith(".tmp"):
+                shutil.rmtree(f"{snapshot_root()}/{name}", ignore_errors=True)
+
+    removed = list_snapshots()[: -keep if keep > 0 else None]
+
+    for name in removed:
+        shutil.rmtree(f"{snapshot_root()}/{name}", ignore_errors=True)
+
+    return removed
+
+
+def snapshot_name() -> str:
+    name = datetime.now().strftime("%Y%m%d-%H%M%S")
+    existing = set(list_snapshots())
+    suffix = 1
+
+    while (candidate := name if suffix == 1 else f"{name}-{suffix}") in existing:
+        suffix += 1
+
+    return candidate
+
+
+def create_snapshot_sync(name: str | None = None) -> dict:
+    name = name or snapshot_name()
+    snapshot_path = f"{snapshot_root()}/{name}"
+
+    report = link_snapshot_files(f"{snapshot_path}.tmp")
+    sqlite_bytes = backup_sqlite(f"{snapshot_path}.tmp")
+    report["bytes"] += sqlite_bytes
+    report["new_bytes"] += sqlite_bytes
+
+    os.rename(f"{snapshot_path}.tmp", snapshot_path)
+    report["name"] = name
+
+    return report
+
+
+async def create_snapshot(keep: int = STORAGE_SNAPSHOT_KEEP) -> dict:
+    name = snapshot_name()
+    snapshot_path = f"{snapshot_root()}/{name}"
+    start = time.perf_counter()
+
+    try:
+        async with storage_locks.quiesce():
+            quiesce_start = time.perf_counter()
+            report = await run_in_storage_thread(
+                link_snapshot_files, f"{snapshot_path}.tmp"
+            )
+            report["quiesced_ms"] = (time.perf_counter() - quiesce_start) * 1000
+
+        sqlite_bytes = await run_in_storage_thread(
+            backup_sqlite, f"{snapshot_path}.tmp"
+        )
+        report["bytes"] += sqlite_bytes
+        report["new_bytes"] += sqlite_bytes
+
+        os.rename(f"{snapshot_path}.tmp", snapshot_path)
+    except BaseException:
+        shutil.rmtree(f"{snapshot_path}.tmp", ignore_errors=True)
+        raise
+
+    report["name"] = name
+    report["removed"] = await run_in_storage_thread(prune_snapshots, keep)
+    report["seconds"] = time.perf_counter() - start
+
+    log.info(
+        f"Created storage snapshot [{name}] with {report['files']} files, {report['bytes'] / 1048576:.1f}MB ({report['new_bytes'] / 1048576:.1f}MB new), writers paused for {report['quiesced_ms']:.0f}ms"
+    )
+
+    return report
+
+
+def restore_file(source: str, target: str):
+    shutil.copy2(source, temp_path := f"{target}.restore.tmp")
+    os.replace(temp_path, target)
+
+
+def restore_snapshot(name: str) -> dict:
+    snapshot_path = f"{snapshot_root()}/{name}"
+
+    if name not in list_snapshots():
+        raise FileNotFoundError(f"Snapshot [{name}] does not exist")
+
+    safety = create_snapshot_sync(f"{snapshot_name()}-before-restore")
+    restored = set()
+
+    os.makedirs(f"{DATA_PATH}/guilds", exist_ok=True)
+
+    for file_name in os.listdir(f"{snapshot_path}/guilds"):
+        restore_file(
+            f"{snapshot_path}/guilds/{file_name}", f"{DATA_PATH}/guilds/{file_name}"
+        )
+        restored.add(file_name)
+
+    for file_name in os.listdir(f"{DATA_PATH}/guilds"):
+        if os.path.splitext(file_name)[1] in (".json", ".log"):
+            if file_name not in restored:
+                os.remove(f"{DATA_PATH}/guilds/{file_name}")
+
+    if os.path.exists(f"{snapshot_path}/version.json"):
+        restore_file(f"{snapshot_path}/version.json", f"{DATA_PATH}/version.json")
+
+    if os.path.exists(f"{snapshot_path}/storage.sqlite3"):
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(database_path := f"{DATA_PATH}/storage.sqlite3{suffix}"):
+                os.remove(database_path)
+
+        restore_file(f"{snapshot_path}/storage.sqlite3", f"{DATA_PATH}/storage.sqlite3")
+
+    storage_cache.clear()
+
+    if isinstance(storage_backend, JSONStorageBackend):
+        storage_backend.generations.clear()
+
+    log.info(
+        f"Restored storage snapshot [{name}] ({len(restored)} guild files), previous state saved as [{safety['name']}]"
+    )
+
+    return {"name": name, "files": len(restored), "safety_snapshot": safety["name"]}
+
+
+def subscribe(scope: str, key: str, callback):
+    storage_subscribers.setdefault((scope, key), []).append(callback)
+
+
+def unsubscribe(scope: str, key: str, callback):
+    if callback in (callbacks := storage_subscribers.get((scope, key), [])):
+        callbacks.remove(callback)
+
+
+async def notify(callback, scope: str, guild_id: int, key: str, data_dict: dict):
+    try:
+        if asyncio.iscoroutine(result := callback(guild_id, copy_json(data_dict))):
+            await result
+    except Exception:
+        log.error(f"Change subscriber failed for [{scope}/{guild_id}/{key}]")
+        log.exception(traceback.format_exc())
+
+
+def publish(scope: str, guild_id: int, key: str, data_dict: dict):
+    if not (callbacks := storage_subscribers.get((scope, key))):
+        return
+
+    loop = asyncio.get_running_loop()
+
+    for callback in list(callbacks):
+        task = loop.create_task(notify(callback, scope, guild_id, key, data_dict))
+        storage_event_tasks.add(task)
+        task.add_done_callback(storage_event_tasks.discard)
+
+
+class StorageDerivedView:
+    def __init__(self, scope: str, key: str, build):
+        self.scope = scope
+        self.key = key
+        self.build = build
+        self.values = {}
+
+        subscribe(scope, key, self.update)
+
+    async def get(self, identifier: discord.Guild | int):
+        guild_id = (
+            identifier.id if isinstance(identifier, discord.Guild) else identifier
+        )
+
+        if (entry := storage_cache.get_fresh_entry(guild_id)) is not None:
+            document = entry.data
+        else:
+            document, entry = await run_in_storage_thread(fetch_entry, guild_id)
+
+        # Values follow the cache token, so writes from other processes are picked
+        # up on revalidation even when nothing is published
+        if entry is not None and (cached := self.values.get(guild_id)) is not None:
+            if cached[0] == entry.token:
+                return cached[1]
+
+        value = self.build(copy_json(document.get(self.scope, {}).get(self.key, {})))
+
+        if entry is not None:
+            self.values[guild_id] = entry.token, value
+        else:
+            self.values.pop(guild_id, None)
+
+        return value
+
+    def update(self, guild_id: int, data_dict: dict):
+        self.values.pop(guild_id, None)
+
+    def close(self):
+        unsubscribe(self.scope, self.key, self.update)
+        self.values.clear()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Manage storage snapshots. Run from the repository root. Stop the bot before restoring."
+    )
+    parser.add_argument(
+        "action",
+        choices=["list", "create", "restore"],
+        help="List snapshots, create one, or restore one.",
+    )
+    parser.add_argument("name", nargs="?", default=None, help="Snapshot to restore.")
+    parser.add_argument(
+        "--keep",
+        dest="keep",
+        type=int,
+        default=STORAGE_SNAPSHOT_KEEP,
+        required=False,
+        help="How many snapshots to keep after creating one.",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.action == "list":
+        print("\n".join(list_snapshots()))
+    elif args.action == "create":
+        report = create_snapshot_sync()
+        report["removed"] = prune_snapshots(args.keep)
+        print(json.dumps(report, indent=4))
+    elif not args.name:
+        parser.error("restore requires a snapshot name")
+    else:
+        print(json.dumps(restore_snapshot(args.name), indent=4))
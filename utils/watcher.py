@@ -0,0 +1,281 @@
+import asyncio
+import ctypes
+import logging
+import os
+import struct
+import traceback
+
+from utils import storage
+
+
+log = logging.getLogger(__name__)
+
+
+STORAGE_WATCH = storage.SETTINGS.get("storageWatch", "off")
+STORAGE_WATCH_POLL_SECONDS = storage.SETTINGS.get("storageWatchPollSeconds", 2)
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_EVENT = struct.Struct("iIII")
+
+try:
+    libc = ctypes.CDLL(None, use_errno=True)
+    inotify_init1 = libc.inotify_init1
+    inotify_add_watch = libc.inotify_add_watch
+    inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+except Exception:
+    inotify_init1 = None
+    inotify_add_watch = None
+
+
+def guild_file_id(file_name: str):
+    guild_id, extension = os.path.splitext(file_name)
+
+    if extension in (".json", ".log") and guild_id.isdigit():
+        return int(guild_id)
+
+    return None
+
+
+def scan_json_tokens(directory: str) -> dict:
+    tokens = {}
+
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return tokens
+
+    for entry in entries:
+        if (guild_id := guild_file_id(entry.name)) is None:
+            continue
+
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+
+        snapshot_token, log_token = tokens.get(guild_id, (None, None))
+
+        if entry.name.endswith(".json"):
+            snapshot_token = stat.st_mtime_ns, stat.st_size
+        else:
+            log_token = stat.st_mtime_ns, stat.st_size
+
+        tokens[guild_id] = snapshot_token, log_token
+
+    return tokens
+
+
+def scan_sqlite_tokens(backend) -> dict:
+    return dict(backend.connection().execute("SELECT guild_id, version FROM guilds"))
+
+
+def scan_tokens(backend) -> dict:
+    if isinstance(backend, storage.SQLiteStorageBackend):
+        return scan_sqlite_tokens(backend)
+
+    return scan_json_tokens(f"{storage.DATA_PATH}/guilds")
+
+
+class StorageWatcher:
+    def __init__(self, mode: str, poll_seconds: float):
+        self.mode = mode
+        self.poll_seconds = poll_seconds
+        self.backend = None
+        self.fd = None
+        self.task = None
+        self.pending: set[int] = set()
+        self.wakeup = asyncio.Event()
+        self.revalidate_seconds = storage.storage_cache.revalidate_seconds
+
+        self.events = 0
+        self.invalidations = 0
+        self.overflows = 0
+
+    def start(self):
+        self.backend = storage.storage_backend
+
+        if self.mode in ("auto", "inotify") and isinstance(
+            self.backend, storage.JSONStorageBackend
+        ):
+            try:
+                self.fd = self.open_inotify(f"{storage.DATA_PATH}/guilds")
+            except Exception:
+                log.warning(
+                    f"inotify is unavailable, polling every {self.poll_seconds}s"
+                )
+                log.debug(traceback.format_exc())
+
+        if self.fd is not None:
+            asyncio.get_running_loop().add_reader(self.fd, self.read_events)
+            self.task = asyncio.create_task(self.process())
+            log.info(f"Watching [{storage.DATA_PATH}/guilds] with inotify")
+        else:
+            self.task = asyncio.create_task(self.poll())
+            log.info(f"Polling {self.backend.name} storage every {self.poll_seconds}s")
+
+        storage.storage_cache.revalidate_seconds = float("inf")
+
+    def stop(self):
+        storage.storage_cache.revalidate_seconds = self.revalidate_seconds
+
+        if self.fd is not None:
+            asyncio.get_running_loop().remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def open_inotify(self, directory: str) -> int:
+        if inotify_init1 is None:
+            raise OSError("inotify is not supported on this platform")
+
+        os.makedirs(directory, exist_ok=True)
+
+        if (fd := inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)) < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE
+
+        if inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, f"inotify_add_watch failed for [{directory}]")
+
+        return fd
+
+    def read_events(self):
+        try:
+            buffer = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+
+        offset = 0
+
+        while offset < len(buffer):
+            _, mask, _, length = IN_EVENT.unpack_from(buffer, offset)
+            offset += IN_EVENT.size
+            name = buffer[offset : offset + length].rstrip(b"\0").decode()
+            offset += length
+
+            self.events += 1
+
+            if mask & IN_Q_OVERFLOW:
+                self.overflows += 1
+                log.warning("inotify queue overflowed, rechecking cached guilds")
+
+                with storage.storage_cache.lock:
+                    self.pending.update(storage.storage_cache.entries)
+            elif (guild_id := guild_file_id(name)) is not None:
+                self.pending.add(guild_id)
+
+        if self.pending:
+            self.wakeup.set()
+
+    async def process(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+
+            guild_ids, self.pending = self.pending, set()
+
+            for guild_id in guild_ids:
+                if self.editing(guild_id):
+                    self.pending.add(guild_id)
+                    continue
+
+                try:
+                    token = await storage.run_in_storage_thread(
+                        self.backend.token, guild_id
+                    )
+                    await self.changed(guild_id, token)
+                except Exception:
+                    log.exception(traceback.format_exc())
+
+            if self.pending:
+                await asyncio.sleep(0.05)
+                self.wakeup.set()
+
+    async def poll(self):
+        tokens = await storage.run_in_storage_thread(scan_tokens, self.backend)
+
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+
+            try:
+                scanned = await storage.run_in_storage_thread(scan_tokens, self.backend)
+            except Exception:
+                log.exception(traceback.format_exc())
+                continue
+
+            for guild_id in scanned.keys() | tokens.keys():
+                if scanned.get(guild_id) == tokens.get(guild_id):
+                    continue
+
+                if self.editing(guild_id):
+                    scanned[guild_id] = tokens.get(guild_id)
+                else:
+                    try:
+                        await self.changed(guild_id, scanned.get(guild_id))
+                    except Exception:
+                        log.exception(traceback.format_exc())
+
+            tokens = scanned
+
+    def editing(self, guild_id: int) -> bool:
+        return self.backend.lock_path(guild_id) in storage.storage_locks.locks
+
+    async def changed(self, guild_id: int, token):
+        with storage.storage_cache.lock:
+            entry = storage.storage_cache.entries.get(guild_id)
+
+        if entry is not None and entry.token == token:
+            return
+
+        storage.storage_cache.invalidate(guild_id)
+        self.invalidations += 1
+        log.debug(f"External change to [{guild_id}], invalidated")
+
+        if not any(storage.storage_subscribers.values()):
+            return
+
+        document = await storage.run_in_storage_thread(
+            storage.load_document, guild_id, False, True
+        )
+        old_document = entry.data if entry is not None else None
+
+        for scope, key in list(storage.storage_subscribers):
+            data_dict = document.get(scope, {}).get(key, {})
+
+            if old_document is not None:
+                if old_document.get(scope, {}).get(key, {}) == data_dict:
+                    continue
+
+            storage.publish(scope, guild_id, key, data_dict)
+
+
+storage_watcher = None
+
+
+def start_watcher():
+    global storage_watcher
+
+    if STORAGE_WATCH not in ("auto", "inotify", "poll"):
+        return None
+
+    storage_watcher = StorageWatcher(STORAGE_WATCH, STORAGE_WATCH_POLL_SECONDS)
+    storage_watcher.start()
+
+    return storage_watcher
+
+
+def stop_watcher():
+    global storage_watcher
+
+    if storage_watcher is not None:
+        storage_watcher.stop()
+        storage_watcher = None